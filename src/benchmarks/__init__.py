@@ -0,0 +1 @@
+# # src/benchmarks/__init__.py
@@ -0,0 +1,97 @@
+# columnar_extraction.py
+"""
+Compares the pandas extraction path (`MongoExtractor.iter_collection_chunks`) with the
+Arrow path (`ArrowExtractor.iter_collection_batches`) on the configured MongoDB.
+
+Both paths stream the whole collection and drop every chunk after counting it, so
+the figures are decode throughput and per-chunk working memory. Peak memory is the
+tracemalloc peak (Python objects and NumPy buffers) plus the highest Arrow memory
+pool allocation seen between batches.
+
+Usage (from `src/`):
+    python -m benchmarks.columnar_extraction --collections customers loan_repayments
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+import pyarrow as pa
+
+from connections.resource_manager import ResourceManager
+from extraction.arrow_extractor import ArrowExtractor
+from extraction.mongo_extractor import MongoExtractor
+from config import extraction_batch_size
+
+
+def measure(chunks) -> dict:
+    """Consumes `chunks` (DataFrames or RecordBatches) and returns docs/sec and peak memory."""
+    arrow_baseline = pa.total_allocated_bytes()
+    arrow_peak = 0
+    documents = 0
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    for chunk in chunks:
+        documents += len(chunk)
+        arrow_peak = max(arrow_peak, pa.total_allocated_bytes() - arrow_baseline)
+        del chunk
+    elapsed = time.perf_counter() - started
+    _, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "documents": documents,
+        "seconds": elapsed,
+        "docs_per_second": documents / elapsed if elapsed > 0 else 0.0,
+        "peak_memory_bytes": python_peak + arrow_peak,
+    }
+
+
+def run(collections_list, batch_size) -> dict:
+    resources = ResourceManager()
+    pandas_extractor = MongoExtractor(resources)
+    arrow_extractor = ArrowExtractor(resources)
+
+    results = {}
+    for collection_name in collections_list:
+        results[collection_name] = {
+            "pandas": measure(
+                pandas_extractor.iter_collection_chunks(collection_name, batch_size)
+            ),
+            "arrow": measure(
+                arrow_extractor.iter_collection_batches(collection_name, batch_size)
+            ),
+        }
+    resources.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--collections", nargs="+", default=["customers", "loan_repayments"]
+    )
+    parser.add_argument("--batch-size", type=int, default=extraction_batch_size)
+    parser.add_argument("--output", help="Optional path of a JSON results file.")
+    args = parser.parse_args()
+
+    results = run(args.collections, args.batch_size)
+
+    print(f"{'collection':<20}{'path':<8}{'docs':>10}{'docs/sec':>14}{'peak MiB':>12}")
+    for collection_name, paths in results.items():
+        for path, result in paths.items():
+            print(
+                f"{collection_name:<20}{path:<8}{result['documents']:>10}"
+                f"{result['docs_per_second']:>14.0f}"
+                f"{result['peak_memory_bytes'] / 2**20:>12.1f}"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# harness.py
+"""
+Shared measurement helpers of the benchmark suite: per-stage timing with latency
+percentiles, resident memory, JSON results and baseline comparison.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from pipeline.metrics import current_rss_bytes
+
+
+def summarize(rows: int, samples: list, peak_rss: int) -> dict:
+    """
+    Builds the result of one stage from its per-call latencies (seconds).
+
+    Returns:
+        dict: calls, rows, seconds, rows_per_second, p50/p95/p99 latency in
+              milliseconds and peak_rss_bytes.
+    """
+    seconds = float(sum(samples))
+    latencies = np.array(samples or [0.0]) * 1000
+    return {
+        "calls": len(samples),
+        "rows": rows,
+        "seconds": round(seconds, 6),
+        "rows_per_second": round(rows / seconds, 1) if seconds > 0 else 0.0,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+class StageRecorder:
+    def __init__(self):
+        """
+        Collects per-call latencies, row counts and resident memory per stage.
+        Thread-safe, so pipeline stages running on worker threads can report to it.
+        While `phase` is set, stage names are prefixed with it (e.g. "full.load").
+        """
+        self._lock = threading.Lock()
+        self._stages = {}
+        self.phase = None
+
+    def record(self, stage: str, rows: int, seconds: float, rss: int = None):
+        rss = current_rss_bytes() if rss is None else rss
+        if self.phase:
+            stage = f"{self.phase}.{stage}"
+        with self._lock:
+            entry = self._stages.setdefault(
+                stage, {"rows": 0, "samples": [], "peak_rss": 0}
+            )
+            entry["rows"] += rows
+            entry["samples"].append(seconds)
+            entry["peak_rss"] = max(entry["peak_rss"], rss)
+
+    @contextmanager
+    def measure(self, stage: str, rows: int = 0):
+        """Times the block as one call of `stage` processing `rows` rows."""
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - started
+        self.record(stage, rows, elapsed, max(rss_before, current_rss_bytes()))
+
+    def wrap(self, obj, method_name: str, stage: str, count_rows=None):
+        """
+        Replaces a method on one instance with a timed version. `count_rows(result,
+        args, kwargs)` returns the rows a call processed; by default the length of
+        the first positional argument, if it has one.
+        """
+        method = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+            result = method(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+            if count_rows is not None:
+                rows = count_rows(result, args, kwargs)
+            else:
+                rows = len(args[0]) if args and hasattr(args[0], "__len__") else 0
+            self.record(stage, rows, elapsed, max(rss_before, current_rss_bytes()))
+            return result
+
+        setattr(obj, method_name, timed)
+
+    def wrap_iterator(self, obj, method_name: str, stage: str, count_rows=len):
+        """
+        Replaces a generator method on one instance so every item it yields is timed
+        as one call of `stage`, from the request of the item to its arrival.
+        """
+        method = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            iterator = iter(method(*args, **kwargs))
+            while True:
+                rss_before = current_rss_bytes()
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                elapsed = time.perf_counter() - started
+                self.record(
+                    stage,
+                    count_rows(item),
+                    elapsed,
+                    max(rss_before, current_rss_bytes()),
+                )
+                yield item
+
+        setattr(obj, method_name, timed)
+
+    def results(self) -> dict:
+        with self._lock:
+            return {
+                stage: summarize(entry["rows"], entry["samples"], entry["peak_rss"])
+                for stage, entry in self._stages.items()
+            }
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares the stages of `results` with the same stages of `baseline`. A stage
+    regresses when its throughput drops or its p95 latency grows by more than
+    `tolerance` (a fraction, e.g. 0.1 for 10%).
+
+    Returns:
+        list: One message per regression.
+    """
+    regressions = []
+    for stage, result in results.items():
+        previous = baseline.get(stage)
+        if not previous:
+            continue
+        if previous["rows_per_second"] > 0 and result["rows_per_second"] < previous[
+            "rows_per_second"
+        ] * (1 - tolerance):
+            regressions.append(
+                f"{stage}: {result['rows_per_second']:.0f} rows/s, baseline "
+                f"{previous['rows_per_second']:.0f} rows/s"
+            )
+        if previous["p95_ms"] > 0 and result["p95_ms"] > previous["p95_ms"] * (
+            1 + tolerance
+        ):
+            regressions.append(
+                f"{stage}: p95 {result['p95_ms']:.3f} ms, baseline "
+                f"{previous['p95_ms']:.3f} ms"
+            )
+    return regressions
+
+
+def print_results(results: dict):
+    print(
+        f"{'stage':<28}{'rows':>10}{'rows/sec':>14}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'peak RSS MiB':>14}"
+    )
+    for stage, result in results.items():
+        print(
+            f"{stage:<28}{result['rows']:>10}{result['rows_per_second']:>14.0f}"
+            f"{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}"
+            f"{result['peak_rss_bytes'] / 2**20:>14.1f}"
+        )
+
+
+def add_report_arguments(parser):
+    """Adds the --output, --baseline and --tolerance options shared by the suites."""
+    parser.add_argument("--output", help="Optional path of a JSON results file.")
+    parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to compare against."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Allowed slowdown against the baseline, as a fraction (default 0.1).",
+    )
+
+
+def report(results: dict, args, metadata: dict = None) -> int:
+    """
+    Prints the results, writes them to `args.output` and compares them with
+    `args.baseline`.
+
+    Returns:
+        int: The process exit code, 1 if any stage regressed.
+    """
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": metadata or {}, "stages": results}, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(
+            results, baseline.get("stages", baseline), args.tolerance
+        )
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline}.")
+    return 0
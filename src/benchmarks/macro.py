@@ -0,0 +1,315 @@
+# macro.py
+"""
+Macro-benchmark of the whole pipeline: a full load followed by an incremental load,
+run against local MongoDB/PostgreSQL stand-ins at a configurable scale factor.
+
+The MongoDB database `--mongo-db` is recreated from the sample files in `data/`,
+replicated `--scale` times with the entity ids of every replica shifted so they stay
+unique and consistent across collections (dimension collections are seeded once).
+The PostgreSQL target tables have to exist; `--reset-target` truncates them and
+clears the pipeline state first. After the full load, `--change-ratio` of every
+collection is modified and as many new customers are inserted, and the incremental
+load applies them.
+
+Stages are measured by timing the component methods each phase calls: stamping,
+extraction (per chunk), transformation, loading, upserts and normalization, plus
+each phase as a whole.
+
+Usage (from `src/`):
+    python -m benchmarks.macro --scale 4 --reset-target --output macro.json
+    python -m benchmarks.macro --scale 4 --reset-target --baseline macro.json
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timezone
+
+from bson import json_util
+from psycopg2 import sql
+
+from benchmarks.harness import StageRecorder, add_report_arguments, report
+from connections.resource_manager import ResourceManager
+from extraction.mongo_extractor import MongoExtractor
+from loading.postgres_loader import PostgresLoader
+from transformation.transformer import Transformer
+from pipeline.incremental import IncrementalLoader
+from main import run_full_load
+from config import (
+    unique_id_mapping,
+    collections,
+    max_parallel_collections,
+    watermark_table,
+    checkpoint_table,
+    full_load_strategies,
+    default_full_load_strategy,
+    nested_document_tables,
+)
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+
+# Collections seeded once, whatever the scale: their ids are referenced, not replicated
+DIMENSION_COLLECTIONS = ["loan_types", "new_loan_terms", "restructure_terms"]
+
+# Entity ids are shifted into their own range per replica
+ID_RANGE = 10**15
+ENTITY_ID_FIELDS = {
+    mapping["unique_id_key_col"]
+    for collection_name, mapping in unique_id_mapping.items()
+    if collection_name not in DIMENSION_COLLECTIONS
+}
+
+INSERT_BATCH_SIZE = 10000
+
+
+def load_sample(collection_name: str) -> list:
+    path = os.path.join(DATA_DIRECTORY, f"{collection_name}.json")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json_util.loads(f.read())
+
+
+def replicate(document: dict, replica: int) -> dict:
+    """Copies a sample document into replica `replica`, shifting its entity ids."""
+    copy = {key: value for key, value in document.items() if key != "_id"}
+    for field in ENTITY_ID_FIELDS.intersection(copy):
+        if isinstance(copy[field], int):
+            copy[field] = copy[field] % ID_RANGE + replica * ID_RANGE
+    return copy
+
+
+def insert_in_batches(collection, documents):
+    for start in range(0, len(documents), INSERT_BATCH_SIZE):
+        collection.insert_many(
+            documents[start : start + INSERT_BATCH_SIZE], ordered=False
+        )
+
+
+def seed_source(db, scale: int) -> dict:
+    """Recreates the benchmark collections at `scale`; returns documents per collection."""
+    seeded = {}
+    for collection_name in collections:
+        db.drop_collection(collection_name)
+        sample = load_sample(collection_name)
+        replicas = 1 if collection_name in DIMENSION_COLLECTIONS else scale
+        documents = [
+            replicate(document, replica)
+            for replica in range(replicas)
+            for document in sample
+        ]
+        if documents:
+            insert_in_batches(db[collection_name], documents)
+        seeded[collection_name] = len(documents)
+        print(f"Seeded {collection_name} with {len(documents)} documents.")
+    return seeded
+
+
+def flattened_tables() -> list:
+    """Returns the child and parent tables of `nested_document_tables`."""
+    tables = []
+    for spec in nested_document_tables.values():
+        tables += [
+            field["table_name"]
+            for field in spec["fields"].values()
+            if field["kind"] == "child"
+        ]
+        if spec.get("parent_table"):
+            tables.append(spec["parent_table"])
+    return tables
+
+
+def reset_target(resources):
+    """Empties the target tables and forgets the watermarks and checkpoints."""
+    tables = [mapping["table_name"] for mapping in unique_id_mapping.values()]
+    with resources.pg_connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql.SQL("TRUNCATE {} CASCADE").format(
+                    sql.SQL(", ").join(map(sql.Identifier, tables))
+                )
+            )
+            # Child and parent tables of flattened nested documents, if created yet
+            for table_name in (
+                *flattened_tables(),
+                watermark_table,
+                checkpoint_table,
+            ):
+                cursor.execute("SELECT to_regclass(%s)", (table_name,))
+                if cursor.fetchone()[0] is not None:
+                    cursor.execute(
+                        sql.SQL("DELETE FROM {}").format(sql.Identifier(table_name))
+                    )
+            connection.commit()
+
+
+def simulate_changes(db, scale: int, change_ratio: float) -> int:
+    """
+    Touches `change_ratio` of every collection and inserts as many new customers
+    (the root of the foreign keys) in a replica of their own.
+
+    Returns:
+        int: The number of documents changed or inserted.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    changed = 0
+    for collection_name in collections:
+        collection = db[collection_name]
+        count = int(collection.estimated_document_count() * change_ratio)
+        if not count:
+            continue
+        ids = [
+            document["_id"]
+            for document in collection.aggregate(
+                [{"$sample": {"size": count}}, {"$project": {"_id": 1}}]
+            )
+        ]
+        changed += collection.update_many(
+            {"_id": {"$in": ids}}, {"$set": {"modified_at": now}}
+        ).modified_count
+
+    sample = load_sample("customers")
+    new_customers = [
+        dict(replicate(document, scale), added_at=now, modified_at=now)
+        for document in sample[: int(len(sample) * scale * change_ratio)]
+    ]
+    if new_customers:
+        insert_in_batches(db["customers"], new_customers)
+    return changed + len(new_customers)
+
+
+def instrument(recorder, mongo_extractor, postgres_loader, transformer):
+    """Times the component methods the full and incremental loads go through."""
+    recorder.wrap(
+        transformer,
+        "add_ist_timestamp_fields_mongodb_aggregation",
+        "stamp",
+        lambda result, args, kwargs: sum(result.values()),
+    )
+    recorder.wrap_iterator(
+        mongo_extractor,
+        "iter_collection_chunks_with_positions",
+        "extract",
+        lambda item: len(item[1]),
+    )
+    recorder.wrap_iterator(mongo_extractor, "iter_changed_chunks", "extract")
+    recorder.wrap(transformer, "add_ist_timestamp_fields_to_dataframe", "transform")
+    recorder.wrap(transformer, "normalize_date_columns", "transform")
+    recorder.wrap(
+        postgres_loader,
+        "render_copy_chunk",
+        "transform",
+        lambda result, args, kwargs: len(result),
+    )
+    for method_name in ("_copy_dataframe", "_copy_rendered_chunk"):
+        recorder.wrap(
+            postgres_loader,
+            method_name,
+            "load",
+            lambda result, args, kwargs: result.rows_written,
+        )
+    recorder.wrap(
+        postgres_loader,
+        "insert_dataframe_with_executemany",
+        "load",
+        lambda result, args, kwargs: len(args[2]),
+    )
+    recorder.wrap(
+        postgres_loader,
+        "upsert_dataframe_to_postgres",
+        "upsert",
+        lambda result, args, kwargs: result["inserted"] + result["updated"],
+    )
+    recorder.wrap(
+        transformer,
+        "normalize_loan_restructuring",
+        "normalize",
+        lambda result, args, kwargs: 0,
+    )
+
+
+def run(args) -> dict:
+    resources = ResourceManager()
+    resources.mongo_db_database_name = args.mongo_db
+    mongo_extractor = MongoExtractor(resources)
+    postgres_loader = PostgresLoader(resources)
+    transformer = Transformer(resources)
+
+    seeded = seed_source(resources.mongo_db, args.scale)
+    if args.reset_target:
+        reset_target(resources)
+
+    recorder = StageRecorder()
+    instrument(recorder, mongo_extractor, postgres_loader, transformer)
+
+    recorder.phase = "full"
+    with recorder.measure("total", sum(seeded.values())):
+        run_full_load(
+            mongo_extractor,
+            postgres_loader,
+            transformer,
+            args.workers,
+            stamp_in_stream=args.stamp_in_stream,
+            strategy=args.strategy,
+            partitions=args.partitions,
+            pipelined=args.pipelined,
+        )
+
+    recorder.phase = None
+    changed = simulate_changes(resources.mongo_db, args.scale, args.change_ratio)
+
+    recorder.phase = "incremental"
+    with recorder.measure("total", changed):
+        IncrementalLoader(mongo_extractor, postgres_loader, transformer).run()
+
+    resources.close()
+    return recorder.results()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument(
+        "--mongo-db",
+        default="microfinance_benchmark",
+        help="MongoDB database recreated as the source stand-in.",
+    )
+    parser.add_argument(
+        "--reset-target",
+        action="store_true",
+        help="Truncate the PostgreSQL target tables and pipeline state first.",
+    )
+    parser.add_argument("--change-ratio", type=float, default=0.01)
+    parser.add_argument("--workers", type=int, default=max_parallel_collections)
+    parser.add_argument(
+        "--strategy", choices=full_load_strategies, default=default_full_load_strategy
+    )
+    parser.add_argument("--stamp-in-stream", action="store_true")
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        help="Key ranges per large collection (see `scan_partitions`).",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Overlap extraction, transformation and loading (see `ChunkPipeline`).",
+    )
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args)
+    metadata = {
+        "suite": "macro",
+        "scale": args.scale,
+        "change_ratio": args.change_ratio,
+        "workers": args.workers,
+        "strategy": args.strategy,
+        "partitions": args.partitions,
+        "pipelined": args.pipelined,
+    }
+    sys.exit(report(results, args, metadata))
+
+
+if __name__ == "__main__":
+    main()
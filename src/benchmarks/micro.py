@@ -0,0 +1,256 @@
+# micro.py
+"""
+Micro-benchmarks of the individual pipeline steps on synthetic chunks built from
+`collection_schemas`: `convert_to_ist`, DataFrame construction, the vectorized date
+normalization, `replace_nat_with_none` and rendering of the COPY payload. With
+--postgres, the COPY and executemany insert paths and `normalize_loan_restructuring`
+are measured against the configured PostgreSQL too, each rolled back after every
+run so the tables are left as they were.
+With --transform-processes, `--repeat` COPY payloads are also rendered at once by a
+`ProcessTransformPool` of each given size, to show how rendering scales with cores.
+
+Every benchmark processes `--rows` rows per run, `--repeat` times; latency
+percentiles are over runs.
+
+Usage (from `src/`):
+    python -m benchmarks.micro --rows 50000 --repeat 10 --output micro.json
+    python -m benchmarks.micro --baseline micro.json
+    python -m benchmarks.micro --collection loan_restructuring --transform-processes 1 2 4
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.harness import StageRecorder, add_report_arguments, report
+from connections.resource_manager import ResourceManager
+from extraction.mongo_extractor import MongoExtractor
+from loading.postgres_loader import DataFrameCopyStream, PostgresLoader
+from pipeline.transform_pool import ProcessTransformPool
+from transformation.transformer import Transformer
+from config import collection_schemas, unique_id_mapping, collections_with_date_keys
+
+# Share of missing values in generated date columns, to exercise the NaT handling
+MISSING_DATE_RATIO = 0.1
+
+
+def generate_documents(collection_name: str, rows: int, seed: int = 0) -> list:
+    """Builds `rows` documents shaped like pymongo returns them for a collection."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for field, field_type in collection_schemas[collection_name].items():
+        if field_type in ("int32", "int64"):
+            high = 2**31 - 1 if field_type == "int32" else 10**15
+            columns[field] = rng.integers(1, high, rows).tolist()
+        elif field_type == "float64":
+            columns[field] = np.round(rng.random(rows) * 100000, 2).tolist()
+        elif field_type == "bool":
+            columns[field] = (rng.random(rows) < 0.5).tolist()
+        elif field_type in ("string", "category"):
+            columns[field] = [f"{field}_{value}" for value in rng.integers(0, 50, rows)]
+        elif field_type == "datetime":
+            seconds = rng.integers(0, 10 * 365 * 86400, rows).astype("timedelta64[s]")
+            values = (np.datetime64("2015-01-01T00:00:00") + seconds).astype(
+                "datetime64[us]"
+            )
+            missing = rng.random(rows) < MISSING_DATE_RATIO
+            columns[field] = [
+                None if is_missing else value
+                for value, is_missing in zip(values.tolist(), missing)
+            ]
+        else:
+            columns[field] = [
+                {"interest_rate": int(rate), "repayment_period_in_months": 12}
+                for rate in rng.integers(1, 20, rows)
+            ]
+    fields = list(columns)
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+
+def run_benchmark(recorder, stage, rows, repeat, setup, function):
+    """Runs `function(setup())` `repeat` times, timing only `function`."""
+    for _ in range(repeat):
+        argument = setup()
+        with recorder.measure(stage, rows):
+            function(argument)
+
+
+def read_copy_stream(stream):
+    while stream.read(1 << 20):
+        pass
+
+
+def run(collection_name, rows, repeat, with_postgres, pool_sizes=()) -> dict:
+    resources = ResourceManager()
+    if resources.mongo_db_database_name is None:
+        # No MongoDB is used, but the components expect a database name
+        resources.mongo_db_database_name = "benchmark"
+    mongo_extractor = MongoExtractor(resources)
+    transformer = Transformer(resources)
+    postgres_loader = PostgresLoader(resources)
+
+    mapping = unique_id_mapping[collection_name]
+    json_columns = mapping["nested_documents"]
+    documents = generate_documents(collection_name, rows)
+    df = pd.DataFrame(documents)
+    normalized = transformer.normalize_date_columns(df.copy(), collection_name)
+    date_columns = collections_with_date_keys.get(collection_name, [])
+    iso_strings = (
+        [
+            None
+            if document[date_columns[0]] is None
+            else document[date_columns[0]].isoformat()
+            for document in documents
+        ]
+        if date_columns
+        else [datetime(2024, 10, 27).isoformat()] * rows
+    )
+
+    recorder = StageRecorder()
+    run_benchmark(
+        recorder,
+        "convert_to_ist",
+        rows,
+        repeat,
+        lambda: iso_strings,
+        lambda values: [mongo_extractor.convert_to_ist(value) for value in values],
+    )
+    run_benchmark(
+        recorder,
+        "dataframe_construction",
+        rows,
+        repeat,
+        lambda: documents,
+        pd.DataFrame,
+    )
+    run_benchmark(
+        recorder,
+        "normalize_date_columns",
+        rows,
+        repeat,
+        df.copy,
+        lambda chunk: transformer.normalize_date_columns(chunk, collection_name),
+    )
+    run_benchmark(
+        recorder,
+        "replace_nat_with_none",
+        rows,
+        repeat,
+        normalized.copy,
+        lambda chunk: transformer.replace_nat_with_none(
+            {collection_name: chunk}, {collection_name: date_columns}
+        ),
+    )
+    run_benchmark(
+        recorder,
+        "copy_render",
+        rows,
+        repeat,
+        lambda: DataFrameCopyStream(normalized, json_columns),
+        read_copy_stream,
+    )
+    for processes in pool_sizes:
+        with ProcessTransformPool(processes, [collection_name]) as pool:
+            # Start the workers outside the measurement
+            pool.submit_render(normalized, json_columns).result()
+            with recorder.measure(f"copy_render_{processes}_processes", rows * repeat):
+                renderings = [
+                    pool.submit_render(normalized, json_columns) for _ in range(repeat)
+                ]
+                for rendering in renderings:
+                    rendering.result()
+
+    if with_postgres:
+        table_name = mapping["table_name"]
+
+        def load_and_roll_back(method):
+            def load(chunk):
+                with resources.pg_connection() as connection:
+                    with connection.cursor() as cursor:
+                        if method == "copy":
+                            postgres_loader.copy_dataframe(
+                                cursor, chunk, table_name, json_columns
+                            )
+                        else:
+                            postgres_loader.insert_dataframe_with_executemany(
+                                connection,
+                                cursor,
+                                chunk,
+                                table_name,
+                                json_columns,
+                                commit_per_batch=False,
+                            )
+                        connection.rollback()
+
+            return load
+
+        run_benchmark(
+            recorder,
+            "copy_load",
+            rows,
+            repeat,
+            normalized.copy,
+            load_and_roll_back("copy"),
+        )
+        run_benchmark(
+            recorder,
+            "executemany_load",
+            rows,
+            repeat,
+            normalized.copy,
+            load_and_roll_back("executemany"),
+        )
+        run_benchmark(
+            recorder,
+            "normalize_loan_restructuring",
+            0,
+            repeat,
+            lambda: None,
+            lambda _: transformer.normalize_loan_restructuring(commit=False),
+        )
+
+    resources.close()
+    return recorder.results()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--collection", default="loan_applications")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--postgres",
+        action="store_true",
+        help="Also benchmark the insert paths and normalization on PostgreSQL.",
+    )
+    parser.add_argument(
+        "--transform-processes",
+        type=int,
+        nargs="+",
+        default=[],
+        help="Also render the COPY payloads in process pools of these sizes.",
+    )
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(
+        args.collection,
+        args.rows,
+        args.repeat,
+        args.postgres,
+        args.transform_processes,
+    )
+    metadata = {
+        "suite": "micro",
+        "collection": args.collection,
+        "rows": args.rows,
+        "repeat": args.repeat,
+    }
+    sys.exit(report(results, args, metadata))
+
+
+if __name__ == "__main__":
+    main()
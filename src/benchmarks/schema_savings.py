@@ -0,0 +1,142 @@
+# schema_savings.py
+"""
+Reports the memory and time saved per collection by building chunks from the schema
+registry (`collection_schemas`) instead of letting pandas infer every field.
+
+For each collection the same documents are built into a DataFrame twice: inferred
+from every field, as `pd.DataFrame(documents)` did before, and typed from the schema
+with `build_typed_dataframe`. The report compares their deep in-memory size, their
+construction time and the time `Transformer.normalize_date_columns` takes on them.
+
+Documents are read from the configured MongoDB, or from the seed files of
+`--data-dir` without a database, with dates converted as `seeding.mongo_seeder`
+stores them and returned naive in UTC, as pymongo returns them.
+
+Usage (from `src/`):
+    python -m benchmarks.schema_savings --collections customers loan_history
+    python -m benchmarks.schema_savings --data-dir ../data --output savings.json
+"""
+
+import argparse
+import itertools
+import json
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from connections.resource_manager import ResourceManager
+from extraction.schema import build_typed_dataframe, has_schema
+from seeding.mongo_seeder import MongoSeeder, find_seed_files
+from transformation.transformer import Transformer
+from config import collections, collections_with_date_keys
+
+
+def load_documents(resources, collection_name, data_dir=None, limit=None) -> list:
+    """Returns up to `limit` documents of a collection from MongoDB or `data_dir`."""
+    if data_dir is None:
+        cursor = resources.mongo_db[collection_name].find()
+        return list(cursor.limit(limit) if limit else cursor)
+
+    seeder = MongoSeeder(resources)
+    date_keys = collections_with_date_keys.get(collection_name, [])
+    documents = (
+        naive_utc_dates(seeder.convert_dates(document, date_keys), date_keys)
+        for _, path in find_seed_files(data_dir, [collection_name])
+        for document in seeder.iter_documents(path)
+    )
+    return list(itertools.islice(documents, limit))
+
+
+def naive_utc_dates(document: dict, date_keys: list) -> dict:
+    for key in date_keys:
+        value = document.get(key)
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            document[key] = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return document
+
+
+def measure(build, documents, transformer, collection_name) -> dict:
+    """Builds a DataFrame with `build` and times it and its date normalization."""
+    started = time.perf_counter()
+    df = build(documents)
+    build_seconds = time.perf_counter() - started
+    memory_bytes = int(df.memory_usage(index=True, deep=True).sum())
+
+    started = time.perf_counter()
+    transformer.normalize_date_columns(df, collection_name)
+    return {
+        "columns": len(df.columns),
+        "memory_bytes": memory_bytes,
+        "build_seconds": round(build_seconds, 6),
+        "transform_seconds": round(time.perf_counter() - started, 6),
+    }
+
+
+def run(collections_list, data_dir=None, limit=None) -> dict:
+    resources = ResourceManager()
+    transformer = Transformer(resources)
+
+    results = {}
+    for collection_name in collections_list:
+        if not has_schema(collection_name):
+            print(f"Skipping {collection_name}: no entry in collection_schemas.")
+            continue
+        documents = load_documents(resources, collection_name, data_dir, limit)
+        if not documents:
+            print(f"Skipping {collection_name}: no documents found.")
+            continue
+
+        inferred = measure(pd.DataFrame, documents, transformer, collection_name)
+        typed = measure(
+            lambda documents: build_typed_dataframe(documents, collection_name),
+            documents,
+            transformer,
+            collection_name,
+        )
+        saved = inferred["memory_bytes"] - typed["memory_bytes"]
+        results[collection_name] = {
+            "documents": len(documents),
+            "inferred": inferred,
+            "typed": typed,
+            "bytes_saved": saved,
+            "percent_saved": round(100 * saved / inferred["memory_bytes"], 1),
+        }
+    resources.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--collections", nargs="+", default=collections)
+    parser.add_argument(
+        "--data-dir", help="Read the seed files of this directory instead of MongoDB."
+    )
+    parser.add_argument("--limit", type=int, help="Documents per collection.")
+    parser.add_argument("--output", help="Optional path of a JSON results file.")
+    args = parser.parse_args()
+
+    results = run(args.collections, args.data_dir, args.limit)
+
+    print(
+        f"{'collection':<22}{'docs':>8}{'inferred MiB':>14}{'typed MiB':>11}"
+        f"{'saved MiB':>11}{'saved %':>9}{'build ms':>18}{'transform ms':>18}"
+    )
+    for collection_name, result in results.items():
+        inferred, typed = result["inferred"], result["typed"]
+        print(
+            f"{collection_name:<22}{result['documents']:>8}"
+            f"{inferred['memory_bytes'] / 2**20:>14.2f}"
+            f"{typed['memory_bytes'] / 2**20:>11.2f}"
+            f"{result['bytes_saved'] / 2**20:>11.2f}{result['percent_saved']:>9.1f}"
+            f"{inferred['build_seconds'] * 1000:>9.1f} ->{typed['build_seconds'] * 1000:>7.1f}"
+            f"{inferred['transform_seconds'] * 1000:>9.1f} ->{typed['transform_seconds'] * 1000:>7.1f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
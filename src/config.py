@@ -7,54 +7,284 @@ unique_id_mapping = {
     "customers": {
         "unique_id_key_col": "customer_id",
         "table_name": "tbl_customers",
-        "nested_documents": [],
+        "nested_documents": ["loans_applied"],
+        "load_method": "copy",
     },
     "loan_types": {
         "unique_id_key_col": "loan_type_id",
         "table_name": "tbl_loan_types",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "loan_applications": {
         "unique_id_key_col": "loan_id",
         "table_name": "tbl_loan_applications",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "loan_repayments": {
         "unique_id_key_col": "repayment_id",
         "table_name": "tbl_loan_repayments",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "loan_history": {
         "unique_id_key_col": "history_id",
         "table_name": "tbl_loan_history",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "loan_collateral": {
         "unique_id_key_col": "collateral_id",
         "table_name": "tbl_loan_collateral",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "loan_restructuring": {
         "unique_id_key_col": "restructuring_id",
         "table_name": "tbl_loan_restructuring",
         "nested_documents": ["new_loan_terms", "restructure_terms"],
+        "load_method": "copy",
     },
     "loan_disbursements": {
         "unique_id_key_col": "disbursement_id",
         "table_name": "tbl_loan_disbursements",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "new_loan_terms": {
         "unique_id_key_col": "new_loan_term_id",
         "table_name": "tbl_new_loan_terms",
         "nested_documents": [],
+        "load_method": "copy",
     },
     "restructure_terms": {
         "unique_id_key_col": "restructure_term_id",
         "table_name": "tbl_restructure_terms",
         "nested_documents": [],
+        "load_method": "copy",
+    },
+}
+
+
+# Field/type schema of each collection. `MongoExtractor` requests only these fields
+# from MongoDB and builds chunks with compact dtypes (`extraction.schema`), and
+# `ArrowExtractor` decodes documents straight into typed columnar buffers. Types:
+# "int32", "int64" (nullable integers), "float64", "bool" (nullable), "category"
+# (low-cardinality strings), "string", "datetime" and "object" (nested documents,
+# kept as JSON text for jsonb).
+timestamp_fields = {"added_at": "datetime", "modified_at": "datetime"}
+
+collection_schemas = {
+    "customers": {
+        "customer_id": "int64",
+        "first_name": "string",
+        "last_name": "string",
+        "gender": "category",
+        "age": "int32",
+        "employment_status": "category",
+        "income_level": "category",
+        "location": "string",
+        "joined_date": "datetime",
+        **timestamp_fields,
+    },
+    "loan_types": {
+        "loan_type_id": "int32",
+        "loan_type_name": "string",
+        "max_loan_amount": "int32",
+        "interest_rate": "float64",
+        "repayment_period_in_months": "int32",
+        "eligibility_criteria": "string",
+        **timestamp_fields,
+    },
+    "loan_applications": {
+        "loan_id": "int64",
+        "customer_id": "int64",
+        "loan_type_id": "int32",
+        "loan_amount": "float64",
+        "loan_status": "category",
+        "application_date": "datetime",
+        "approval_date": "datetime",
+        **timestamp_fields,
+    },
+    "loan_repayments": {
+        "repayment_id": "int64",
+        "loan_id": "int64",
+        "repayment_amount": "float64",
+        "repayment_date": "datetime",
+        "repayment_status": "category",
+        **timestamp_fields,
+    },
+    "loan_history": {
+        "history_id": "int64",
+        "customer_id": "int64",
+        "loan_id": "int64",
+        "previous_loan_status": "bool",
+        "loan_disbursed_date": "datetime",
+        "loan_repaid_date": "datetime",
+        **timestamp_fields,
+    },
+    "loan_collateral": {
+        "collateral_id": "int64",
+        "loan_id": "int64",
+        "collateral_type": "category",
+        "collateral_value": "float64",
+        **timestamp_fields,
+    },
+    "loan_restructuring": {
+        "restructuring_id": "int64",
+        "loan_id": "int64",
+        "new_loan_terms": "object",
+        "restructure_terms": "object",
+        **timestamp_fields,
+    },
+    "loan_disbursements": {
+        "disbursement_id": "int64",
+        "loan_id": "int64",
+        "disbursement_amount": "float64",
+        "disbursement_date": "datetime",
+        "disbursement_method": "category",
+        "application_date": "datetime",
+        **timestamp_fields,
+    },
+    "new_loan_terms": {
+        "new_loan_term_id": "int32",
+        "interest_rate": "float64",
+        "repayment_period_in_months": "int32",
+        **timestamp_fields,
+    },
+    "restructure_terms": {
+        "restructure_term_id": "int32",
+        "reason": "string",
+        "new_schedule": "string",
+        "concessions": "string",
+        **timestamp_fields,
+    },
+}
+
+
+# Tables the `nested_documents` of a collection are flattened into while a direct full
+# load streams it (`transformation.flattener`), instead of being normalized by SQL
+# afterwards. A "dimension" field holds one sub-document per parent: every distinct
+# sub-document is stored once in `table_name` under the surrogate key `key_col`, and
+# the parent refers to it by that key. A "child" field holds an array: each element
+# becomes a row of `table_name` with the parent's `unique_id_key_col` and its
+# `position` in the array (an array of scalars has a single field). `fields` are the
+# columns of the sub-documents, with `collection_schemas` types. With a
+# `parent_table`, its `parent_columns` and the surrogate keys are written there;
+# otherwise the keys are added to the collection's own table. Nested fields that are
+# not in the collection's schema are not loaded into its own table.
+nested_document_tables = {
+    "loan_restructuring": {
+        "parent_table": "tbl_loan_restructuring_normalized",
+        "parent_columns": ["restructuring_id", "loan_id", "added_at", "modified_at"],
+        "fields": {
+            "new_loan_terms": {
+                "kind": "dimension",
+                "table_name": "tbl_new_loan_terms",
+                "key_col": "new_loan_term_id",
+                "fields": {
+                    "interest_rate": "float64",
+                    "repayment_period_in_months": "int32",
+                },
+            },
+            "restructure_terms": {
+                "kind": "dimension",
+                "table_name": "tbl_restructure_terms",
+                "key_col": "restructure_term_id",
+                "fields": {
+                    "reason": "string",
+                    "new_schedule": "string",
+                    "concessions": "string",
+                },
+            },
+        },
+    },
+    "customers": {
+        "fields": {
+            "loans_applied": {
+                "kind": "child",
+                "table_name": "tbl_customer_loans_applied",
+                "fields": {"loan_id": "int64"},
+            },
+        },
     },
 }
+flatten_nested_documents = True
+
+# Foreign-key dependencies between collections: a collection is only migrated once
+# every collection it references has been loaded. Collections without an edge
+# between them are migrated concurrently by `DependencyScheduler`.
+collection_dependencies = {
+    "customers": [],
+    "loan_types": [],
+    "loan_applications": ["customers", "loan_types"],
+    "loan_repayments": ["loan_applications"],
+    "loan_history": ["customers", "loan_applications"],
+    "loan_collateral": ["loan_applications"],
+    "loan_restructuring": ["loan_applications", "new_loan_terms", "restructure_terms"],
+    "loan_disbursements": ["loan_applications"],
+    "new_loan_terms": [],
+    "restructure_terms": [],
+}
+
+# Number of collections migrated concurrently by `DependencyScheduler`
+max_parallel_collections = 4
+
+# Bounds of the PostgreSQL connection pool shared through `ResourceManager`; checkouts
+# beyond `pg_pool_max_connections` wait for a connection to be returned.
+pg_pool_min_connections = 1
+pg_pool_max_connections = 8
+
+# Load methods understood by `PostgresLoader.load_dataframe_to_postgres`:
+# "copy" streams rows through `COPY ... FROM STDIN` (CSV), while "executemany"
+# keeps the original batched INSERT path as a fallback.
+load_methods = ["copy", "executemany"]
+default_load_method = "copy"
+
+
+# PostgreSQL table holding the per-collection watermarks of the incremental load
+watermark_table = "etl_watermarks"
+
+# PostgreSQL table holding the per-chunk checkpoints of resumable full loads
+checkpoint_table = "etl_load_checkpoints"
+
+# Full-load strategies: "direct" inserts into the live tables, while "swap" loads each
+# table into an UNLOGGED staging copy and publishes all of them with one atomic rename,
+# keeping the replaced tables under `previous_table_suffix` for rollback.
+full_load_strategies = ["direct", "swap"]
+default_full_load_strategy = "direct"
+staging_table_suffix = "__staging"
+previous_table_suffix = "__previous"
+
+# Index and constraint rebuilds after bulk loads (`IndexManager`): tables are rebuilt
+# concurrently by `index_rebuild_workers` workers, each applying the session settings
+# below. Dropped definitions are kept in `deferred_index_state_table` until rebuilt.
+# Deferring the indexes of a direct full load (`--defer-indexes`) also drops the keys
+# that reject duplicate rows, so it is only applied to empty target tables.
+deferred_index_state_table = "etl_deferred_indexes"
+defer_indexes_on_full_load = False
+index_rebuild_workers = 4
+index_build_session_settings = {
+    "maintenance_work_mem": "512MB",
+    "max_parallel_maintenance_workers": "2",
+    "synchronous_commit": "off",
+}
+
+# Change-stream replication (CDC): changes are coalesced per key and applied once a
+# window reaches `cdc_window_size` events or `cdc_window_seconds` have elapsed.
+cdc_state_table = "etl_cdc_state"
+cdc_window_seconds = 1.0
+cdc_window_size = 5000
+# Delete events carry only the `_id` of their document. Its unique id comes from the
+# pre-image, a cache of the `cdc_key_cache_size` documents seen last, or the `_id` →
+# key mapping the upserts persist in `cdc_document_keys_table`; deletes resolved by
+# none are kept in `cdc_dead_letter_table`. Pre-images are requested with
+# `cdc_full_document_before_change` (None to never request them) on MongoDB 6.0+.
+cdc_document_keys_table = "etl_cdc_document_keys"
+cdc_dead_letter_table = "etl_cdc_dead_letters"
+cdc_key_cache_size = 100000
+cdc_full_document_before_change = "whenAvailable"
 
 
 # Define fixed IST date
@@ -81,3 +311,73 @@ collections_with_date_keys = {
 }
 
 collections = list(collections_with_date_keys.keys())
+
+# Build extracted chunks from `collection_schemas` (projection pushdown and compact
+# dtypes) instead of letting pandas infer the types of every field of every document
+schema_typed_extraction = True
+
+# Number of documents per DataFrame chunk yielded by `MongoExtractor.iter_collection_chunks`;
+# peak memory of a streamed load is bounded by this rather than by collection size.
+extraction_batch_size = 10000
+
+# Adaptive batching (`pipeline.adaptive`): with `adaptive_batching`, the chunk size of
+# every collection starts at `extraction_batch_size` and follows an AIMD policy: it
+# grows by `adaptive_batch_increase` per healthy batch and is multiplied by
+# `adaptive_decrease_factor` when a batch takes longer than
+# `adaptive_target_batch_seconds`, would hold more than `adaptive_max_batch_bytes`, or
+# runs below `adaptive_slowdown_ratio` of the recent throughput of its stage. Slow
+# loads also halve the number of chunk loads running at once. The settings each
+# collection ends with are logged; copy them into `pinned_batch_sizes` to fix them.
+adaptive_batching = True
+adaptive_min_batch_size = 1000
+adaptive_max_batch_size = 100000
+adaptive_batch_increase = 2000
+adaptive_decrease_factor = 0.5
+adaptive_target_batch_seconds = 2.0
+adaptive_max_batch_bytes = 256 * 2**20
+adaptive_slowdown_ratio = 0.5
+pinned_batch_sizes = {}
+
+# Range-partitioned scans (`pipeline.partitioned`): a collection listed in
+# `scan_partitions` with at least `partition_min_documents` documents is split into that
+# many ranges at sampled split points, and each range is extracted and loaded by its own
+# worker with its own cursor and PostgreSQL connection. Ranges are taken over `_id`
+# unless `partition_keys` names another unique, indexed field (e.g. the collection's
+# `unique_id_key_col`); every document must have it.
+scan_partitions = {"loan_repayments": 4, "loan_history": 4}
+partition_keys = {}
+partition_min_documents = 100000
+
+# Rows per `executemany` round trip of the INSERT fallback load path
+executemany_batch_size = 1000
+
+# Pipelined full loads (`pipeline.pipelined`): with `pipelined_execution` (or
+# `--pipelined`), the chunks of each collection are extracted, transformed and loaded
+# by concurrent stages. A stage may run at most `pipeline_queue_size` chunks ahead of
+# the next one before it waits, which bounds the chunks held in memory.
+pipelined_execution = False
+pipeline_queue_size = 2
+
+# Process-pool rendering (`pipeline.transform_pool`): with `transform_processes` above 0
+# (or `--transform-processes N`), pipelined loads of the collections in
+# `process_transform_collections` render their COPY payloads (NULL handling, JSON
+# serialization, CSV encoding) in that many worker processes instead of the transform
+# thread, so CPU-bound rendering is not serialized on the GIL.
+transform_processes = 0
+process_transform_collections = ["loan_restructuring", "loan_repayments"]
+
+# Seeding MongoDB from `data/` (`seeding.mongo_seeder`): documents are inserted in
+# unordered batches of `seed_batch_size` by `seed_insert_workers` threads per file, and
+# up to `seed_processes` files (e.g. NDJSON part files) are parsed and seeded at once.
+seed_batch_size = 5000
+seed_insert_workers = 4
+seed_processes = 4
+
+# Pipeline metrics (`pipeline.metrics`): per-collection, per-stage timings, rows, bytes
+# and memory high-water marks, written after every run as a JSON report and as a
+# Prometheus text file (e.g. for node_exporter's textfile collector). Tracing Python
+# allocations with tracemalloc adds a high-water mark of the heap but slows every
+# allocation, so it is off by default.
+metrics_report_path = "metrics/pipeline_report.json"
+metrics_prometheus_path = "metrics/pipeline_metrics.prom"
+metrics_trace_memory = False
@@ -0,0 +1,2 @@
+# # src/connections/__init__.py
+# from .resource_manager import ResourceManager, get_resource_manager
@@ -0,0 +1,192 @@
+# resource_manager.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+from pymongo import MongoClient
+
+from config import pg_pool_max_connections, pg_pool_min_connections
+from pipeline.metrics import PipelineMetrics
+
+
+class ResourceManager:
+    def __init__(
+        self,
+        min_pg_connections: int = pg_pool_min_connections,
+        max_pg_connections: int = pg_pool_max_connections,
+    ):
+        """
+        Initializes the ResourceManager class.
+
+        Owns the single MongoClient and a bounded, thread-safe PostgreSQL connection
+        pool shared by `MongoExtractor`, `Transformer` and `PostgresLoader`. Both are
+        created lazily on first use, and environment variables are loaded once here.
+        The components also report their per-stage metrics to `metrics`.
+
+        Parameters:
+        min_pg_connections (int): Connections kept open by the pool.
+        max_pg_connections (int): Upper bound of concurrently checked-out connections.
+        """
+        load_dotenv()
+
+        # MongoDB parameters
+        self.mongo_url = os.getenv("MONGO_DB_URL")
+        self.mongo_db_database_name = os.getenv("MONGODB_DB_NAME")
+
+        # PostgreSQL parameters
+        self.pg_params = {
+            "host": os.getenv("PG_HOST"),
+            "database": os.getenv("PG_DATABASE"),
+            "user": os.getenv("PG_USER"),
+            "password": os.getenv("PG_PASSWORD"),
+            "port": os.getenv("PG_PORT"),
+        }
+
+        self.min_pg_connections = min_pg_connections
+        self.max_pg_connections = max_pg_connections
+
+        self._lock = threading.Lock()
+        self._mongo_client = None
+        self._pg_pool = None
+        # Bounds checkouts so callers wait instead of the pool raising PoolError
+        self._pg_slots = threading.BoundedSemaphore(max_pg_connections)
+
+        self.metrics = PipelineMetrics()
+
+        self._created_at = time.monotonic()
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._busy_seconds = 0.0
+        self._in_use = 0
+        self._peak_in_use = 0
+
+    @property
+    def mongo_client(self) -> MongoClient:
+        """Returns the shared MongoClient (thread-safe, pools its own sockets)."""
+        if self._mongo_client is None:
+            with self._lock:
+                if self._mongo_client is None:
+                    self._mongo_client = MongoClient(self.mongo_url)
+        return self._mongo_client
+
+    @property
+    def mongo_db(self):
+        """Returns the configured MongoDB database of the shared client."""
+        return self.mongo_client[self.mongo_db_database_name]
+
+    def _get_pg_pool(self) -> ThreadedConnectionPool:
+        if self._pg_pool is None:
+            with self._lock:
+                if self._pg_pool is None:
+                    self._pg_pool = ThreadedConnectionPool(
+                        self.min_pg_connections,
+                        self.max_pg_connections,
+                        **self.pg_params,
+                    )
+                    print("PostgreSQL connection pool established successfully.")
+        return self._pg_pool
+
+    @contextmanager
+    def pg_connection(self):
+        """
+        Checks a PostgreSQL connection out of the pool for the duration of the block.
+        Each worker thread should check out its own connection. An open transaction
+        is rolled back and session settings are reset before the connection is
+        returned, so no state leaks between callers.
+        """
+        wait_started = time.monotonic()
+        self._pg_slots.acquire()
+        waited = time.monotonic() - wait_started
+
+        try:
+            connection = self._get_pg_pool().getconn()
+        except Exception:
+            self._pg_slots.release()
+            raise
+
+        with self._lock:
+            self._checkouts += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        checked_out_at = time.monotonic()
+
+        try:
+            yield connection
+        finally:
+            broken = bool(connection.closed)
+            if not broken:
+                try:
+                    if (
+                        connection.get_transaction_status()
+                        != extensions.TRANSACTION_STATUS_IDLE
+                    ):
+                        connection.rollback()
+                    connection.autocommit = False
+                except psycopg2.Error:
+                    broken = True
+            self._get_pg_pool().putconn(connection, close=broken)
+
+            with self._lock:
+                self._in_use -= 1
+                self._busy_seconds += time.monotonic() - checked_out_at
+            self._pg_slots.release()
+
+    def connect_pg(self):
+        """
+        Opens a dedicated PostgreSQL connection outside the pool, for long-lived
+        sessions that should not hold a pool slot. The caller closes it.
+        """
+        return psycopg2.connect(**self.pg_params)
+
+    def stats(self) -> dict:
+        """Returns pool checkout counts, wait times and utilization."""
+        with self._lock:
+            elapsed = time.monotonic() - self._created_at
+            return {
+                "pg_checkouts": self._checkouts,
+                "pg_wait_seconds_total": self._wait_seconds,
+                "pg_wait_seconds_avg": self._wait_seconds / self._checkouts
+                if self._checkouts
+                else 0.0,
+                "pg_wait_seconds_max": self._max_wait_seconds,
+                "pg_in_use": self._in_use,
+                "pg_peak_in_use": self._peak_in_use,
+                "pg_max_connections": self.max_pg_connections,
+                # Share of the pool's capacity that was checked out since creation
+                "pg_utilization": self._busy_seconds
+                / (elapsed * self.max_pg_connections)
+                if elapsed > 0
+                else 0.0,
+            }
+
+    def close(self):
+        """Closes every pooled PostgreSQL connection and the MongoClient."""
+        with self._lock:
+            if self._pg_pool is not None:
+                self._pg_pool.closeall()
+                self._pg_pool = None
+            if self._mongo_client is not None:
+                self._mongo_client.close()
+                self._mongo_client = None
+
+
+_default_resource_manager = None
+_default_lock = threading.Lock()
+
+
+def get_resource_manager() -> ResourceManager:
+    """Returns the process-wide ResourceManager used when none is injected."""
+    global _default_resource_manager
+    with _default_lock:
+        if _default_resource_manager is None:
+            _default_resource_manager = ResourceManager()
+        return _default_resource_manager
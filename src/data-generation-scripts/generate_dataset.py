@@ -0,0 +1,522 @@
+"""
+- This script generates the whole dataset (customers -> loan_applications -> loan_repayments,
+  loan_collateral, loan_disbursements, loan_history and loan_restructuring, plus the
+  loan_types, new_loan_terms and restructure_terms dimensions) at any scale.
+
+
+- It follows the rules of the per-collection scripts in this folder:
+
+    - 70% of the customers apply for a loan, 15% of those for 2 to 5 loans.
+
+    - Approved loans get monthly repayments (amortized with the loan type's interest rate
+      over its repayment period), one collateral, one disbursement and one restructuring.
+
+    - Every application gets a loan history record; `previous_loan_status` is true when
+      all of its repayments are paid.
+
+
+- Our approach is going to be as follows:
+
+    - Step 1: Split the customers into shards. A customer and everything derived from it
+      is generated by the same shard, so shards are independent and run in parallel
+      processes. Each shard draws from its own RNG stream spawned from one
+      `SeedSequence`, so the output only depends on `--seed` and `--shard-size`.
+
+    - Step 2: Generate every collection of a shard column by column with NumPy; loan
+      type attributes are looked up by index instead of searched, and repayments and
+      loans are expanded with `np.repeat` instead of nested loops.
+
+    - Step 3: Stream every shard to NDJSON files (one document per line), i.e.
+      `<output>/<collection>/part-<shard>.ndjson`. Dates are written as ISO 8601 UTC
+      strings adjusted to IST, as `format_dates.py` produces them.
+
+
+- Usage:
+    python generate_dataset.py --scale 100 --workers 8
+  `--scale 1` matches the 6,000 customers of the sample data; loan_repayments grows by
+  roughly 3.6 rows per customer.
+"""
+
+# ---------------------------
+# Import necessary libraries
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------
+# Fixed values for data generation (taken from the per-collection scripts)
+
+BASE_CUSTOMERS = 6000
+
+first_names = [
+    "Ada", "Alan", "Amara", "Arjun", "Bea", "Carlos", "Chen", "Dara", "Elena", "Emeka",
+    "Farah", "Grace", "Hasty", "Iris", "Ivan", "Jonas", "Kavya", "Leila", "Mateo", "Mei",
+    "Nia", "Omar", "Priya", "Quinn", "Rosa", "Sami", "Tariq", "Uma", "Vera", "Yusuf",
+]
+last_names = [
+    "Apark", "Brown", "Castillo", "Das", "Evans", "Fischer", "Garcia", "Guerra", "Huang",
+    "Iyer", "Jones", "Kim", "Lopez", "Mensah", "Nguyen", "Okafor", "Patel", "Quiroga",
+    "Rossi", "Shelby", "Stuckley", "Tanaka", "Usman", "Varga", "Walker", "Xu", "Young",
+]
+genders = ["Male", "Female"]
+employment_statuses = [
+    "entrepreneur", "self-employed", "freelancer", "student", "retired", "employed",
+    "unemployed",
+]
+income_levels = ["low", "middle", "high"]
+locations = [
+    "Austin", "Denver", "Dallas", "New York City", "Jacksonville", "San Antonio",
+    "Indianapolis", "Philadelphia", "Chicago", "Los Angeles", "San Francisco", "Phoenix",
+    "Houston", "San Diego", "Charlotte", "Washington", "Columbus", "San Jose", "Seattle",
+    "Fort Worth",
+]
+
+loan_type_details = {
+    "Micro Loan": (1500, 5),
+    "Personal Loan": (3000, 8),
+    "Business Loan": (20000, 10),
+    "Housing Loan": (25000, 6),
+    "Education Loan": (10000, 7),
+    "Emergency Loan": (5000, 9),
+    "Consumer Loan": (4000, 8.5),
+}
+repayment_periods_in_months = [6, 12, 18, 24]
+eligibility_criteria = "Minimum income $500/month"
+
+loan_status_options = ["Pending", "Approved", "Rejected", "Disbursed"]
+repayment_status_options = ["Paid", "Partial", "Overdue", "Missed"]
+collateral_types_and_ratios = {
+    "Property": 1.2,
+    "Vehicle": 1.0,
+    "Gold": 0.9,
+    "Stocks/Bonds": 0.8,
+    "Cash Deposit": 1.0,
+    "Equipment": 0.7,
+    "Inventory": 0.6,
+    "Other": 0.5,
+}
+disbursement_methods = [
+    "Bank Transfer", "Check", "Cash", "Mobile Payment", "Online Transfer",
+]
+
+interest_rates = [3, 4, 5, 6]
+repayment_periods = [36, 48, 60, 72]
+restructure_reasons = [
+    "Financial difficulties",
+    "Interest rate reduction",
+    "Change in income",
+    "Unexpected expenses",
+]
+new_schedules = ["Monthly payments", "Bi-weekly payments", "Quarterly payments"]
+concessions = [
+    "2-month grace period",
+    "No late fees for 3 months",
+    "Payment deferral for 1 month",
+]
+
+loan_applicant_percentage = 0.7
+multiple_loan_percentage = 0.15
+
+# Date ranges, as days since the epoch
+joined_start = np.datetime64("2018-01-01", "D")
+joined_end = np.datetime64("2021-09-29", "D")
+application_start = np.datetime64("2018-01-01", "D")
+application_end = np.datetime64("2024-09-30", "D")
+
+# Ids: customers are numbered globally (12 digits); every other entity gets an
+# 18-digit id made of the shard number and a per-shard counter, so shards never collide
+CUSTOMER_ID_BASE = 100000000000
+ENTITY_ID_BASE = 100000000000000000
+SHARD_ID_STRIDE = 2**40
+
+
+def build_loan_types():
+    """Builds the 28 loan types exactly as `loan_types_documents.py` does."""
+    loan_types = []
+    for type_number, (name, (max_amount, rate)) in enumerate(
+        loan_type_details.items(), start=1
+    ):
+        for sub_type, period in enumerate(repayment_periods_in_months, start=1):
+            loan_types.append(
+                {
+                    "loan_type_id": int(f"{type_number}{sub_type}"),
+                    "loan_type_name": name,
+                    "max_loan_amount": max_amount,
+                    "interest_rate": rate + sub_type - 1,
+                    "repayment_period_in_months": period,
+                    "eligibility_criteria": eligibility_criteria,
+                }
+            )
+    return loan_types
+
+
+def build_term_combinations():
+    """Builds the dimensions of `unique_combinations.py`."""
+    new_loan_terms = [
+        {
+            "new_loan_term_id": term_id,
+            "interest_rate": rate,
+            "repayment_period_in_months": period,
+        }
+        for term_id, (rate, period) in enumerate(
+            ((rate, period) for rate in interest_rates for period in repayment_periods),
+            start=1,
+        )
+    ]
+    restructure_terms = [
+        {
+            "restructure_term_id": term_id,
+            "reason": reason,
+            "new_schedule": schedule,
+            "concessions": concession,
+        }
+        for term_id, (reason, schedule, concession) in enumerate(
+            (
+                (reason, schedule, concession)
+                for reason in restructure_reasons
+                for schedule in new_schedules
+                for concession in concessions
+            ),
+            start=1,
+        )
+    ]
+    return new_loan_terms, restructure_terms
+
+
+def to_ist_strings(days, valid=None):
+    """
+    Formats day numbers as ISO 8601 UTC strings adjusted to IST (midnight UTC + 5:30),
+    like `format_dates.py`; entries where `valid` is False become None.
+    """
+    strings = np.char.add(
+        np.datetime_as_string(days.astype("datetime64[D]"), unit="D"),
+        "T05:30:00+00:00",
+    ).astype(object)
+    if valid is not None:
+        strings[~valid] = None
+    return strings
+
+
+def random_days(rng, start, end, size):
+    """Draws uniform days in [start, end] (arrays or scalars of datetime64[D])."""
+    start = np.asarray(start, dtype="datetime64[D]")
+    span = (np.asarray(end, dtype="datetime64[D]") - start).astype(np.int64) + 1
+    return start + (rng.random(size) * span).astype(np.int64)
+
+
+def write_ndjson(output_dir, collection_name, shard, frame):
+    """Streams one shard of a collection to `<output>/<collection>/part-<shard>.ndjson`."""
+    directory = os.path.join(output_dir, collection_name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{shard:05d}.ndjson")
+    frame.to_json(path, orient="records", lines=True)
+    return len(frame)
+
+
+def generate_shard(shard, first_customer, customer_count, seed_sequence, output_dir):
+    """
+    Generates customer `first_customer` to `first_customer + customer_count` and every
+    document derived from them, and writes them as NDJSON.
+
+    Returns:
+        dict: Documents written per collection.
+    """
+    rng = np.random.default_rng(seed_sequence)
+    next_entity_id = ENTITY_ID_BASE + shard * SHARD_ID_STRIDE
+
+    def entity_ids(count):
+        nonlocal next_entity_id
+        ids = np.arange(next_entity_id, next_entity_id + count, dtype=np.int64)
+        next_entity_id += count
+        return ids
+
+    loan_types = build_loan_types()
+    type_ids = np.array([lt["loan_type_id"] for lt in loan_types], dtype=np.int64)
+    type_max_amounts = np.array([lt["max_loan_amount"] for lt in loan_types], dtype=float)
+    type_rates = np.array([lt["interest_rate"] for lt in loan_types], dtype=float)
+    type_periods = np.array(
+        [lt["repayment_period_in_months"] for lt in loan_types], dtype=np.int64
+    )
+    counts = {}
+
+    # Step 1: customers
+    n = customer_count
+    customer_ids = CUSTOMER_ID_BASE + first_customer + np.arange(n, dtype=np.int64)
+    customers = pd.DataFrame(
+        {
+            "customer_id": customer_ids,
+            "first_name": np.array(first_names, dtype=object)[
+                rng.integers(0, len(first_names), n)
+            ],
+            "last_name": np.array(last_names, dtype=object)[
+                rng.integers(0, len(last_names), n)
+            ],
+            "gender": np.array(genders, dtype=object)[rng.integers(0, 2, n)],
+            "age": rng.integers(18, 81, n),
+            "employment_status": np.array(employment_statuses, dtype=object)[
+                rng.integers(0, len(employment_statuses), n)
+            ],
+            "income_level": np.array(income_levels, dtype=object)[
+                rng.integers(0, len(income_levels), n)
+            ],
+            "location": np.array(locations, dtype=object)[
+                rng.integers(0, len(locations), n)
+            ],
+            "joined_date": to_ist_strings(
+                random_days(rng, joined_start, joined_end, n)
+            ),
+        }
+    )
+
+    # Step 2: loan applications; 70% of customers apply, 15% of those for 2-5 loans
+    applies = rng.random(n) < loan_applicant_percentage
+    multiple = applies & (rng.random(n) < multiple_loan_percentage)
+    loans_per_customer = np.where(multiple, rng.integers(2, 6, n), applies.astype(int))
+    m = int(loans_per_customer.sum())
+
+    application_customer = np.repeat(np.arange(n), loans_per_customer)
+    loan_ids = entity_ids(m)
+    loan_type = rng.integers(0, len(loan_types), m)
+    loan_amount = np.round(100 + rng.random(m) * (type_max_amounts[loan_type] - 100), 2)
+    loan_status = rng.integers(0, len(loan_status_options), m)
+    approved = loan_status == loan_status_options.index("Approved")
+    application_date = random_days(rng, application_start, application_end, m)
+    approval_date = random_days(rng, application_date, application_end, m)
+
+    # Customers keep the ids of their loans, as `customers_with_loans.json` did
+    boundaries = np.cumsum(loans_per_customer)[:-1]
+    customers["loans_applied"] = [
+        ids.tolist() for ids in np.split(loan_ids, boundaries)
+    ]
+    counts["customers"] = write_ndjson(output_dir, "customers", shard, customers)
+
+    applications = pd.DataFrame(
+        {
+            "loan_id": loan_ids,
+            "customer_id": customer_ids[application_customer],
+            "loan_type_id": type_ids[loan_type],
+            "loan_amount": loan_amount,
+            "loan_status": np.array(loan_status_options, dtype=object)[loan_status],
+            "application_date": to_ist_strings(application_date),
+            "approval_date": to_ist_strings(approval_date, approved),
+        }
+    )
+    counts["loan_applications"] = write_ndjson(
+        output_dir, "loan_applications", shard, applications
+    )
+    del applications
+
+    # Step 3: monthly repayments of approved loans
+    approved_index = np.flatnonzero(approved)
+    periods = type_periods[loan_type[approved_index]]
+    monthly_rate = type_rates[loan_type[approved_index]] / 100 / 12
+    principal = loan_amount[approved_index]
+    installment = np.round(
+        principal * monthly_rate / (1 - (1 + monthly_rate) ** -periods), 2
+    )
+
+    repayment_loan = np.repeat(np.arange(len(approved_index)), periods)
+    r = len(repayment_loan)
+    month = np.arange(r) - np.repeat(np.cumsum(periods) - periods, periods)
+    repayment_status = rng.integers(0, len(repayment_status_options), r)
+    repayment_date = approval_date[approved_index][repayment_loan] + 30 + 30 * month
+    counts["loan_repayments"] = write_ndjson(
+        output_dir,
+        "loan_repayments",
+        shard,
+        pd.DataFrame(
+            {
+                "repayment_id": entity_ids(r),
+                "loan_id": loan_ids[approved_index][repayment_loan],
+                "repayment_amount": installment[repayment_loan],
+                "repayment_date": to_ist_strings(repayment_date),
+                "repayment_status": np.array(repayment_status_options, dtype=object)[
+                    repayment_status
+                ],
+            }
+        ),
+    )
+
+    # Step 4: loan history; a loan is repaid when all of its installments are paid
+    paid = np.bincount(
+        repayment_loan,
+        weights=repayment_status == repayment_status_options.index("Paid"),
+        minlength=len(approved_index),
+    )
+    all_paid = np.ones(m, dtype=bool)
+    all_paid[approved_index] = paid == periods
+    repaid = np.zeros(m, dtype=bool)
+    repaid[approved_index] = paid == periods
+    last_repayment = approval_date.copy()
+    last_repayment[approved_index] = approval_date[approved_index] + 30 * periods
+    counts["loan_history"] = write_ndjson(
+        output_dir,
+        "loan_history",
+        shard,
+        pd.DataFrame(
+            {
+                "history_id": entity_ids(m),
+                "customer_id": customer_ids[application_customer],
+                "loan_id": loan_ids,
+                "previous_loan_status": all_paid,
+                "loan_disbursed_date": to_ist_strings(approval_date, approved),
+                "loan_repaid_date": to_ist_strings(last_repayment, repaid),
+            }
+        ),
+    )
+    del repayment_loan, month, repayment_status, repayment_date
+
+    # Step 5: collateral, disbursement and restructuring of approved loans
+    a = len(approved_index)
+    approved_loan_ids = loan_ids[approved_index]
+    collateral_types = np.array(list(collateral_types_and_ratios), dtype=object)
+    collateral_ratios = np.array(list(collateral_types_and_ratios.values()))
+    collateral_type = rng.integers(0, len(collateral_types), a)
+    counts["loan_collateral"] = write_ndjson(
+        output_dir,
+        "loan_collateral",
+        shard,
+        pd.DataFrame(
+            {
+                "collateral_id": entity_ids(a),
+                "loan_id": approved_loan_ids,
+                "collateral_type": collateral_types[collateral_type],
+                "collateral_value": np.round(
+                    principal * collateral_ratios[collateral_type], 2
+                ),
+            }
+        ),
+    )
+
+    counts["loan_disbursements"] = write_ndjson(
+        output_dir,
+        "loan_disbursements",
+        shard,
+        pd.DataFrame(
+            {
+                "disbursement_id": entity_ids(a),
+                "loan_id": approved_loan_ids,
+                "disbursement_amount": principal,
+                "disbursement_date": to_ist_strings(approval_date[approved_index]),
+                "disbursement_method": np.array(disbursement_methods, dtype=object)[
+                    rng.integers(0, len(disbursement_methods), a)
+                ],
+            }
+        ),
+    )
+
+    new_rate = rng.integers(0, len(interest_rates), a)
+    new_period = rng.integers(0, len(repayment_periods), a)
+    reason = rng.integers(0, len(restructure_reasons), a)
+    schedule = rng.integers(0, len(new_schedules), a)
+    concession = rng.integers(0, len(concessions), a)
+    counts["loan_restructuring"] = write_ndjson(
+        output_dir,
+        "loan_restructuring",
+        shard,
+        pd.DataFrame(
+            {
+                "restructuring_id": entity_ids(a),
+                "loan_id": approved_loan_ids,
+                "new_loan_terms": [
+                    {
+                        "interest_rate": interest_rates[i],
+                        "repayment_period_in_months": repayment_periods[j],
+                    }
+                    for i, j in zip(new_rate.tolist(), new_period.tolist())
+                ],
+                "restructure_terms": [
+                    {
+                        "reason": restructure_reasons[i],
+                        "new_schedule": new_schedules[j],
+                        "concessions": concessions[k],
+                    }
+                    for i, j, k in zip(
+                        reason.tolist(), schedule.tolist(), concession.tolist()
+                    )
+                ],
+            }
+        ),
+    )
+    return counts
+
+
+def write_dimensions(output_dir):
+    new_loan_terms, restructure_terms = build_term_combinations()
+    dimensions = {
+        "loan_types": build_loan_types(),
+        "new_loan_terms": new_loan_terms,
+        "restructure_terms": restructure_terms,
+    }
+    counts = {}
+    for collection_name, documents in dimensions.items():
+        counts[collection_name] = write_ndjson(
+            output_dir, collection_name, 0, pd.DataFrame(documents)
+        )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the dataset at any scale.")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help=f"Multiple of the {BASE_CUSTOMERS} sample customers to generate.",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=100000,
+        help="Customers per shard; a shard is generated by one process at a time.",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", default="../../data/generated")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    total_customers = int(BASE_CUSTOMERS * args.scale)
+    shard_starts = list(range(0, total_customers, args.shard_size))
+    seed_sequences = np.random.SeedSequence(args.seed).spawn(len(shard_starts))
+
+    totals = write_dimensions(args.output)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(
+                generate_shard,
+                shard,
+                first_customer,
+                min(args.shard_size, total_customers - first_customer),
+                seed_sequences[shard],
+                args.output,
+            )
+            for shard, first_customer in enumerate(shard_starts)
+        ]
+        for future in futures:
+            for collection_name, count in future.result().items():
+                totals[collection_name] = totals.get(collection_name, 0) + count
+
+    with open(os.path.join(args.output, "manifest.json"), "w") as f:
+        json.dump(
+            {"scale": args.scale, "seed": args.seed, "shards": len(shard_starts),
+             "documents": totals},
+            f,
+            indent=4,
+        )
+
+    for collection_name, count in totals.items():
+        print(f"{count} {collection_name} documents written.")
+    print(
+        f"Generated {sum(totals.values())} documents in "
+        f"{time.perf_counter() - started:.1f}s into {args.output}."
+    )
+
+
+if __name__ == "__main__":
+    main()
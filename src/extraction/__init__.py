@@ -1,2 +1,4 @@
 # # src/extraction/__init__.py
 # from .mongo_extractor import MongoExtractor
+# from .change_events import MongoChangeStreamSource, InMemoryChangeEventSource
+# from .arrow_extractor import ArrowExtractor
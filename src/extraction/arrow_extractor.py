@@ -0,0 +1,175 @@
+# arrow_extractor.py
+
+import json
+import time
+
+import bson
+import pandas as pd
+import pyarrow as pa
+from bson.codec_options import CodecOptions
+from pymongoarrow.context import PyMongoArrowContext
+from pymongoarrow.lib import process_bson_stream
+from pymongoarrow.schema import Schema
+
+from connections.resource_manager import ResourceManager, get_resource_manager
+from config import collection_schemas, extraction_batch_size
+
+# Arrow type of each schema type in `collection_schemas`. BSON dates have millisecond
+# precision and pymongo decodes them as naive UTC, hence naive timestamp("ms").
+ARROW_TYPES = {
+    "int32": pa.int32(),
+    "int64": pa.int64(),
+    "float64": pa.float64(),
+    "bool": pa.bool_(),
+    "string": pa.string(),
+    "category": pa.string(),
+    "datetime": pa.timestamp("ms"),
+    "object": pa.string(),
+}
+
+# Nullable pandas dtypes used when converting Arrow tables back to DataFrames, so
+# 18-digit ids never pass through float64
+PANDAS_TYPES = {
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+
+class ArrowExtractor:
+    def __init__(self, resource_manager: ResourceManager = None):
+        """
+        Initializes the ArrowExtractor class.
+
+        An alternative to `MongoExtractor.iter_collection_chunks` that reads raw BSON
+        cursor batches and decodes them straight into typed Arrow columns following
+        `collection_schemas`, instead of building a DataFrame from a list of dicts.
+        The scalar fields are decoded by pymongoarrow's BSON reader, which appends
+        every value to an Arrow builder without creating a Python object for it;
+        only nested documents ("object" fields) are decoded in Python. Only the
+        schema fields are requested from MongoDB.
+
+        Parameters:
+            resource_manager (ResourceManager): Defaults to the process-wide instance.
+        """
+        self.resources = resource_manager or get_resource_manager()
+        self.db = self.resources.mongo_db
+        self.codec_options = CodecOptions(tz_aware=False)
+
+    def arrow_schema(self, collection_name: str) -> pa.Schema:
+        """Returns the Arrow schema declared for a collection in `collection_schemas`."""
+        return pa.schema(
+            [
+                (field, ARROW_TYPES[field_type])
+                for field, field_type in collection_schemas[collection_name].items()
+            ]
+        )
+
+    def decode_raw_batch(self, raw_batch: bytes, collection_name: str) -> pa.RecordBatch:
+        """
+        Decodes one raw BSON cursor batch into a RecordBatch with one typed column
+        per schema field. Values of another BSON type than the declared one are
+        cast where pymongoarrow can (e.g. an integral double into an integer) and
+        become nulls otherwise, as do fields missing from a document. Nested
+        documents have no fixed type: they are decoded per document and stored as
+        JSON text.
+        """
+        schema = collection_schemas[collection_name]
+        arrow_schema = self.arrow_schema(collection_name)
+        object_fields = [f for f, t in schema.items() if t == "object"]
+
+        context = PyMongoArrowContext.from_schema(
+            Schema(
+                {
+                    field.name: field.type
+                    for field in arrow_schema
+                    if field.name not in object_fields
+                }
+            ),
+            codec_options=self.codec_options,
+        )
+        process_bson_stream(raw_batch, context)
+        table = context.finish()
+
+        columns = {name: table[name].combine_chunks() for name in table.column_names}
+        if object_fields:
+            documents = list(bson.decode_iter(raw_batch, self.codec_options))
+            for field in object_fields:
+                columns[field] = pa.array(
+                    [
+                        json.dumps(document[field], default=str)
+                        if document.get(field) is not None
+                        else None
+                        for document in documents
+                    ],
+                    type=pa.string(),
+                )
+
+        return pa.record_batch(
+            [columns[field.name] for field in arrow_schema], schema=arrow_schema
+        )
+
+    def iter_collection_batches(
+        self, collection_name: str, batch_size: int = None, query: dict = None
+    ):
+        """
+        Streams a MongoDB collection as Arrow RecordBatches of up to `batch_size`
+        documents each.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+            batch_size (int): Documents per cursor batch; defaults to `extraction_batch_size`.
+            query (dict): Optional filter applied to the cursor.
+
+        Yields:
+            pa.RecordBatch: One decoded cursor batch.
+        """
+        batch_size = batch_size or extraction_batch_size
+        projection = {field: 1 for field in collection_schemas[collection_name]}
+        projection["_id"] = 0
+
+        cursor = self.db[collection_name].find_raw_batches(
+            query or {}, projection, batch_size=batch_size
+        )
+        try:
+            # Fetching and decoding each batch is recorded as the "extract" stage,
+            # with the raw BSON received and the Arrow buffers produced
+            started = time.perf_counter()
+            for raw_batch in cursor:
+                batch = self.decode_raw_batch(raw_batch, collection_name)
+                self.resources.metrics.record(
+                    collection_name,
+                    "extract",
+                    batch.num_rows,
+                    time.perf_counter() - started,
+                    bytes_in=len(raw_batch),
+                    bytes_out=batch.nbytes,
+                )
+                if batch.num_rows:
+                    yield batch
+                started = time.perf_counter()
+        finally:
+            cursor.close()
+
+    def load_collection_as_table(self, collection_name: str) -> pa.Table:
+        """Reads a whole collection into an Arrow Table."""
+        return pa.Table.from_batches(
+            list(self.iter_collection_batches(collection_name)),
+            schema=self.arrow_schema(collection_name),
+        )
+
+    def load_collection_as_dataframe(self, collection_name: str) -> pd.DataFrame:
+        """
+        Thin pandas wrapper over `load_collection_as_table`, with the dtypes of
+        `extraction.schema`: nullable integers and booleans, categoricals and naive
+        `datetime64[ns]`. Nested documents stay JSON text.
+        """
+        df = self.load_collection_as_table(collection_name).to_pandas(
+            types_mapper=PANDAS_TYPES.get
+        )
+        for field, field_type in collection_schemas[collection_name].items():
+            if field_type == "category":
+                df[field] = df[field].astype("category")
+            elif field_type == "datetime":
+                df[field] = df[field].astype("datetime64[ns]")
+        return df
@@ -0,0 +1,170 @@
+# change_events.py
+
+import queue
+import time
+from itertools import count
+
+from bson import ObjectId, Timestamp
+
+from config import cdc_full_document_before_change
+
+# Longest a change stream getMore waits on the server for new events, which bounds
+# how much a `next_event` call can overrun its timeout
+CHANGE_STREAM_AWAIT_MS = 500
+
+
+class ChangeEventSource:
+    """
+    Interface of the event sources consumed by `ChangeStreamReplicator`.
+
+    Events follow the shape of MongoDB change events: a dict with `operationType`
+    ("insert", "update", "replace" or "delete"), `ns` ({"db", "coll"}), `documentKey`,
+    `fullDocument` (None for deletes), optionally `fullDocumentBeforeChange`, and
+    `clusterTime` (a `bson.Timestamp`).
+    """
+
+    def next_event(self, timeout: float):
+        """Returns the next event, or None if none arrived within `timeout` seconds."""
+        raise NotImplementedError
+
+    @property
+    def resume_token(self):
+        """Token after which a restarted source continues."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MongoChangeStreamSource(ChangeEventSource):
+    def __init__(
+        self,
+        db,
+        collections_list: list,
+        resume_token=None,
+        full_document_before_change: str = cdc_full_document_before_change,
+    ):
+        """
+        Initializes the MongoChangeStreamSource class.
+        Opens one database-level change stream filtered to `collections_list`.
+        Requires a replica set or sharded cluster.
+
+        Parameters:
+            db: The pymongo Database to watch.
+            collections_list (list): Names of the collections to replicate.
+            resume_token (dict): Token persisted by an earlier run, if any.
+            full_document_before_change (str): Pre-image mode ("whenAvailable" or
+                "required"), or None for none. Pre-images exist from MongoDB 6.0,
+                so older servers are never asked for them.
+        """
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": list(collections_list)},
+                    "operationType": {
+                        "$in": ["insert", "update", "replace", "delete"]
+                    },
+                }
+            }
+        ]
+        options = {}
+        # Pre-images carry the unique id of deleted documents on collections with
+        # changeStreamPreAndPostImages enabled; earlier servers reject the option
+        if full_document_before_change is not None:
+            if db.client.server_info()["versionArray"][:1] >= [6]:
+                options["full_document_before_change"] = full_document_before_change
+            else:
+                print(
+                    "MongoDB before 6.0 has no pre-images: deletes are resolved "
+                    "from the documents replicated before them."
+                )
+        self.stream = db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=resume_token,
+            max_await_time_ms=CHANGE_STREAM_AWAIT_MS,
+            **options,
+        )
+
+    def next_event(self, timeout: float):
+        # Each try_next() is one getMore, which waits on the server for up to
+        # CHANGE_STREAM_AWAIT_MS while there are no new events
+        deadline = time.monotonic() + timeout
+        while self.stream.alive:
+            event = self.stream.try_next()
+            if event is not None:
+                return event
+            if time.monotonic() >= deadline:
+                return None
+        return None
+
+    @property
+    def resume_token(self):
+        return self.stream.resume_token
+
+    def close(self):
+        self.stream.close()
+
+
+class InMemoryChangeEventSource(ChangeEventSource):
+    def __init__(self, database_name: str = "in_memory"):
+        """
+        Initializes the InMemoryChangeEventSource class.
+        An in-process stand-in for a change stream, so replication can be exercised
+        without a replica set. Events are queued with `emit` (or the insert, update
+        and delete helpers) and handed out in order.
+        """
+        self.database_name = database_name
+        self.events = queue.Queue()
+        self._sequence = count(1)
+        self._resume_token = None
+
+    def emit(
+        self,
+        operation_type: str,
+        collection_name: str,
+        document: dict = None,
+        document_key: dict = None,
+        before_change: dict = None,
+    ):
+        """Queues one change event."""
+        sequence = next(self._sequence)
+        if document_key is None:
+            document_key = {"_id": (document or {}).get("_id", ObjectId())}
+        self.events.put(
+            {
+                "_id": {"_data": f"{sequence:016x}"},
+                "operationType": operation_type,
+                "ns": {"db": self.database_name, "coll": collection_name},
+                "documentKey": document_key,
+                "fullDocument": document,
+                "fullDocumentBeforeChange": before_change,
+                "clusterTime": Timestamp(int(time.time()), sequence),
+            }
+        )
+
+    def insert(self, collection_name: str, document: dict):
+        self.emit("insert", collection_name, document)
+
+    def update(self, collection_name: str, document: dict):
+        self.emit("update", collection_name, document)
+
+    def delete(self, collection_name: str, before_change: dict):
+        self.emit(
+            "delete",
+            collection_name,
+            document_key={"_id": before_change.get("_id", ObjectId())},
+            before_change=before_change,
+        )
+
+    def next_event(self, timeout: float):
+        try:
+            event = self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        self._resume_token = event["_id"]
+        return event
+
+    @property
+    def resume_token(self):
+        return self._resume_token
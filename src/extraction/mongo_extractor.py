@@ -1,43 +1,61 @@
-import os
+import time
+from collections import Counter
+from itertools import islice
 from datetime import datetime, timezone, timedelta
 import pandas as pd
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 
+from connections.resource_manager import ResourceManager, get_resource_manager
+from pipeline.metrics import frame_bytes
+from extraction.schema import build_typed_dataframe, has_schema, schema_projection
+from extraction.arrow_extractor import ArrowExtractor
 
 from config import (
     unique_id_mapping,
     fixed_date_ist,
     collections_with_date_keys,
     collections,
+    extraction_batch_size,
+    schema_typed_extraction,
 )
 
+# Documents sampled per partition to pick the split points of a partitioned scan
+SPLIT_SAMPLES_PER_PARTITION = 100
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Offset `convert_to_ist` adds to source dates
+IST_OFFSET = pd.Timedelta(hours=5, minutes=30)
+
 
 class MongoExtractor:
-    def __init__(self):
+    def __init__(self, resource_manager: ResourceManager = None):
         """
         Initializes the MongoExtractor class.
-        Loads environment variables and sets up MongoDB connection parameters.
-        """
+        Uses the MongoClient owned by the shared ResourceManager.
 
-        # Load environment variables from .env file
-        load_dotenv()
+        Parameters:
+            resource_manager (ResourceManager): Defaults to the process-wide instance.
+        """
+        self.resources = resource_manager or get_resource_manager()
 
         # MongoDB connection parameters
-        self.mongo_url = os.getenv("MONGO_DB_URL")
-        self.mongo_db_database_name = os.getenv("MONGODB_DB_NAME")
-        self.mongo_client = MongoClient(self.mongo_url)
-        self.db = self.mongo_client[self.mongo_db_database_name]
+        self.mongo_url = self.resources.mongo_url
+        self.mongo_db_database_name = self.resources.mongo_db_database_name
+        self.mongo_client = self.resources.mongo_client
+        self.db = self.resources.mongo_db
+
+        # Collections whose unique index on `unique_id_key_col` is known to exist
+        self._unique_indexes = set()
 
     def get_mongo_client(self) -> MongoClient:
         """
-        Establishes and returns a MongoDB client connection.
+        Returns the shared MongoDB client connection.
         Returns:
             MongoClient: MongoDB client instance.
         """
-        if self.mongo_client is None:
-            self.mongo_client = MongoClient(self.mongo_url)
-        return self.mongo_client
+        return self.resources.mongo_client
 
     def convert_to_ist(self, date_str):
         """Convert a date string to a datetime object adjusted to IST."""
@@ -51,7 +69,32 @@ class MongoExtractor:
 
     def load_collection_as_dataframe(self, collection_name: str) -> pd.DataFrame:
         """
-        Converts a MongoDB collection into a pandas DataFrame.
+        Converts a MongoDB collection into a pandas DataFrame. Nested documents stay
+        dicts and lists; see `load_collection_as_arrow_dataframe` for the columnar
+        path.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+
+        Returns:
+            pd.DataFrame: A DataFrame containing the MongoDB collection data.
+        """
+        chunks = list(self.iter_collection_chunks(collection_name))
+        if not chunks:
+            return pd.DataFrame()
+        df = pd.concat(chunks, ignore_index=True)
+        # Every chunk has categories of its own, which concat turns back into objects
+        for column, dtype in chunks[0].dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype("category")
+        return df
+
+    def load_collection_as_arrow_dataframe(self, collection_name: str) -> pd.DataFrame:
+        """
+        Reads a collection with a schema column by column through `ArrowExtractor`,
+        without building its documents in Python. Scalar columns have the same dtypes
+        as `load_collection_as_dataframe`, but nested documents come back as JSON
+        text, ready for a jsonb column, rather than as dicts and lists.
 
         Parameters:
             collection_name (str): The name of the MongoDB collection.
@@ -59,82 +102,590 @@ class MongoExtractor:
         Returns:
             pd.DataFrame: A DataFrame containing the MongoDB collection data.
         """
+        return ArrowExtractor(self.resources).load_collection_as_dataframe(
+            collection_name
+        )
+
+    def iter_collection_chunks(
+        self,
+        collection_name: str,
+        batch_size: int = None,
+        query: dict = None,
+        controller=None,
+    ):
+        """
+        Streams a MongoDB collection as fixed-size pandas DataFrame chunks.
+
+        The cursor fetches `batch_size` documents per round trip and each chunk is
+        built from one batch, so memory is bounded by the chunk size rather than by
+        the size of the collection.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+            batch_size (int): Documents per chunk; defaults to `extraction_batch_size`.
+            query (dict): Optional filter applied to the cursor.
+            controller (AdaptiveBatchSize): Chooses the size of every chunk instead of
+                                            `batch_size` (see `pipeline.adaptive`).
+
+        Yields:
+            pd.DataFrame: Up to `batch_size` documents, without the '_id' column.
+        """
+        batch_size = batch_size or (
+            controller.batch_size if controller else extraction_batch_size
+        )
+        cursor = self.db[collection_name].find(
+            query or {},
+            self.get_projection(collection_name),
+            batch_size=batch_size,
+        )
+        for _, df in self._iter_cursor_chunks(cursor, batch_size, controller):
+            yield df
+
+    def iter_collection_chunks_with_positions(
+        self,
+        collection_name: str,
+        batch_size: int = None,
+        query: dict = None,
+        start_after=None,
+        controller=None,
+        key: str = "_id",
+        extra_fields=(),
+    ):
+        """
+        Streams a MongoDB collection in `key` order as (source_position, DataFrame)
+        pairs, where the position is the `key` of the last document of the chunk.
+        Passing a position back as `start_after` continues right after that chunk,
+        which is what resumable loads use. `key` has to be unique and indexed, e.g.
+        `_id` or the collection's `unique_id_key_col`.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+            batch_size (int): Documents per chunk; defaults to `extraction_batch_size`.
+            query (dict): Optional filter applied to the cursor.
+            start_after: `_id` after which to start, or None for the beginning.
+            controller (AdaptiveBatchSize): Chooses the size of every chunk instead of
+                                            `batch_size` (see `pipeline.adaptive`).
+            key (str): The field the collection is ordered and positioned by.
+            extra_fields (list): Fields fetched besides the schema fields, e.g. the
+                                 nested documents of `NestedDocumentFlattener`.
+
+        Yields:
+            tuple: (last `key` of the chunk, DataFrame without the '_id' column)
+        """
+        batch_size = batch_size or (
+            controller.batch_size if controller else extraction_batch_size
+        )
+        query = dict(query or {})
+        if start_after is not None:
+            query = {"$and": [query, {key: {"$gt": start_after}}]}
+        cursor = (
+            self.db[collection_name]
+            .find(
+                query,
+                self.get_projection(collection_name, key, extra_fields),
+                batch_size=batch_size,
+            )
+            .sort(key, ASCENDING)
+        )
+        return self._iter_cursor_chunks(
+            cursor, batch_size, controller, key, extra_fields
+        )
+
+    def get_projection(self, collection_name: str, key: str = "_id", extra_fields=()):
+        """
+        Returns the projection of the collection's schema fields (plus `key` and
+        `extra_fields`) when chunks are built from `collection_schemas`, or None to
+        fetch every field.
+        """
+        if not (schema_typed_extraction and has_schema(collection_name)):
+            return None
+        return schema_projection(
+            collection_name, ([] if key == "_id" else [key]) + list(extra_fields)
+        )
+
+    def build_dataframe(
+        self, documents: list, collection_name: str, extra_fields=()
+    ) -> pd.DataFrame:
+        """
+        Builds a chunk with the compact dtypes of `collection_schemas` (see
+        `extraction.schema`), or lets pandas infer them for collections without a
+        schema or with `schema_typed_extraction` off.
+        """
+        if schema_typed_extraction and has_schema(collection_name):
+            return build_typed_dataframe(
+                documents, collection_name, extra_fields, self.resources.metrics
+            )
+        return pd.DataFrame(documents)
+
+    def compute_split_points(
+        self, collection_name: str, partitions: int, key: str = "_id"
+    ) -> list:
+        """
+        Picks `partitions - 1` values of `key` that split a collection into ranges of
+        about equal size, from the quantiles of a `$sample` of
+        `SPLIT_SAMPLES_PER_PARTITION` documents per partition. Small collections may
+        get fewer split points; an empty list means one range.
+        """
+        if partitions < 2:
+            return []
+        projection = {key: 1} if key == "_id" else {key: 1, "_id": 0}
+        values = sorted(
+            {
+                document[key]
+                for document in self.db[collection_name].aggregate(
+                    [
+                        {"$sample": {"size": partitions * SPLIT_SAMPLES_PER_PARTITION}},
+                        {"$project": projection},
+                    ]
+                )
+                if document.get(key) is not None
+            }
+        )
+        split_points = [
+            values[len(values) * index // partitions] for index in range(1, partitions)
+        ]
+        # Duplicates would make empty ranges
+        return sorted(set(split_points)) if values else []
+
+    @staticmethod
+    def partition_ranges(split_points: list, key: str = "_id") -> list:
+        """
+        Turns split points into one filter per range of `key`: [lowest, p1), [p1, p2),
+        ..., [pn, highest]. Documents without `key` match no range.
+
+        Returns:
+            list: (lower bound or None, upper bound or None, query) per range.
+        """
+        bounds = [None] + list(split_points) + [None]
+        ranges = []
+        for lower, upper in zip(bounds, bounds[1:]):
+            condition = {}
+            if lower is not None:
+                condition["$gte"] = lower
+            if upper is not None:
+                condition["$lt"] = upper
+            ranges.append((lower, upper, {key: condition or {"$exists": True}}))
+        return ranges
+
+    def _iter_cursor_chunks(
+        self,
+        cursor,
+        batch_size: int,
+        controller=None,
+        key: str = "_id",
+        extra_fields=(),
+        keep_id: bool = False,
+    ):
+        """
+        Turns a cursor into (last `key`, DataFrame) chunks of `batch_size` documents,
+        or of `controller.batch_size` documents when a controller is given. Fetching
+        and building each chunk is recorded as the "extract" stage and reported to
+        the controller. The '_id' column is dropped unless `keep_id` is set.
+        """
+        collection_name = cursor.collection.name
+        try:
+            while True:
+                if controller is not None:
+                    batch_size = controller.batch_size
+                started = time.perf_counter()
+                documents = list(islice(cursor, batch_size))
+                if not documents:
+                    break
+
+                df = self.build_dataframe(documents, collection_name, extra_fields)
+                last_id = documents[-1].get(key)
+
+                # Drop '_id' column if it exists
+                if "_id" in df.columns and not keep_id:
+                    df = df.drop(columns=["_id"])
+
+                elapsed = time.perf_counter() - started
+                chunk_bytes = frame_bytes(df)
+                self.resources.metrics.record(
+                    collection_name,
+                    "extract",
+                    len(df),
+                    elapsed,
+                    bytes_out=chunk_bytes,
+                )
+                if controller is not None:
+                    controller.observe("extract", len(df), elapsed, chunk_bytes)
+                yield last_id, df
+        finally:
+            cursor.close()
+
+    def ensure_timestamp_indexes(self, collection_name: str):
+        """
+        Creates the indexes the incremental load relies on: ascending (`added_at`,
+        `_id`) and (`modified_at`, `_id`) indexes, so watermark queries never scan
+        the collection, not even the documents sharing the watermark's timestamp.
+        """
         collection = self.db[collection_name]
-        data = list(collection.find())
-        df = pd.DataFrame(data)
+        collection.create_index(
+            [("added_at", ASCENDING), ("_id", ASCENDING)], name="added_at_1__id_1"
+        )
+        collection.create_index(
+            [("modified_at", ASCENDING), ("_id", ASCENDING)],
+            name="modified_at_1__id_1",
+        )
 
-        # Drop '_id' column if it exists
-        if "_id" in df.columns:
-            df = df.drop(columns=["_id"])
+    def get_latest_watermark(self, collection_name: str):
+        """
+        Returns the ((added_at, `_id`), (modified_at, `_id`)) watermark of the latest
+        document of a collection, taken before a full load so the incremental loads
+        continue from it (see `build_changed_documents_query`). A half is
+        (None, None) when no document has its field.
+        """
+        watermark = []
+        for field in ("added_at", "modified_at"):
+            latest = self.db[collection_name].find_one(
+                {field: {"$ne": None}},
+                {field: 1},
+                sort=[(field, DESCENDING), ("_id", DESCENDING)],
+            )
+            watermark.append((latest[field], latest["_id"]) if latest else (None, None))
+        return tuple(watermark)
 
-        return df
+    @staticmethod
+    def _after_watermark(field: str, since, after_id) -> dict:
+        if since is None:
+            return {field: {"$exists": True}}
+        if after_id is None:
+            return {field: {"$gte": since}}
+        return {
+            "$or": [{field: {"$gt": since}}, {field: since, "_id": {"$gt": after_id}}]
+        }
+
+    def build_changed_documents_query(
+        self,
+        since_added_at,
+        since_modified_at,
+        added_after_id=None,
+        modified_after_id=None,
+    ) -> dict:
+        """
+        Builds the filter for documents added or modified after the given watermarks.
+        A watermark is a (timestamp, `_id`) pair compared in that order: documents
+        that share the timestamp of the last loaded one but become visible later
+        (e.g. stamped with `fixed_date_ist` after the load, or written by the same
+        `insert_documents` call) are selected as long as their `_id` sorts after it.
+        Without an `_id`, e.g. for a watermark taken from the target table after a
+        full load, every document at the timestamp is selected again and upserted
+        idempotently. A missing watermark selects every document that carries that
+        timestamp.
+        """
+        return {
+            "$or": [
+                self._after_watermark("added_at", since_added_at, added_after_id),
+                self._after_watermark(
+                    "modified_at", since_modified_at, modified_after_id
+                ),
+            ]
+        }
+
+    def iter_changed_chunks(
+        self,
+        collection_name: str,
+        since_added_at,
+        since_modified_at,
+        batch_size: int = None,
+        controller=None,
+        added_after_id=None,
+        modified_after_id=None,
+    ):
+        """
+        Streams only the documents added or modified after the given watermarks, as
+        DataFrame chunks (see `iter_collection_chunks`) that keep their '_id'
+        column, from which the next watermarks are taken.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+            since_added_at (datetime): Last `added_at` already loaded, or None.
+            since_modified_at (datetime): Last `modified_at` already loaded, or None.
+            batch_size (int): Documents per chunk; defaults to `extraction_batch_size`.
+            controller (AdaptiveBatchSize): Chooses the size of every chunk instead.
+            added_after_id: Last `_id` loaded at `since_added_at`, or None.
+            modified_after_id: Last `_id` loaded at `since_modified_at`, or None.
+        """
+        batch_size = batch_size or (
+            controller.batch_size if controller else extraction_batch_size
+        )
+        query = self.build_changed_documents_query(
+            since_added_at, since_modified_at, added_after_id, modified_after_id
+        )
+        cursor = self.db[collection_name].find(
+            query,
+            self.get_projection(collection_name),
+            batch_size=batch_size,
+        )
+        for _, df in self._iter_cursor_chunks(
+            cursor, batch_size, controller, extra_fields=("_id",), keep_id=True
+        ):
+            yield df
 
     def insert_document(self, collection_name: str, date_keys: list, document: dict):
         """
         Inserts a document into the specified MongoDB collection if no document with the
-        same unique identifier exists.
+        same unique identifier exists (see `insert_documents`).
 
         Parameters:
             collection_name (str): The name of the MongoDB collection.
             date_keys (list): List of date keys to adjust time zones.
             document (dict): The document to insert into the collection.
+
+        Returns:
+            dict: The outcome of the insert, or None for an unknown collection.
         """
         print("Insertion of document has begun.")
-        config = unique_id_mapping.get(collection_name)
-        if not config:
+        if collection_name not in unique_id_mapping:
             print(
                 f"No configuration for collection '{collection_name}'. Document not inserted."
             )
-            return
-
-        unique_id_field = config["unique_id_key_col"]
-        collection = self.db[collection_name]
-
-        if unique_id_field in document:
-            if collection.find_one({unique_id_field: document[unique_id_field]}):
-                print(
-                    f"Document with {unique_id_field} = {document[unique_id_field]} already exists."
-                )
-                return
-
-        # Convert dates and set timestamps
-        for date_key in date_keys:
-            if date_key in document:
-                document[date_key] = self.convert_to_ist(document[date_key])
-
-        current_time_ist = datetime.now(timezone.utc)
-        document["added_at"] = current_time_ist
-        document["modified_at"] = current_time_ist
-
-        result = collection.insert_one(document)
-        print(f"Document inserted with ID: {result.inserted_id}")
+            return None
+        return self.insert_documents(collection_name, [document], date_keys)[0]
 
     def update_document(
         self, collection_name: str, date_keys: list, unique_id_value: int, update: dict
     ):
         """
-        Updates an existing document in the specified MongoDB collection.
+        Updates an existing document in the specified MongoDB collection (see
+        `update_documents`).
 
         Parameters:
             collection_name (str): The name of the MongoDB collection.
             unique_id_value (int): The unique identifier value of the document to update.
             update (dict): The updates to apply to the document.
+
+        Returns:
+            dict: The outcome of the update.
         """
-        collection = self.db[collection_name]
         unique_id_key_col = unique_id_mapping[collection_name]["unique_id_key_col"]
+        update = dict(update, **{unique_id_key_col: unique_id_value})
+        return self.update_documents(collection_name, [update], date_keys)[0]
+
+    def ensure_unique_index(self, collection_name: str):
+        """
+        Creates the unique index on the collection's `unique_id_key_col` that the
+        bulk writes rely on instead of checking for existing documents, under the
+        name `MongoSeeder.create_unique_indexes` uses. Fails if the collection
+        already holds duplicate keys.
+        """
+        if collection_name in self._unique_indexes:
+            return
+        key = unique_id_mapping[collection_name]["unique_id_key_col"]
+        self.db[collection_name].create_index(
+            [(key, ASCENDING)], unique=True, name=f"{key}_unique"
+        )
+        self._unique_indexes.add(collection_name)
 
-        update = collection.find_one({unique_id_key_col: update[unique_id_key_col]})
+    def convert_dates_to_ist(self, documents: list, date_keys: list) -> list:
+        """
+        Converts the `date_keys` of many documents in place the way `convert_to_ist`
+        does, parsing each key of the whole batch in one vectorized pass. Missing and
+        None values stay as they are.
 
-        # Convert dates and set timestamps
+        Returns:
+            list: Per document, None or the error of a date that could not be parsed.
+        """
+        errors = [None] * len(documents)
         for date_key in date_keys:
-            if date_key in update:
-                update[date_key] = self.convert_to_ist(update[date_key])
+            present = [
+                index
+                for index, document in enumerate(documents)
+                if document.get(date_key) is not None
+            ]
+            if not present:
+                continue
+            values = pd.Series(
+                [documents[index][date_key] for index in present], dtype=object
+            )
+            converted = (
+                pd.to_datetime(values, utc=True, errors="coerce", format="ISO8601")
+                + IST_OFFSET
+            )
+            for index, value in zip(present, converted.dt.to_pydatetime()):
+                document = documents[index]
+                if pd.isna(value):
+                    errors[index] = f"Invalid {date_key}: {document[date_key]!r}."
+                else:
+                    document[date_key] = value
+        return errors
+
+    def _prepare_documents(
+        self, collection_name: str, documents: list, date_keys: list
+    ) -> tuple:
+        """
+        Copies the documents, converts their dates and sets up one outcome per
+        document; documents without `unique_id_key_col` or with an invalid date are
+        marked invalid.
+
+        Returns:
+            tuple: (documents, outcomes, indexes of the valid documents)
+        """
+        if collection_name not in unique_id_mapping:
+            raise ValueError(f"No configuration for collection '{collection_name}'.")
+        key = unique_id_mapping[collection_name]["unique_id_key_col"]
+        if date_keys is None:
+            date_keys = collections_with_date_keys.get(collection_name, [])
+
+        documents = [dict(document) for document in documents]
+        outcomes = [{"unique_id": document.get(key)} for document in documents]
+        errors = self.convert_dates_to_ist(documents, date_keys)
+        valid = []
+        for index, (document, error) in enumerate(zip(documents, errors)):
+            if error is None and document.get(key) is None:
+                error = f"Missing {key}."
+            if error is None:
+                valid.append(index)
+            else:
+                outcomes[index].update(status="invalid", error=error)
+        return documents, outcomes, valid
+
+    @staticmethod
+    def _apply_write_errors(outcomes: list, positions: list, write_errors: list):
+        """Marks the documents of the failed operations of an unordered bulk write."""
+        for write_error in write_errors:
+            outcome = outcomes[positions[write_error["index"]]]
+            if write_error.get("code") == DUPLICATE_KEY_ERROR:
+                outcome["status"] = "duplicate"
+            else:
+                outcome.update(status="failed", error=write_error.get("errmsg"))
+
+    def _report_outcomes(self, action: str, collection_name: str, outcomes: list):
+        counts = Counter(outcome["status"] for outcome in outcomes)
+        summary = ", ".join(f"{count} {status}" for status, count in counts.items())
+        print(f"{action} {len(outcomes)} document(s) of {collection_name}: {summary}.")
+
+    def insert_documents(
+        self, collection_name: str, documents: list, date_keys: list = None
+    ) -> list:
+        """
+        Inserts many documents with one unordered `insert_many`. Instead of checking
+        for existing documents first, it relies on the unique index on
+        `unique_id_key_col` (created if missing): a document whose key exists is
+        rejected by the server and reported as a duplicate, while the others are
+        inserted. Dates are converted as in `convert_dates_to_ist` and every
+        inserted document gets the same `added_at` and `modified_at`. The given
+        documents are not modified.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+            documents (list): The documents to insert.
+            date_keys (list): Date keys to adjust; defaults to the collection's
+                              `collections_with_date_keys`.
+
+        Returns:
+            list: Per document, in order, a dict with its `unique_id` and `status`:
+                  "inserted", "duplicate", "invalid" or "failed" (with an `error`).
+        """
+        documents, outcomes, valid = self._prepare_documents(
+            collection_name, documents, date_keys
+        )
+        now = datetime.now(timezone.utc)
+        batch = []
+        for index in valid:
+            documents[index]["added_at"] = now
+            documents[index]["modified_at"] = now
+            outcomes[index]["status"] = "inserted"
+            batch.append(documents[index])
+
+        if batch:
+            self.ensure_unique_index(collection_name)
+            try:
+                self.db[collection_name].insert_many(batch, ordered=False)
+            except BulkWriteError as error:
+                self._apply_write_errors(
+                    outcomes, valid, error.details.get("writeErrors", [])
+                )
+        self._report_outcomes("Inserted", collection_name, outcomes)
+        return outcomes
+
+    def update_documents(
+        self,
+        collection_name: str,
+        updates: list,
+        date_keys: list = None,
+        upsert: bool = False,
+    ) -> list:
+        """
+        Applies many updates with one unordered `bulk_write`. Each update holds the
+        `unique_id_key_col` of its document and the fields to `$set`; `added_at` is
+        left as it is. Dates are converted as in `convert_dates_to_ist` and every
+        updated document gets the same `modified_at`. With `upsert`, an update whose
+        document does not exist inserts it, with `added_at` set as well.
+
+        Only when fewer documents matched than were updated, one more query finds
+        which keys do not exist.
+
+        Parameters:
+            collection_name (str): The name of the MongoDB collection.
+            updates (list): Fields to set, each with the document's unique key.
+            date_keys (list): Date keys to adjust; defaults to the collection's
+                              `collections_with_date_keys`.
+            upsert (bool): Insert the documents that do not exist.
+
+        Returns:
+            list: Per update, in order, a dict with its `unique_id` and `status`:
+                  "updated", "inserted" (upserted), "not_found", "duplicate",
+                  "invalid" or "failed" (with an `error`).
+        """
+        key = unique_id_mapping.get(collection_name, {}).get("unique_id_key_col")
+        updates, outcomes, valid = self._prepare_documents(
+            collection_name, updates, date_keys
+        )
+        now = datetime.now(timezone.utc)
+        operations = []
+        for index in valid:
+            fields = {
+                field: value
+                for field, value in updates[index].items()
+                if field not in ("_id", key, "added_at")
+            }
+            fields["modified_at"] = now
+            operation = {"$set": fields}
+            if upsert:
+                operation["$setOnInsert"] = {"added_at": now}
+            operations.append(
+                UpdateOne({key: updates[index][key]}, operation, upsert=upsert)
+            )
+
+        if operations:
+            self.ensure_unique_index(collection_name)
+            collection = self.db[collection_name]
+            try:
+                result = collection.bulk_write(operations, ordered=False)
+                matched, upserted, write_errors = (
+                    result.matched_count,
+                    result.upserted_ids,
+                    [],
+                )
+            except BulkWriteError as error:
+                matched = error.details.get("nMatched", 0)
+                upserted = {
+                    entry["index"]: entry["_id"]
+                    for entry in error.details.get("upserted", [])
+                }
+                write_errors = error.details.get("writeErrors", [])
 
-        query = {unique_id_key_col: unique_id_value}
-        update["modified_at"] = datetime.now(timezone.utc)
+            for index in valid:
+                outcomes[index]["status"] = "updated"
+            for position in upserted:
+                outcomes[valid[position]]["status"] = "inserted"
+            self._apply_write_errors(outcomes, valid, write_errors)
 
-        result = collection.update_one(query, {"$set": update})
-        if result.matched_count > 0:
-            print(f"Document updated: {result.modified_count} document(s) modified.")
-        else:
-            print("No document found matching the query.")
+            applied = [
+                outcome for outcome in outcomes if outcome.get("status") == "updated"
+            ]
+            if matched < len(applied):
+                found = {
+                    document[key]
+                    for document in collection.find(
+                        {key: {"$in": [outcome["unique_id"] for outcome in applied]}},
+                        {key: 1, "_id": 0},
+                    )
+                }
+                for outcome in applied:
+                    if outcome["unique_id"] not in found:
+                        outcome["status"] = "not_found"
+        self._report_outcomes("Updated", collection_name, outcomes)
+        return outcomes
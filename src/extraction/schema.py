@@ -0,0 +1,163 @@
+# schema.py
+"""
+Typed DataFrame construction from the field/type registry `collection_schemas`: the
+projection pushed down to MongoDB and the compact pandas dtype of every field.
+"""
+
+import numpy as np
+import pandas as pd
+
+from config import collection_schemas
+
+# pandas dtype of each schema type. Integers are nullable, so a missing value never
+# turns an 18-digit id into a float; low-cardinality strings are categoricals.
+PANDAS_DTYPES = {
+    "int32": pd.Int32Dtype(),
+    "int64": pd.Int64Dtype(),
+    "float64": "float64",
+    "bool": pd.BooleanDtype(),
+    "category": "category",
+    "string": object,
+    "object": object,
+}
+
+NUMERIC_TYPES = ("int32", "int64", "float64")
+
+
+def has_schema(collection_name: str) -> bool:
+    return collection_name in collection_schemas
+
+
+def schema_projection(collection_name: str, extra_fields=()) -> dict:
+    """
+    Returns the `find` projection of a collection's schema fields plus `extra_fields`
+    (e.g. the key a scan is positioned by). `_id` is always returned by MongoDB.
+    """
+    fields = list(collection_schemas[collection_name]) + list(extra_fields)
+    return {field: 1 for field in fields}
+
+
+def to_naive_utc(column: pd.Series) -> pd.Series:
+    """
+    Converts a date column the way `Transformer.normalize_date_columns` does, which
+    then skips it: aware datetimes are converted to UTC, strings are parsed as ISO
+    8601 and unparsable values become NaT (see `record_coerced_values`), giving naive
+    UTC `datetime64[ns]`.
+    """
+    if isinstance(column.dtype, pd.DatetimeTZDtype):
+        return column.dt.tz_convert(None)
+    if pd.api.types.is_datetime64_dtype(column):
+        return column
+    return pd.to_datetime(
+        column, utc=True, errors="coerce", format="ISO8601"
+    ).dt.tz_localize(None)
+
+
+def record_coerced_values(
+    metrics, collection_name: str, column_name: str, original, converted
+) -> int:
+    """
+    Counts the values of a column that were present but could not be converted to
+    its type (unparsable dates, non-numbers in numeric columns), so they became
+    NaT or NA and will be loaded as NULL. A non-zero count is added to `metrics`
+    (see `PipelineMetrics.record_coerced`) and printed as a warning.
+
+    Returns:
+        int: The number of coerced values.
+    """
+    coerced = int((pd.Series(original).notna() & pd.Series(converted).isna()).sum())
+    if coerced:
+        metrics.record_coerced(collection_name, column_name, coerced)
+        print(
+            f"Warning: {coerced} unparsable value(s) in "
+            f"{collection_name}.{column_name} loaded as NULL."
+        )
+    return coerced
+
+
+def coerce_numeric(values: list, field_type: str) -> pd.Series:
+    """
+    Converts the values of a numeric column that do not all fit its type: numbers
+    and numeric strings are kept, anything else becomes NA, as do fractions and
+    out-of-range values in integer columns. Integers are never routed through
+    float64, so 18-digit ids keep every digit.
+    """
+    column = pd.Series(values, dtype=object)
+    if field_type == "float64":
+        return pd.to_numeric(column, errors="coerce").astype("float64")
+    bounds = np.iinfo(field_type)
+    is_integer = column.map(
+        lambda value: isinstance(value, (int, np.integer))
+        and not isinstance(value, (bool, np.bool_))
+    ).astype(bool)
+    integers = column[is_integer].map(int)
+    integers = integers[(integers >= bounds.min) & (integers <= bounds.max)]
+    parsed = pd.to_numeric(column[~is_integer], errors="coerce").astype("float64")
+    parsed = parsed[(parsed % 1 == 0) & parsed.between(bounds.min, bounds.max)]
+    converted = pd.Series(None, index=column.index, dtype=object)
+    converted[integers.index] = integers
+    converted[parsed.index] = parsed.map(int)
+    return pd.Series(pd.array(converted.tolist(), dtype=PANDAS_DTYPES[field_type]))
+
+
+def build_column(
+    values: list,
+    field_type: str,
+    metrics=None,
+    collection_name: str = None,
+    column_name: str = None,
+) -> pd.Series:
+    """
+    Builds one column with the dtype of `field_type`. Values that do not fit a
+    numeric type become NA (see `coerce_numeric`) and are counted in `metrics`, if
+    given (see `record_coerced_values`); other types fall back to inference, so a
+    bad document never fails the load.
+    """
+    try:
+        return pd.Series(pd.array(values, dtype=PANDAS_DTYPES[field_type]))
+    except (TypeError, ValueError, OverflowError):
+        if field_type not in NUMERIC_TYPES:
+            return pd.Series(values)
+    column = coerce_numeric(values, field_type)
+    if metrics is not None:
+        record_coerced_values(metrics, collection_name, column_name, values, column)
+    return column
+
+
+def build_typed_dataframe(
+    documents: list, collection_name: str, extra_fields=(), metrics=None
+) -> pd.DataFrame:
+    """
+    Builds a chunk column by column from the schema of its collection, with explicit
+    compact dtypes: nullable integers and booleans, categoricals, float64 and naive
+    UTC datetime64. Every schema field becomes a column (missing fields are
+    all-null); `extra_fields` (e.g. nested documents to flatten) are kept as
+    objects, and other fields, including `_id`, are left out. Unparsable dates and
+    non-numbers in numeric fields are counted in `metrics`, if given (see
+    `record_coerced_values`).
+    """
+    schema = dict(collection_schemas[collection_name])
+    for field in extra_fields:
+        schema.setdefault(field, "object")
+    # pandas decodes datetimes faster row-wise than from one list per column
+    date_fields = [
+        field for field, field_type in schema.items() if field_type == "datetime"
+    ]
+    dates = pd.DataFrame(documents, columns=date_fields)
+    columns = {}
+    for field, field_type in schema.items():
+        if field_type == "datetime":
+            columns[field] = to_naive_utc(dates[field])
+            if metrics is not None:
+                record_coerced_values(
+                    metrics, collection_name, field, dates[field], columns[field]
+                )
+        else:
+            columns[field] = build_column(
+                [document.get(field) for document in documents],
+                field_type,
+                metrics,
+                collection_name,
+                field,
+            )
+    return pd.DataFrame(columns)
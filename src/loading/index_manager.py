@@ -0,0 +1,508 @@
+# index_manager.py
+
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from psycopg2 import sql
+
+from config import (
+    deferred_index_state_table,
+    index_rebuild_workers,
+    index_build_session_settings,
+)
+
+_INDEX_DEFINITION = re.compile(
+    r"^(CREATE (?:UNIQUE )?INDEX )(\S+)( ON (?:ONLY )?)(\S+)( .*)$", re.DOTALL
+)
+
+
+def retarget_index(definition: str, index_name: str, table_name: str):
+    """Rewrites a `pg_get_indexdef` statement to create the index on another table."""
+    match = _INDEX_DEFINITION.match(definition)
+    if match is None:
+        raise ValueError(f"Unexpected index definition: {definition}")
+    return sql.Composed(
+        [
+            sql.SQL(match.group(1)),
+            sql.Identifier(index_name),
+            sql.SQL(match.group(3)),
+            sql.Identifier(table_name),
+            sql.SQL(match.group(5)),
+        ]
+    )
+
+
+def retarget_reference(definition: str, referenced: str, table_name: str):
+    """Rewrites a foreign key definition to reference `table_name` instead."""
+    before, found, after = definition.partition(f"REFERENCES {referenced}(")
+    if not found:
+        raise ValueError(f"Unexpected foreign key definition: {definition}")
+    return sql.Composed(
+        [
+            sql.SQL(before + "REFERENCES "),
+            sql.Identifier(table_name),
+            sql.SQL("(" + after),
+        ]
+    )
+
+
+class IndexManager:
+    def __init__(
+        self,
+        resource_manager,
+        max_workers: int = index_rebuild_workers,
+        session_settings: dict = index_build_session_settings,
+    ):
+        """
+        Initializes the IndexManager class.
+
+        Captures the indexes and constraints of the target tables so a bulk load can
+        run without them, and rebuilds them afterwards: tables are rebuilt
+        concurrently (one worker and pooled connection per table, statements on the
+        same table in sequence, since adding a key locks the table), with the session
+        settings in `index_build_session_settings`. Foreign keys are added NOT VALID
+        and then validated in bulk. Every build is timed.
+        """
+        self.resources = resource_manager
+        self.max_workers = max_workers
+        self.session_settings = session_settings
+
+    def get_table_definitions(self, cursor, table_name: str) -> dict:
+        """
+        Reads the indexes and constraints of a table from the catalog.
+
+        Returns:
+            dict: "constraints" as (name, type, definition, referenced table) tuples,
+                  "indexes" as (name, definition) tuples for indexes that do not
+                  back a constraint, and "sequences" as (sequence, column) tuples
+                  for the serial sequences owned by the table.
+        """
+        cursor.execute(
+            """
+            SELECT conname, contype, pg_get_constraintdef(oid),
+                   CASE WHEN contype = 'f' THEN confrelid::regclass::text END
+            FROM pg_constraint
+            WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'x', 'c', 'f')
+            ORDER BY conname
+            """,
+            (table_name,),
+        )
+        constraints = cursor.fetchall()
+
+        cursor.execute(
+            """
+            SELECT i.relname, pg_get_indexdef(i.oid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            WHERE x.indrelid = %s::regclass
+              AND NOT EXISTS (
+                  SELECT 1 FROM pg_constraint c
+                  WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid
+                    AND c.contype IN ('p', 'u', 'x')
+              )
+            ORDER BY i.relname
+            """,
+            (table_name,),
+        )
+        indexes = cursor.fetchall()
+
+        cursor.execute(
+            """
+            SELECT s.oid::regclass::text, a.attname
+            FROM pg_depend d
+            JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+            JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+            WHERE d.refobjid = %s::regclass AND d.deptype = 'a'
+            """,
+            (table_name,),
+        )
+        sequences = cursor.fetchall()
+
+        return {"constraints": constraints, "indexes": indexes, "sequences": sequences}
+
+    def get_referencing_foreign_keys(self, cursor, table_name: str, table_names: list):
+        """
+        Returns the foreign keys of tables outside `table_names` that reference
+        `table_name`, as (table, name, definition) tuples. They have to go before
+        the referenced key can be dropped.
+        """
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE contype = 'f' AND confrelid = %s::regclass
+              AND NOT conrelid = ANY(%s::regclass[])
+            ORDER BY conname
+            """,
+            (table_name, table_names),
+        )
+        return cursor.fetchall()
+
+    def capture_definitions(self, table_names: list) -> dict:
+        """Reads the definitions of several tables, keyed by table name."""
+        definitions = {}
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for table_name in table_names:
+                    definitions[table_name] = self.get_table_definitions(
+                        cursor, table_name
+                    )
+                    definitions[table_name][
+                        "referencing_foreign_keys"
+                    ] = self.get_referencing_foreign_keys(
+                        cursor, table_name, table_names
+                    )
+        return definitions
+
+    def ensure_state_table(self):
+        """
+        Creates the state table holding the definitions of dropped indexes and
+        constraints, so an interrupted load can still restore them.
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {} (
+                            table_name VARCHAR PRIMARY KEY,
+                            definitions JSONB NOT NULL,
+                            deferred_at TIMESTAMP NOT NULL DEFAULT now()
+                        )
+                        """
+                    ).format(sql.Identifier(deferred_index_state_table))
+                )
+                connection.commit()
+
+    def get_deferred_definitions(self) -> dict:
+        """Returns the saved definitions of every table whose indexes are dropped."""
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("SELECT table_name, definitions FROM {}").format(
+                        sql.Identifier(deferred_index_state_table)
+                    )
+                )
+                return dict(cursor.fetchall())
+
+    def drop_indexes(self, table_names: list) -> dict:
+        """
+        Saves the definitions of the indexes and constraints of the tables, then
+        drops them in one transaction: foreign keys first (including those of other
+        tables referencing these), then keys and check constraints, then indexes.
+        Tables whose definitions are already saved by an interrupted run keep them.
+
+        Returns:
+            dict: The definitions to pass to `restore_indexes`, keyed by table name.
+        """
+        self.ensure_state_table()
+        definitions = {
+            table_name: saved
+            for table_name, saved in self.get_deferred_definitions().items()
+            if table_name in table_names
+        }
+        missing = [name for name in table_names if name not in definitions]
+        definitions.update(self.capture_definitions(missing))
+
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for table_name in missing:
+                    cursor.execute(
+                        sql.SQL(
+                            "INSERT INTO {} (table_name, definitions) VALUES (%s, %s)"
+                        ).format(sql.Identifier(deferred_index_state_table)),
+                        (table_name, json.dumps(definitions[table_name])),
+                    )
+                connection.commit()
+
+                # Every table, in case an interrupted run saved but did not drop
+                for table_name in table_names:
+                    for table, name, _ in definitions[table_name][
+                        "referencing_foreign_keys"
+                    ]:
+                        cursor.execute(
+                            sql.SQL(
+                                "ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}"
+                            ).format(sql.SQL(table), sql.Identifier(name))
+                        )
+                    for name, contype, *_ in definitions[table_name]["constraints"]:
+                        if contype == "f":
+                            cursor.execute(
+                                sql.SQL(
+                                    "ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}"
+                                ).format(
+                                    sql.Identifier(table_name), sql.Identifier(name)
+                                )
+                            )
+                for table_name in table_names:
+                    for name, contype, *_ in definitions[table_name]["constraints"]:
+                        if contype != "f":
+                            cursor.execute(
+                                sql.SQL(
+                                    "ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}"
+                                ).format(
+                                    sql.Identifier(table_name), sql.Identifier(name)
+                                )
+                            )
+                    for name, _ in definitions[table_name]["indexes"]:
+                        cursor.execute(
+                            sql.SQL("DROP INDEX IF EXISTS {}").format(
+                                sql.Identifier(name)
+                            )
+                        )
+                connection.commit()
+
+        print(f"Dropped indexes and constraints of {len(table_names)} tables.")
+        return definitions
+
+    def _run_table_statements(self, table_name: str, statements: list) -> list:
+        """
+        Runs the statements of one table in sequence on its own pooled connection,
+        each in a transaction with the build session settings.
+
+        Returns:
+            list: One timing dict per statement.
+        """
+        timings = []
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for name, kind, statement in statements:
+                    started = time.monotonic()
+                    for setting, value in self.session_settings.items():
+                        cursor.execute(
+                            sql.SQL("SET LOCAL {} = {}").format(
+                                sql.Identifier(setting), sql.Literal(value)
+                            )
+                        )
+                    cursor.execute(statement)
+                    connection.commit()
+                    seconds = time.monotonic() - started
+                    print(f"Built {kind} {name} on {table_name} in {seconds:.2f}s.")
+                    timings.append(
+                        {
+                            "table": table_name,
+                            "name": name,
+                            "kind": kind,
+                            "seconds": round(seconds, 3),
+                        }
+                    )
+        return timings
+
+    def _run_concurrently(self, statements_by_table: dict) -> list:
+        """
+        Runs the statement lists of all tables concurrently. Every table is finished
+        even if another one fails; the failures are raised together at the end.
+        """
+        timings, failures = [], {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self._run_table_statements, table, statements): table
+                for table, statements in statements_by_table.items()
+                if statements
+            }
+            for future, table in futures.items():
+                try:
+                    timings.extend(future.result())
+                except Exception as error:
+                    print(f"Rebuilding indexes of {table} failed: {error}")
+                    failures[table] = error
+        if failures:
+            raise RuntimeError(f"Index rebuild failed for tables: {failures}")
+        return timings
+
+    def rebuild(
+        self,
+        definitions: dict,
+        targets: dict = None,
+        name_suffix: str = "",
+        extra_statements: dict = None,
+    ) -> list:
+        """
+        Recreates captured indexes and constraints, concurrently across tables.
+
+        Parameters:
+            definitions (dict): Definitions keyed by table, from `capture_definitions`.
+            targets (dict): Table to build on for each captured table, e.g. its staging
+                            table; defaults to the captured table itself. Foreign keys
+                            referencing a captured table point at its target.
+            name_suffix (str): Appended to every index and constraint name.
+            extra_statements (dict): (name, kind, statement) tuples to run on a table's
+                                     connection before its indexes are built.
+
+        Returns:
+            list: Timings per index and constraint, as dicts with "table", "name",
+                  "kind" and "seconds".
+        """
+        targets = targets or {name: name for name in definitions}
+        extra_statements = extra_statements or {}
+
+        statements_by_table = {}
+        for table_name, table_definitions in definitions.items():
+            target = targets[table_name]
+            statements = list(extra_statements.get(table_name, []))
+            # Keys first, so unique indexes exist before plain ones compete for memory
+            for name, contype, definition, _ in table_definitions["constraints"]:
+                if contype == "f":
+                    continue
+                statements.append(
+                    (
+                        name + name_suffix,
+                        "constraint",
+                        sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                            sql.Identifier(target), sql.Identifier(name + name_suffix)
+                        )
+                        + sql.SQL(definition),
+                    )
+                )
+            for name, definition in table_definitions["indexes"]:
+                statements.append(
+                    (
+                        name + name_suffix,
+                        "index",
+                        retarget_index(definition, name + name_suffix, target),
+                    )
+                )
+            statements.append(
+                (
+                    "statistics",
+                    "analyze",
+                    sql.SQL("ANALYZE {}").format(sql.Identifier(target)),
+                )
+            )
+            statements_by_table[target] = statements
+
+        timings = self._run_concurrently(statements_by_table)
+        timings += self.rebuild_foreign_keys(definitions, targets, name_suffix)
+        return timings
+
+    def rebuild_foreign_keys(
+        self, definitions: dict, targets: dict, name_suffix: str = ""
+    ) -> list:
+        """
+        Adds the captured foreign keys NOT VALID, which is immediate, then validates
+        them concurrently per referencing table, which checks the rows in bulk with
+        no lock that blocks reads or writes of the referenced tables.
+
+        Returns:
+            list: Timings of the validations.
+        """
+        foreign_keys = []
+        for table_name, table_definitions in definitions.items():
+            for name, contype, definition, referenced in table_definitions[
+                "constraints"
+            ]:
+                if contype != "f":
+                    continue
+                referenced_table = referenced.split(".")[-1].strip('"')
+                if referenced_table in targets:
+                    definition = retarget_reference(
+                        definition, referenced, targets[referenced_table]
+                    )
+                else:
+                    definition = sql.SQL(definition)
+                foreign_keys.append(
+                    (
+                        sql.Identifier(targets[table_name]),
+                        targets[table_name],
+                        name + name_suffix,
+                        definition,
+                    )
+                )
+            # Keys of tables outside the rebuild reference the table by its own name
+            for table, name, definition in table_definitions.get(
+                "referencing_foreign_keys", []
+            ):
+                foreign_keys.append((sql.SQL(table), table, name, sql.SQL(definition)))
+
+        statements_by_table = {}
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for table, table_name, name, definition in foreign_keys:
+                    cursor.execute(
+                        sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                            table, sql.Identifier(name)
+                        )
+                        + definition
+                        + sql.SQL(" NOT VALID")
+                    )
+                    statements_by_table.setdefault(table_name, []).append(
+                        (
+                            name,
+                            "foreign key",
+                            sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(
+                                table, sql.Identifier(name)
+                            ),
+                        )
+                    )
+                connection.commit()
+
+        return self._run_concurrently(statements_by_table)
+
+    def restore_indexes(self, definitions: dict) -> list:
+        """
+        Rebuilds the indexes and constraints dropped by `drop_indexes` and forgets
+        their saved definitions.
+
+        Returns:
+            list: Timings per index and constraint.
+        """
+        started = time.monotonic()
+        timings = self.rebuild(definitions)
+
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("DELETE FROM {} WHERE table_name = ANY(%s)").format(
+                        sql.Identifier(deferred_index_state_table)
+                    ),
+                    (list(definitions),),
+                )
+                connection.commit()
+
+        print(
+            f"Rebuilt {len(timings)} indexes and constraints on {len(definitions)} "
+            f"tables in {time.monotonic() - started:.2f}s."
+        )
+        return timings
+
+    @contextmanager
+    def deferred_indexes(self, table_names: list):
+        """
+        Runs the block with the indexes and constraints of the tables dropped, and
+        rebuilds them once it finishes, also when it fails. If the rebuild after a
+        failure fails too, that is printed and the block's error is raised.
+        """
+        definitions = self.drop_indexes(table_names)
+        try:
+            yield definitions
+        except BaseException:
+            # A failed rebuild must not hide why the block failed; the definitions
+            # stay saved until a rebuild succeeds
+            try:
+                self.restore_indexes(definitions)
+            except Exception as error:
+                print(
+                    f"Could not rebuild the indexes of {', '.join(definitions)}: "
+                    f"{error}. Their definitions are kept in "
+                    f"{deferred_index_state_table}."
+                )
+            raise
+        self.restore_indexes(definitions)
+
+    def non_empty_tables(self, table_names: list) -> list:
+        """Returns the tables that hold at least one row."""
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                non_empty = []
+                for table_name in table_names:
+                    cursor.execute(
+                        sql.SQL("SELECT EXISTS (SELECT 1 FROM {})").format(
+                            sql.Identifier(table_name)
+                        )
+                    )
+                    if cursor.fetchone()[0]:
+                        non_empty.append(table_name)
+        return non_empty
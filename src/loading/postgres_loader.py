@@ -1,75 +1,558 @@
-import os
+import io
 import json
+import time
+from contextlib import nullcontext
 import psycopg2
+import numpy as np
 import pandas as pd
 from psycopg2 import sql
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from psycopg2.extras import Json, execute_values
+from bson import json_util
+
+from connections.resource_manager import ResourceManager, get_resource_manager
+from pipeline.metrics import frame_bytes
 
 from config import (
     unique_id_mapping,
     fixed_date_ist,
     collections_with_date_keys,
     collections,
+    load_methods,
+    default_load_method,
+    watermark_table,
+    cdc_state_table,
+    cdc_document_keys_table,
+    cdc_dead_letter_table,
+    checkpoint_table,
+    staging_table_suffix,
+    executemany_batch_size,
 )
 
+# NULL marker used by the COPY load path; empty strings stay empty strings.
+COPY_NULL = "\\N"
+# Bytes handed to psycopg2 per read while streaming a COPY.
+COPY_READ_SIZE = 1 << 20
+
+
+def _dumps_json(value) -> str:
+    return json.dumps(value, default=str)
+
+
+def _collection_for_table(table_name: str) -> str:
+    """Returns the collection loaded into a (staging) table, for metrics; else the table."""
+    if table_name.endswith(staging_table_suffix):
+        table_name = table_name[: -len(staging_table_suffix)]
+    for collection_name, mapping in unique_id_mapping.items():
+        if mapping["table_name"] == table_name:
+            return collection_name
+    return table_name
+
+
+class JsonText(str):
+    """
+    JSON text that is already encoded, e.g. by another process, and is written to a
+    jsonb column as it is. Plain strings are values and get encoded.
+    """
+
+
+def _to_json_text(value):
+    """
+    Serialises a value for a jsonb column: documents, arrays, strings, numbers and
+    booleans are encoded as JSON, `JsonText` is kept as it is, and None, NaN, NaT
+    and pd.NA become NULL.
+    """
+    if isinstance(value, JsonText):
+        return value
+    if isinstance(value, (dict, list)):
+        return _dumps_json(value)
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    return _dumps_json(value)
+
+
+class DataFrameCopyStream:
+    """
+    File-like reader that renders a DataFrame as CSV for `cursor.copy_expert`.
+
+    Rows are rendered `rows_per_slice` at a time, so only one slice of CSV text is
+    held in memory. NULLs, NaN and NaT are written as `COPY_NULL`, booleans as
+    PostgreSQL literals, integral float columns (integers upcast by missing values)
+    as integers, and `json_columns` as JSON text for jsonb columns. `bytes_written`
+    counts the CSV bytes rendered so far.
+    """
+
+    def __init__(
+        self, df: pd.DataFrame, json_columns: list = [], rows_per_slice: int = 10000
+    ):
+        self.df = df
+        self.json_columns = [col for col in json_columns if col in df.columns]
+        self.rows_per_slice = rows_per_slice
+        self.rows_written = 0
+        self.bytes_written = 0
+        self._buffer = b""
+        self._offset = 0
+
+    def _render_next_slice(self) -> bytes:
+        frame = self.df.iloc[self.rows_written : self.rows_written + self.rows_per_slice]
+        columns = {}
+        for column in frame.columns:
+            series = frame[column]
+            if column in self.json_columns:
+                series = series.map(_to_json_text)
+            elif pd.api.types.is_bool_dtype(series):
+                series = series.map({True: "true", False: "false"})
+            elif pd.api.types.is_float_dtype(series):
+                values = series.dropna()
+                if len(values) and (values % 1 == 0).all():
+                    series = series.astype("Int64")
+            columns[column] = series
+        self.rows_written += len(frame)
+        rendered = (
+            pd.DataFrame(columns, index=frame.index)
+            .to_csv(header=False, index=False, na_rep=COPY_NULL)
+            .encode("utf-8")
+        )
+        self.bytes_written += len(rendered)
+        return rendered
+
+    def read(self, size: int = -1) -> bytes:
+        if self._offset >= len(self._buffer):
+            self._buffer, self._offset = b"", 0
+            while not self._buffer and self.rows_written < len(self.df):
+                self._buffer = self._render_next_slice()
+        if size is None or size < 0:
+            size = len(self._buffer) - self._offset
+        chunk = self._buffer[self._offset : self._offset + size]
+        self._offset += len(chunk)
+        return chunk
+
+
+class RenderedCopyChunk:
+    """
+    A DataFrame chunk already rendered as the CSV payload of its COPY (see
+    `PostgresLoader.render_copy_chunk`). Date, NULL and JSON handling are done, so
+    loading it only streams bytes. `frame_bytes` is the size of the DataFrame it
+    was rendered from.
+    """
+
+    def __init__(self, columns: list, payload: bytes, rows: int, frame_bytes: int):
+        self.columns = columns
+        self.payload = payload
+        self.rows_written = rows
+        self.bytes_written = len(payload)
+        self.frame_bytes = frame_bytes
+
+    def __len__(self) -> int:
+        return self.rows_written
+
+
+class FlattenedChunk:
+    """
+    A chunk of a collection's own table together with the rows its nested documents
+    were flattened into (see `NestedDocumentFlattener`): `related` holds a
+    (table_name, DataFrame, json_columns) triple per child or parent table, and
+    `writers` are called with the chunk's cursor before the chunk itself is written
+    (e.g. to insert the new dimension members it refers to). Everything runs in the
+    transaction of the chunk, so it commits with it and with its checkpoint, after
+    which `committed` calls `on_commit`. `frame` may be a DataFrame or a
+    `RenderedCopyChunk`.
+    """
+
+    def __init__(self, frame, related: list, writers: list = (), on_commit: list = ()):
+        self.frame = frame
+        self.related = related
+        self.writers = list(writers)
+        self.on_commit = list(on_commit)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def with_frame(self, frame) -> "FlattenedChunk":
+        """Returns the same related rows with another frame, e.g. its rendering."""
+        return FlattenedChunk(frame, self.related, self.writers, self.on_commit)
+
+    def committed(self):
+        for callback in self.on_commit:
+            callback()
+
 
 class PostgresLoader:
-    def __init__(self):
+    def __init__(self, resource_manager: ResourceManager = None):
         """
         Initializes the PostgresLoader class.
-        Loads environment variables and sets up MongoDB and PostgreSQL connection parameters.
+        Uses the MongoClient and PostgreSQL connection pool owned by the shared
+        ResourceManager, so no connection is opened per call.
+
+        Parameters:
+        resource_manager (ResourceManager): Defaults to the process-wide instance.
         """
-        load_dotenv()
+        self.resources = resource_manager or get_resource_manager()
 
         # MongoDB parameters
-        self.mongo_url = os.getenv("MONGO_DB_URL")
-        self.mongo_db_database_name = os.getenv("MONGODB_DB_NAME")
-        self.mongo_client = MongoClient(self.mongo_url)
-        self.db = self.mongo_client[self.mongo_db_database_name]
-
-        # PostgreSQL parameters
-        self.pg_database = os.getenv("PG_DATABASE")
-        self.pg_user = os.getenv("PG_USER")
-        self.pg_password = os.getenv("PG_PASSWORD")
-        self.pg_host = os.getenv("PG_HOST")
-        self.pg_port = os.getenv("PG_PORT")
-        self.pg_connection = self.create_pg_connection()
+        self.mongo_client = self.resources.mongo_client
+        self.db = self.resources.mongo_db
 
     def create_pg_connection(self):
-        """Establishes a connection to PostgreSQL."""
+        """
+        Establishes a dedicated connection to PostgreSQL, outside the shared pool.
+        The caller closes it.
+        """
         try:
-            connection = psycopg2.connect(
-                database=self.pg_database,
-                user=self.pg_user,
-                password=self.pg_password,
-                host=self.pg_host,
-                port=self.pg_port,
-            )
+            connection = self.resources.connect_pg()
             print("PostgreSQL connection established successfully.")
             return connection
         except psycopg2.Error as e:
             print(f"Error connecting to PostgreSQL: {e}")
             return None
 
+    def get_load_method(self, table_name: str) -> str:
+        """
+        Returns the load method configured for a PostgreSQL table in `unique_id_mapping`,
+        falling back to `default_load_method` for tables that are not listed there.
+        """
+        for mapping in unique_id_mapping.values():
+            if mapping["table_name"] == table_name:
+                return mapping.get("load_method", default_load_method)
+        return default_load_method
+
     def load_dataframe_to_postgres(
-        self, df: pd.DataFrame, table_name: str, json_columns: list = []
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        json_columns: list = [],
+        method: str = None,
     ):
-        connection = self.create_pg_connection()
-        if not connection:
-            print("Failed to establish database connection.")
-            return
+        """
+        Loads a pandas DataFrame into the specified PostgreSQL table.
+
+        Parameters:
+        df (pd.DataFrame): The rows to insert.
+        table_name (str): The name of the PostgreSQL table to load into.
+        json_columns (list): Columns holding dicts/lists that are written as jsonb.
+        method (str): "copy" or "executemany"; defaults to the table's `load_method`.
+        """
+        return self.load_chunks_to_postgres([df], table_name, json_columns, method)
 
-        cursor = connection.cursor()
-        connection.set_session(autocommit=True)  # Ensure autocommit is enabled
+    def load_chunks_to_postgres(
+        self,
+        chunks,
+        table_name: str,
+        json_columns: list = [],
+        method: str = None,
+        raise_on_error: bool = False,
+        checkpoint_name: str = None,
+        resume_from: dict = None,
+        controller=None,
+    ) -> int:
+        """
+        Loads an iterable of DataFrame chunks (e.g. `MongoExtractor.iter_collection_chunks`)
+        into the specified PostgreSQL table over one pooled connection, committing per chunk.
+        Chunks are consumed lazily, so only one chunk is held in memory at a time.
 
+        With the "copy" method, chunks may also be `RenderedCopyChunk`s from
+        `render_copy_chunk`, e.g. rendered by the transform stage of a pipelined load.
+        A `FlattenedChunk` also copies its related rows into their tables in the
+        transaction of the chunk.
+
+        With `checkpoint_name`, `chunks` yields (source_position, DataFrame) pairs (see
+        `MongoExtractor.iter_collection_chunks_with_positions`) and every chunk is
+        committed in the same transaction as its row in `checkpoint_table`, so a
+        checkpoint exists exactly for the chunks whose rows are in the table. Once the
+        iterable is exhausted the last checkpoint is marked final.
+
+        Parameters:
+        chunks (iterable): DataFrames to insert, in order.
+        table_name (str): The name of the PostgreSQL table to load into.
+        json_columns (list): Columns holding dicts/lists that are written as jsonb.
+        method (str): "copy" or "executemany"; defaults to the table's `load_method`.
+        raise_on_error (bool): Re-raise after rolling back the failed chunk, so callers
+                               such as the scheduler can stop dependent loads.
+        checkpoint_name (str): Name the checkpoints are stored under, usually the collection.
+        resume_from (dict): Checkpoint returned by `get_checkpoint` to continue after.
+        controller (AdaptiveBatchSize): Receives the latency of every chunk load, and
+                                        its concurrency limiter gates the loads.
+
+        Every committed chunk is recorded as the "load" stage of the collection in
+        `resources.metrics`, with the CSV bytes sent to PostgreSQL by the COPY path.
+
+        Returns:
+        int: The number of rows committed by this call.
+        """
+        method = method or self.get_load_method(table_name)
+        if method not in load_methods:
+            raise ValueError(
+                f"Unknown load method '{method}'. Expected one of {load_methods}."
+            )
+
+        rows_committed = 0
+        chunk_index = resume_from["chunk_index"] if resume_from else 0
+        source_position = resume_from["source_position"] if resume_from else None
+        rows_total = resume_from["rows_committed"] if resume_from else 0
+        metrics_name = checkpoint_name or _collection_for_table(table_name)
+
+        with self.resources.pg_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                for chunk in chunks:
+                    if checkpoint_name:
+                        source_position, df = chunk
+                    else:
+                        df = chunk
+                    chunk_index += 1
+                    flattened = df if isinstance(df, FlattenedChunk) else None
+                    if flattened is not None:
+                        df = flattened.frame
+
+                    if isinstance(df, RenderedCopyChunk):
+                        chunk_bytes = df.frame_bytes
+                    else:
+                        if "_id" in df.columns:
+                            df.drop(columns=["_id"], inplace=True)
+                        chunk_bytes = frame_bytes(df)
+                    slot = controller.load_slot() if controller else nullcontext()
+                    with slot, self.resources.metrics.measure(
+                        metrics_name, "load", bytes_in=chunk_bytes
+                    ) as sample:
+                        started = time.perf_counter()
+                        for writer in flattened.writers if flattened else ():
+                            writer(cursor)
+                        if isinstance(df, RenderedCopyChunk):
+                            stream = self._copy_rendered_chunk(cursor, df, table_name)
+                            row_count = stream.rows_written
+                            sample["bytes_out"] = stream.bytes_written
+                        elif method == "copy":
+                            stream = self._copy_dataframe(
+                                cursor, df, table_name, json_columns
+                            )
+                            row_count = stream.rows_written
+                            sample["bytes_out"] = stream.bytes_written
+                        else:
+                            row_count = len(df)
+                            self.insert_dataframe_with_executemany(
+                                connection,
+                                cursor,
+                                df,
+                                table_name,
+                                json_columns,
+                                commit_per_batch=not checkpoint_name,
+                            )
+                        if flattened is not None:
+                            self._copy_related_rows(cursor, flattened.related)
+
+                        rows_total += row_count
+                        if checkpoint_name:
+                            self.record_checkpoint(
+                                cursor,
+                                checkpoint_name,
+                                chunk_index,
+                                source_position,
+                                rows_total,
+                            )
+                        connection.commit()
+                        if flattened is not None:
+                            flattened.committed()
+                        sample["rows"] = row_count
+                        if controller is not None:
+                            controller.observe(
+                                "load",
+                                row_count,
+                                time.perf_counter() - started,
+                                chunk_bytes,
+                            )
+
+                    rows_committed += row_count
+
+                if checkpoint_name:
+                    self.record_checkpoint(
+                        cursor,
+                        checkpoint_name,
+                        chunk_index,
+                        source_position,
+                        rows_total,
+                        is_final=True,
+                    )
+                    connection.commit()
+            except Exception as error:
+                print(f"Error inserting data into PostgreSQL: {error}")
+                connection.rollback()
+                if raise_on_error:
+                    raise
+            finally:
+                cursor.close()
+
+        return rows_committed
+
+    def copy_dataframe(
+        self, cursor, df: pd.DataFrame, table_name: str, json_columns: list = []
+    ) -> int:
+        """
+        Streams a DataFrame into a PostgreSQL table with `COPY ... FROM STDIN` (CSV).
+        Rows are rendered slice by slice, so no intermediate list of tuples is built.
+        The caller owns the transaction.
+
+        Returns:
+            int: The number of rows copied.
+        """
+        return self._copy_dataframe(cursor, df, table_name, json_columns).rows_written
+
+    def _copy_dataframe(
+        self, cursor, df: pd.DataFrame, table_name: str, json_columns: list = []
+    ) -> DataFrameCopyStream:
+        """`copy_dataframe`, returning the exhausted stream with its row and byte counts."""
+        stream = DataFrameCopyStream(df, json_columns)
+        cursor.copy_expert(
+            self._copy_query(table_name, df.columns.tolist()),
+            stream,
+            size=COPY_READ_SIZE,
+        )
+        return stream
+
+    def _copy_related_rows(self, cursor, related: list):
+        """
+        COPYs the related rows of a `FlattenedChunk` into their tables, recording each
+        table as a "load" stage of its own. The caller owns the transaction.
+        """
+        for table_name, df, json_columns in related:
+            if df.empty:
+                continue
+            with self.resources.metrics.measure(
+                _collection_for_table(table_name), "load", bytes_in=frame_bytes(df)
+            ) as sample:
+                stream = self._copy_dataframe(cursor, df, table_name, json_columns)
+                sample["rows"] = stream.rows_written
+                sample["bytes_out"] = stream.bytes_written
+
+    @staticmethod
+    def _copy_query(table_name: str, columns: list):
+        return sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL {})").format(
+            sql.Identifier(table_name),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+            sql.Literal(COPY_NULL),
+        )
+
+    @staticmethod
+    def render_copy_chunk(
+        df: pd.DataFrame, json_columns: list = []
+    ) -> RenderedCopyChunk:
+        """
+        Renders a DataFrame chunk as the CSV payload `copy_dataframe` would stream
+        (dropping `_id`), so the rendering can run ahead of the load, e.g. in the
+        transform stage of a pipelined load or in a `ProcessTransformPool` worker.
+        The payload is held in memory whole.
+        """
         if "_id" in df.columns:
-            df.drop(columns=["_id"], inplace=True)
+            df = df.drop(columns=["_id"])
+        stream = DataFrameCopyStream(df, json_columns)
+        payload = b"".join(iter(lambda: stream.read(COPY_READ_SIZE), b""))
+        return RenderedCopyChunk(
+            df.columns.tolist(), payload, stream.rows_written, frame_bytes(df)
+        )
+
+    def _copy_rendered_chunk(
+        self, cursor, chunk: RenderedCopyChunk, table_name: str
+    ) -> RenderedCopyChunk:
+        """COPYs a `RenderedCopyChunk` into a table; the caller owns the transaction."""
+        cursor.copy_expert(
+            self._copy_query(table_name, chunk.columns),
+            io.BytesIO(chunk.payload),
+            size=COPY_READ_SIZE,
+        )
+        return chunk
+
+    def copy_record_batch(self, cursor, batch, table_name: str) -> int:
+        """
+        Writes an Arrow RecordBatch (see `ArrowExtractor`) into a PostgreSQL table
+        with `COPY ... FROM STDIN`, encoding it as CSV with Arrow's writer so no row
+        passes through Python objects. The caller owns the transaction.
+
+        Returns:
+            int: The number of rows copied.
+        """
+        return self._copy_record_batch(cursor, batch, table_name)[0]
+
+    def _copy_record_batch(self, cursor, batch, table_name: str) -> tuple:
+        """`copy_record_batch`, returning (rows copied, CSV bytes sent)."""
+        import pyarrow.csv as pa_csv
+
+        buffer = io.BytesIO()
+        # Arrow writes nulls as empty unquoted fields and empty strings as "",
+        # which is exactly how COPY's CSV format tells them apart
+        pa_csv.write_csv(batch, buffer, pa_csv.WriteOptions(include_header=False))
+        buffer.seek(0)
+
+        copy_query = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+            sql.Identifier(table_name),
+            sql.SQL(", ").join(map(sql.Identifier, batch.schema.names)),
+        )
+        cursor.copy_expert(copy_query, buffer, size=COPY_READ_SIZE)
+        return batch.num_rows, buffer.getbuffer().nbytes
+
+    def load_record_batches_to_postgres(
+        self, batches, table_name: str, raise_on_error: bool = False
+    ) -> int:
+        """
+        Loads an iterable of Arrow RecordBatches into a PostgreSQL table over one
+        pooled connection, committing per batch.
+
+        Returns:
+            int: The number of rows committed.
+        """
+        rows_committed = 0
+        metrics_name = _collection_for_table(table_name)
+
+        with self.resources.pg_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                for batch in batches:
+                    with self.resources.metrics.measure(
+                        metrics_name, "load", batch.num_rows, batch.nbytes
+                    ) as sample:
+                        row_count, sample["bytes_out"] = self._copy_record_batch(
+                            cursor, batch, table_name
+                        )
+                        connection.commit()
+                    rows_committed += row_count
+            except Exception as error:
+                print(f"Error inserting data into PostgreSQL: {error}")
+                connection.rollback()
+                if raise_on_error:
+                    raise
+            finally:
+                cursor.close()
+
+        return rows_committed
+
+    def insert_dataframe_with_executemany(
+        self,
+        connection,
+        cursor,
+        df: pd.DataFrame,
+        table_name: str,
+        json_columns: list,
+        commit_per_batch: bool = True,
+        batch_size: int = executemany_batch_size,
+    ):
+        """
+        Fallback load path: `executemany` INSERTs of `batch_size` rows, committed per
+        batch. With `commit_per_batch=False` the caller owns the transaction instead.
+        """
+        if commit_per_batch:
+            connection.set_session(autocommit=True)  # Ensure autocommit is enabled
 
         for column in json_columns:
             if column in df.columns:
                 df[column] = df[column].apply(json.dumps)
 
+        # psycopg2 cannot adapt NaT, pd.NA or NumPy scalars; datetime, nullable and
+        # categorical columns become objects with None here
+        for column in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[column]) or isinstance(
+                df[column].dtype, pd.api.extensions.ExtensionDtype
+            ):
+                df[column] = df[column].astype(object).where(df[column].notna(), None)
+
         columns = df.columns.tolist()
         insert_query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
             sql.Identifier(table_name),
@@ -81,25 +564,549 @@ class PostgresLoader:
         )
 
         data_tuples = [tuple(row) for row in df.itertuples(index=False)]
-        print(f"Insert query: {insert_query.as_string(cursor)}")
-        print(f"Number of rows to insert: {len(data_tuples)}")
 
-        batch_size = 1000
-        try:
-            for i in range(0, len(data_tuples), batch_size):
-                batch = data_tuples[i : i + batch_size]
-                cursor.executemany(insert_query, batch)
+        for i in range(0, len(data_tuples), batch_size):
+            batch = data_tuples[i : i + batch_size]
+            cursor.executemany(insert_query, batch)
+            if commit_per_batch:
                 connection.commit()  # Explicit commit after each batch
-                print(
-                    f"Inserted batch {i // batch_size + 1} with {len(batch)} records."
+
+    def upsert_dataframe_to_postgres(
+        self,
+        df: pd.DataFrame,
+        table_name: str,
+        unique_id_col: str,
+        json_columns: list = [],
+        batch_size: int = 50000,
+        mode: str = "upsert",
+    ) -> dict:
+        """
+        Applies a DataFrame of changed rows to a PostgreSQL table keyed on `unique_id_col`.
+
+        Each batch is COPYed into a temporary staging table and applied with one
+        set-based statement: `INSERT ... SELECT ... ON CONFLICT DO UPDATE` in "upsert"
+        mode, or `UPDATE ... FROM` in "update" mode (rows whose key does not exist are
+        ignored). Every batch is committed on its own and recorded as the "upsert"
+        stage of the collection in `resources.metrics`.
+
+        Parameters:
+        df (pd.DataFrame): The rows to apply.
+        table_name (str): The name of the PostgreSQL table, e.g. one in `unique_id_mapping`.
+        unique_id_col (str): The unique identifier column (must be unique in the table).
+        json_columns (list): Columns holding dicts/lists that are written as jsonb.
+        batch_size (int): Rows staged and applied per statement.
+        mode (str): "upsert" or "update".
+
+        Returns:
+        dict: {"inserted": int, "updated": int}
+        """
+        if mode not in ("upsert", "update"):
+            raise ValueError(f"Unknown mode '{mode}'. Expected 'upsert' or 'update'.")
+
+        counts = {"inserted": 0, "updated": 0}
+        if "_id" in df.columns:
+            df = df.drop(columns=["_id"])
+        if df.empty:
+            return counts
+
+        # A key may only appear once per statement; the last version wins
+        df = df.drop_duplicates(subset=[unique_id_col], keep="last")
+
+        columns = df.columns.tolist()
+        update_columns = [col for col in columns if col != unique_id_col]
+        stage_table = f"_stage_{table_name}"
+        metrics_name = _collection_for_table(table_name)
+
+        create_stage_query = sql.SQL(
+            "CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA"
+        ).format(
+            sql.Identifier(stage_table),
+            sql.SQL(", ").join(map(sql.Identifier, columns)),
+            sql.Identifier(table_name),
+        )
+        if mode == "upsert":
+            apply_query = sql.SQL(
+                """
+                WITH applied AS (
+                    INSERT INTO {table} ({columns})
+                    SELECT {columns} FROM {stage}
+                    ON CONFLICT ({key}) DO {action}
+                    RETURNING (xmax = 0) AS inserted
                 )
-        except Exception as error:
-            print(f"Error inserting data into PostgreSQL: {error}")
-            connection.rollback()
-        finally:
-            cursor.close()
-            connection.close()
-            print("Connection closed.")
+                SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+                FROM applied
+                """
+            ).format(
+                table=sql.Identifier(table_name),
+                stage=sql.Identifier(stage_table),
+                columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                key=sql.Identifier(unique_id_col),
+                action=sql.SQL("UPDATE SET {}").format(
+                    sql.SQL(", ").join(
+                        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(col))
+                        for col in update_columns
+                    )
+                )
+                if update_columns
+                else sql.SQL("NOTHING"),
+            )
+        else:
+            apply_query = sql.SQL(
+                "UPDATE {table} AS t SET {assignments} FROM {stage} AS s WHERE t.{key} = s.{key}"
+            ).format(
+                table=sql.Identifier(table_name),
+                stage=sql.Identifier(stage_table),
+                key=sql.Identifier(unique_id_col),
+                assignments=sql.SQL(", ").join(
+                    sql.SQL("{0} = s.{0}").format(sql.Identifier(col))
+                    for col in update_columns
+                ),
+            )
+
+        with self.resources.pg_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                for start in range(0, len(df), batch_size):
+                    batch = df.iloc[start : start + batch_size]
+                    with self.resources.metrics.measure(
+                        metrics_name, "upsert", len(batch), frame_bytes(batch)
+                    ) as sample:
+                        cursor.execute(create_stage_query)
+                        stream = self._copy_dataframe(
+                            cursor, batch, stage_table, json_columns
+                        )
+                        cursor.execute(apply_query)
+                        if mode == "upsert":
+                            inserted, updated = cursor.fetchone()
+                        else:
+                            inserted, updated = 0, cursor.rowcount
+                        connection.commit()
+                        sample["bytes_out"] = stream.bytes_written
+                    counts["inserted"] += inserted
+                    counts["updated"] += updated
+                return counts
+            except Exception as error:
+                print(f"Error applying changes to PostgreSQL: {error}")
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def ensure_watermark_table(self):
+        """Creates the state table holding per-collection incremental-load watermarks."""
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {} (
+                            collection_name VARCHAR PRIMARY KEY,
+                            last_added_at TIMESTAMP,
+                            -- The `_id` halves of the watermarks, as MongoDB
+                            -- extended JSON
+                            last_added_id TEXT,
+                            last_modified_at TIMESTAMP,
+                            last_modified_id TEXT,
+                            updated_at TIMESTAMP NOT NULL DEFAULT now()
+                        )
+                        """
+                    ).format(sql.Identifier(watermark_table))
+                )
+                connection.commit()
+
+    def get_watermark(self, collection_name: str):
+        """
+        Returns the ((last_added_at, last_added_id), (last_modified_at,
+        last_modified_id)) watermark persisted for a collection (see
+        `MongoExtractor.build_changed_documents_query`). Collections without a
+        persisted watermark fall back to the latest timestamps found in their target
+        table (e.g. right after a full load), without an `_id`.
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        "SELECT last_added_at, last_added_id, last_modified_at, last_modified_id "
+                        "FROM {} WHERE collection_name = %s"
+                    ).format(sql.Identifier(watermark_table)),
+                    (collection_name,),
+                )
+                result = cursor.fetchone()
+        if result is not None:
+            added_at, added_id, modified_at, modified_id = result
+            return (
+                (added_at, json_util.loads(added_id) if added_id else None),
+                (modified_at, json_util.loads(modified_id) if modified_id else None),
+            )
+        added_at, modified_at = self.get_latest_timestamps(
+            unique_id_mapping[collection_name]["table_name"]
+        )
+        return (added_at, None), (modified_at, None)
+
+    def save_watermark(self, collection_name: str, added, modified):
+        """
+        Persists the (timestamp, `_id`) watermarks of a collection after its changes
+        have been applied.
+        """
+        (added_at, added_id), (modified_at, modified_id) = added, modified
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        INSERT INTO {} (collection_name, last_added_at, last_added_id,
+                                        last_modified_at, last_modified_id, updated_at)
+                        VALUES (%s, %s, %s, %s, %s, now())
+                        ON CONFLICT (collection_name) DO UPDATE
+                        SET last_added_at = EXCLUDED.last_added_at,
+                            last_added_id = EXCLUDED.last_added_id,
+                            last_modified_at = EXCLUDED.last_modified_at,
+                            last_modified_id = EXCLUDED.last_modified_id,
+                            updated_at = EXCLUDED.updated_at
+                        """
+                    ).format(sql.Identifier(watermark_table)),
+                    (
+                        collection_name,
+                        added_at,
+                        json_util.dumps(added_id) if added_id is not None else None,
+                        modified_at,
+                        json_util.dumps(modified_id) if modified_id is not None else None,
+                    ),
+                )
+                connection.commit()
+
+    def ensure_checkpoint_table(self):
+        """Creates the state table holding per-chunk checkpoints of resumable full loads."""
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {} (
+                            checkpoint_name VARCHAR NOT NULL,
+                            chunk_index INTEGER NOT NULL,
+                            source_position VARCHAR,
+                            rows_committed BIGINT NOT NULL,
+                            is_final BOOLEAN NOT NULL DEFAULT false,
+                            committed_at TIMESTAMP NOT NULL DEFAULT now(),
+                            PRIMARY KEY (checkpoint_name, chunk_index)
+                        )
+                        """
+                    ).format(sql.Identifier(checkpoint_table))
+                )
+                connection.commit()
+
+    def record_checkpoint(
+        self,
+        cursor,
+        checkpoint_name: str,
+        chunk_index: int,
+        source_position,
+        rows_committed: int,
+        is_final: bool = False,
+    ):
+        """
+        Writes the checkpoint of a chunk on the caller's cursor, so it commits together
+        with the chunk's rows. The source position (a MongoDB `_id`) is stored as
+        extended JSON to keep its BSON type.
+        """
+        cursor.execute(
+            sql.SQL(
+                """
+                INSERT INTO {} (
+                    checkpoint_name, chunk_index, source_position, rows_committed,
+                    is_final, committed_at
+                )
+                VALUES (%s, %s, %s, %s, %s, now())
+                ON CONFLICT (checkpoint_name, chunk_index) DO UPDATE
+                SET source_position = EXCLUDED.source_position,
+                    rows_committed = EXCLUDED.rows_committed,
+                    is_final = EXCLUDED.is_final,
+                    committed_at = EXCLUDED.committed_at
+                """
+            ).format(sql.Identifier(checkpoint_table)),
+            (
+                checkpoint_name,
+                chunk_index,
+                json_util.dumps(source_position) if source_position is not None else None,
+                rows_committed,
+                is_final,
+            ),
+        )
+
+    def save_checkpoint(
+        self,
+        checkpoint_name: str,
+        chunk_index: int,
+        source_position,
+        rows_committed: int,
+        is_final: bool = False,
+    ):
+        """
+        Writes a checkpoint in a transaction of its own, for state that is not tied
+        to a chunk (e.g. the split points of a partitioned scan).
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                self.record_checkpoint(
+                    cursor,
+                    checkpoint_name,
+                    chunk_index,
+                    source_position,
+                    rows_committed,
+                    is_final,
+                )
+                connection.commit()
+
+    def get_checkpoint(self, checkpoint_name: str):
+        """
+        Returns the last committed checkpoint as a dict with `chunk_index`,
+        `source_position` (the decoded `_id`), `rows_committed` and `is_final`,
+        or None if nothing was committed yet.
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        SELECT chunk_index, source_position, rows_committed, is_final
+                        FROM {} WHERE checkpoint_name = %s
+                        ORDER BY chunk_index DESC LIMIT 1
+                        """
+                    ).format(sql.Identifier(checkpoint_table)),
+                    (checkpoint_name,),
+                )
+                result = cursor.fetchone()
+        if result is None:
+            return None
+        return {
+            "chunk_index": result[0],
+            "source_position": json_util.loads(result[1]) if result[1] else None,
+            "rows_committed": result[2],
+            "is_final": result[3],
+        }
+
+    def clear_checkpoints(self, checkpoint_name: str):
+        """
+        Removes the checkpoints of a load, e.g. before a fresh (non-resumed) run,
+        including those of its partitions (`{checkpoint_name}/...`).
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        "DELETE FROM {} WHERE checkpoint_name = %s "
+                        "OR starts_with(checkpoint_name, %s)"
+                    ).format(sql.Identifier(checkpoint_table)),
+                    (checkpoint_name, f"{checkpoint_name}/"),
+                )
+                connection.commit()
+
+    def delete_records_from_postgres(
+        self, table_name: str, unique_id_col: str, unique_id_values: list
+    ) -> int:
+        """
+        Deletes the rows whose `unique_id_col` is in `unique_id_values` with a single
+        statement.
+
+        Returns:
+        int: The number of rows deleted.
+        """
+        if not unique_id_values:
+            return 0
+
+        with self.resources.pg_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(
+                    sql.SQL("DELETE FROM {} WHERE {} = ANY(%s)").format(
+                        sql.Identifier(table_name), sql.Identifier(unique_id_col)
+                    ),
+                    (list(unique_id_values),),
+                )
+                deleted = cursor.rowcount
+                connection.commit()
+                print(f"Deleted {deleted} records from {table_name}.")
+                return deleted
+            except Exception as error:
+                print(f"Error deleting data from PostgreSQL: {error}")
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def ensure_cdc_state_table(self):
+        """
+        Creates the state tables of change-stream replication: the resume tokens, the
+        `_id` → unique id mapping of the replicated documents and the dead letters.
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {} (
+                            stream_name VARCHAR PRIMARY KEY,
+                            resume_token JSONB,
+                            updated_at TIMESTAMP NOT NULL DEFAULT now()
+                        )
+                        """
+                    ).format(sql.Identifier(cdc_state_table))
+                )
+                # `_id`s and unique ids as MongoDB extended JSON
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {} (
+                            collection_name VARCHAR NOT NULL,
+                            document_id TEXT NOT NULL,
+                            unique_id TEXT NOT NULL,
+                            PRIMARY KEY (collection_name, document_id)
+                        )
+                        """
+                    ).format(sql.Identifier(cdc_document_keys_table))
+                )
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        CREATE TABLE IF NOT EXISTS {} (
+                            stream_name VARCHAR NOT NULL,
+                            collection_name VARCHAR NOT NULL,
+                            document_id TEXT,
+                            event JSONB NOT NULL,
+                            recorded_at TIMESTAMP NOT NULL DEFAULT now()
+                        )
+                        """
+                    ).format(sql.Identifier(cdc_dead_letter_table))
+                )
+                connection.commit()
+
+    def save_document_keys(self, collection_name: str, keys: list):
+        """
+        Persists the unique id of every (`_id`, unique id) pair of `keys`, so deletes
+        of the documents can be resolved after a restart.
+        """
+        if not keys:
+            return
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    sql.SQL(
+                        """
+                        INSERT INTO {} (collection_name, document_id, unique_id)
+                        VALUES %s
+                        ON CONFLICT (collection_name, document_id) DO UPDATE
+                        SET unique_id = EXCLUDED.unique_id
+                        """
+                    ).format(sql.Identifier(cdc_document_keys_table)),
+                    [
+                        (
+                            collection_name,
+                            json_util.dumps(document_id),
+                            json_util.dumps(unique_id),
+                        )
+                        for document_id, unique_id in keys
+                    ],
+                )
+                connection.commit()
+
+    def get_document_keys(self, collection_name: str, document_ids: list) -> dict:
+        """Returns the persisted unique ids of `document_ids`, by `_id`."""
+        if not document_ids:
+            return {}
+        by_text = {
+            json_util.dumps(document_id): document_id for document_id in document_ids
+        }
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        "SELECT document_id, unique_id FROM {} "
+                        "WHERE collection_name = %s AND document_id = ANY(%s)"
+                    ).format(sql.Identifier(cdc_document_keys_table)),
+                    (collection_name, list(by_text)),
+                )
+                rows = cursor.fetchall()
+        return {
+            by_text[document_id]: json_util.loads(unique_id)
+            for document_id, unique_id in rows
+        }
+
+    def delete_document_keys(self, collection_name: str, document_ids: list):
+        """Forgets the unique ids of deleted documents."""
+        if not document_ids:
+            return
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        "DELETE FROM {} "
+                        "WHERE collection_name = %s AND document_id = ANY(%s)"
+                    ).format(sql.Identifier(cdc_document_keys_table)),
+                    (
+                        collection_name,
+                        [json_util.dumps(document_id) for document_id in document_ids],
+                    ),
+                )
+                connection.commit()
+
+    def record_dead_letters(self, stream_name: str, events: list):
+        """Keeps change events that could not be applied, for inspection and replay."""
+        if not events:
+            return
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                execute_values(
+                    cursor,
+                    sql.SQL(
+                        "INSERT INTO {} (stream_name, collection_name, document_id, event) "
+                        "VALUES %s"
+                    ).format(sql.Identifier(cdc_dead_letter_table)),
+                    [
+                        (
+                            stream_name,
+                            event["ns"]["coll"],
+                            json_util.dumps(
+                                (event.get("documentKey") or {}).get("_id")
+                            ),
+                            Json(json.loads(json_util.dumps(event))),
+                        )
+                        for event in events
+                    ],
+                )
+                connection.commit()
+
+    def get_resume_token(self, stream_name: str):
+        """Returns the resume token persisted for a change stream, or None."""
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("SELECT resume_token FROM {} WHERE stream_name = %s").format(
+                        sql.Identifier(cdc_state_table)
+                    ),
+                    (stream_name,),
+                )
+                result = cursor.fetchone()
+        return result[0] if result else None
+
+    def save_resume_token(self, stream_name: str, resume_token):
+        """Persists the resume token of a change stream once a window is applied."""
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL(
+                        """
+                        INSERT INTO {} (stream_name, resume_token, updated_at)
+                        VALUES (%s, %s, now())
+                        ON CONFLICT (stream_name) DO UPDATE
+                        SET resume_token = EXCLUDED.resume_token,
+                            updated_at = EXCLUDED.updated_at
+                        """
+                    ).format(sql.Identifier(cdc_state_table)),
+                    (stream_name, Json(resume_token, dumps=_dumps_json)),
+                )
+                connection.commit()
 
     def update_record_in_postgres(
         self,
@@ -109,53 +1116,40 @@ class PostgresLoader:
     ):
         """
         Updates an existing record in the PostgreSQL table based on a unique identifier.
+        For more than a handful of records use `upsert_dataframe_to_postgres` with
+        mode="update", which applies a whole DataFrame in one statement per batch.
 
         Parameters:
         record (pd.Series): The record to update.
         table_name (str): The name of the PostgreSQL table to update.
         unique_id_col (str): The name of the unique identifier column used for the update.
         """
-        connection = self.create_pg_connection()
-        cursor = connection.cursor()
-
-        set_clause = ", ".join(
-            [f"{col} = %s" for col in record.index if col != unique_id_col]
-        )
-        update_query = f"""
-            UPDATE {table_name}
-            SET {set_clause}
-            WHERE {unique_id_col} = %s
-        """
-
-        values = tuple(record[col] for col in record.index if col != unique_id_col) + (
-            record[unique_id_col],
-        )
-
         try:
-            cursor.execute(update_query, values)
-            connection.commit()
-            print(
-                f"Record with {unique_id_col} {record[unique_id_col]} updated successfully."
+            counts = self.upsert_dataframe_to_postgres(
+                record.to_frame().T, table_name, unique_id_col, mode="update"
             )
         except Exception as error:
             print(f"Error updating record in PostgreSQL: {error}")
-            connection.rollback()
-        finally:
-            cursor.close()
-            connection.close()
+            return
+
+        if counts["updated"]:
+            print(
+                f"Record with {unique_id_col} {record[unique_id_col]} updated successfully."
+            )
+        else:
+            print(f"No record found with {unique_id_col} {record[unique_id_col]}.")
 
     def get_latest_timestamps(self, table_name):
         """
-        Retrieves the latest added_at and modified_at timestamps from the specified PostgreSQL table.
+        Retrieves the latest added_at and modified_at timestamps from the specified
+        PostgreSQL table.
         """
         query = f"""
         SELECT MAX(added_at) AS last_added_at, MAX(modified_at) AS last_modified_at
         FROM {table_name};
         """
-        connection = self.create_pg_connection()
-        cursor = connection.cursor()
-        cursor.execute(query)
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(query)
+                result = cursor.fetchone()
         return result[0], result[1]
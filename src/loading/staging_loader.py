@@ -0,0 +1,313 @@
+# staging_loader.py
+
+from psycopg2 import sql
+
+from loading.index_manager import IndexManager, retarget_reference
+
+from config import staging_table_suffix, previous_table_suffix
+
+# PostgreSQL truncates identifiers longer than this, which would break the renames.
+MAX_IDENTIFIER_LENGTH = 63
+
+
+class StagingTableLoader:
+    def __init__(self, postgres_loader, index_manager=None):
+        """
+        Initializes the StagingTableLoader class.
+
+        A full reload goes into `{table}__staging`, an UNLOGGED copy of the live
+        table without indexes or constraints. Once every table is loaded, the
+        staging tables get the indexes and constraints of the live tables, are
+        validated and switched to LOGGED, and `publish` swaps all of them in with
+        one short transaction of renames. The replaced tables are kept as
+        `{table}__previous`, which `rollback` swaps back in. Index builds go through
+        `IndexManager`, so staging tables are indexed concurrently.
+        """
+        self.postgres_loader = postgres_loader
+        self.resources = postgres_loader.resources
+        self.index_manager = index_manager or IndexManager(self.resources)
+        self._definitions = {}
+
+    @staticmethod
+    def staging_name(table_name: str) -> str:
+        return f"{table_name}{staging_table_suffix}"
+
+    @staticmethod
+    def previous_name(table_name: str) -> str:
+        return f"{table_name}{previous_table_suffix}"
+
+    def table_exists(self, table_name: str) -> bool:
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+                return cursor.fetchone()[0]
+
+    def get_table_definitions(self, cursor, table_name: str) -> dict:
+        return self.index_manager.get_table_definitions(cursor, table_name)
+
+    def prepare_staging_table(self, table_name: str):
+        """
+        (Re)creates the UNLOGGED staging table of a live table with the same columns
+        and defaults but no indexes or constraints, and remembers the live table's
+        definitions so they can be rebuilt on the staging table after the load.
+        """
+        staging = self.staging_name(table_name)
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                definitions = self.get_table_definitions(cursor, table_name)
+                names = [name for name, *_ in definitions["constraints"]]
+                names += [name for name, _ in definitions["indexes"]]
+                suffix_length = max(
+                    len(staging_table_suffix), len(previous_table_suffix)
+                )
+                for name in names + [table_name]:
+                    if len(name) + suffix_length > MAX_IDENTIFIER_LENGTH:
+                        raise ValueError(
+                            f"Identifier '{name}' is too long to be renamed during the swap."
+                        )
+
+                cursor.execute(
+                    sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(staging))
+                )
+                cursor.execute(
+                    sql.SQL(
+                        "CREATE UNLOGGED TABLE {} (LIKE {} INCLUDING DEFAULTS)"
+                    ).format(sql.Identifier(staging), sql.Identifier(table_name))
+                )
+                connection.commit()
+
+        self._definitions[table_name] = definitions
+        print(f"Prepared staging table {staging}.")
+
+    def _definitions_for(self, cursor, table_name: str) -> dict:
+        if table_name not in self._definitions:
+            self._definitions[table_name] = self.get_table_definitions(
+                cursor, table_name
+            )
+        return self._definitions[table_name]
+
+    def build_staging_keys(self, table_names: list) -> list:
+        """
+        Makes the loaded staging tables durable and rebuilds on them the indexes,
+        keys and foreign keys of the live tables, named `{name}__staging`. Foreign
+        keys between staged tables point at the staging tables, so they still hold
+        once the renames publish them together.
+
+        Returns:
+            list: Timings per index and constraint, see `IndexManager.rebuild`.
+        """
+        definitions = {}
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for table_name in table_names:
+                    definitions[table_name] = self._definitions_for(cursor, table_name)
+
+        # Switching to LOGGED before the index builds rewrites only the heap
+        set_logged = {
+            table_name: [
+                (
+                    self.staging_name(table_name),
+                    "logging",
+                    sql.SQL("ALTER TABLE {} SET LOGGED").format(
+                        sql.Identifier(self.staging_name(table_name))
+                    ),
+                )
+            ]
+            for table_name in table_names
+        }
+        return self.index_manager.rebuild(
+            definitions,
+            targets={name: self.staging_name(name) for name in table_names},
+            name_suffix=staging_table_suffix,
+            extra_statements=set_logged,
+        )
+
+    def validate_row_count(
+        self, table_name: str, expected_rows: int, source_rows: int = None
+    ) -> int:
+        """
+        Checks that the staging table holds exactly the rows the load committed and
+        at least the documents the source had when the load started.
+
+        Returns:
+            int: The number of rows in the staging table.
+        """
+        staging = self.staging_name(table_name)
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql.SQL("SELECT count(*) FROM {}").format(sql.Identifier(staging))
+                )
+                staged_rows = cursor.fetchone()[0]
+
+        if staged_rows != expected_rows:
+            raise RuntimeError(
+                f"{staging} holds {staged_rows} rows but {expected_rows} were loaded."
+            )
+        if source_rows is not None and staged_rows < source_rows:
+            raise RuntimeError(
+                f"{staging} holds {staged_rows} rows but the source had {source_rows}."
+            )
+        return staged_rows
+
+    def _rename_objects(
+        self,
+        cursor,
+        physical_name: str,
+        definitions: dict,
+        from_suffix: str,
+        to_suffix: str,
+    ):
+        for name, *_ in definitions["constraints"]:
+            cursor.execute(
+                sql.SQL("ALTER TABLE {} RENAME CONSTRAINT {} TO {}").format(
+                    sql.Identifier(physical_name),
+                    sql.Identifier(name + from_suffix),
+                    sql.Identifier(name + to_suffix),
+                )
+            )
+        for name, _ in definitions["indexes"]:
+            cursor.execute(
+                sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+                    sql.Identifier(name + from_suffix), sql.Identifier(name + to_suffix)
+                )
+            )
+
+    def _swap(
+        self, cursor, table_name: str, incoming_suffix: str, outgoing_suffix: str
+    ):
+        """
+        Renames the live table (and its indexes and constraints) to `outgoing_suffix`
+        and the `incoming_suffix` table to the live name, then hands the serial
+        sequences over to the new live table.
+        """
+        definitions = self.get_table_definitions(cursor, table_name)
+        incoming = table_name + incoming_suffix
+        outgoing = table_name + outgoing_suffix
+
+        self._rename_objects(cursor, table_name, definitions, "", outgoing_suffix)
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(table_name), sql.Identifier(outgoing)
+            )
+        )
+        self._rename_objects(cursor, incoming, definitions, incoming_suffix, "")
+        cursor.execute(
+            sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(incoming), sql.Identifier(table_name)
+            )
+        )
+
+        # Dropping the outgoing table later must not take the sequences with it
+        for sequence, column in definitions["sequences"]:
+            cursor.execute(
+                sql.SQL("ALTER SEQUENCE {} OWNED BY {}.{}").format(
+                    sql.SQL(sequence),
+                    sql.Identifier(table_name),
+                    sql.Identifier(column),
+                )
+            )
+
+    def _repoint_foreign_keys(
+        self, cursor, table_names: list, outgoing_suffix: str
+    ) -> list:
+        """
+        Moves the foreign keys of tables outside the swap that still reference an
+        outgoing table over to the new live table. They are recreated NOT VALID so
+        the swap transaction does not scan them.
+
+        Returns:
+            list: (table, constraint) pairs to validate after the swap commits.
+        """
+        outgoing_tables = [name + outgoing_suffix for name in table_names]
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid),
+                   confrelid::regclass::text, cr.relname
+            FROM pg_constraint
+            JOIN pg_class cr ON cr.oid = confrelid
+            JOIN pg_class c ON c.oid = conrelid
+            WHERE contype = 'f' AND cr.relname = ANY(%s) AND NOT c.relname = ANY(%s)
+            """,
+            (outgoing_tables, outgoing_tables),
+        )
+        to_validate = []
+        for table, name, definition, referenced, referenced_name in cursor.fetchall():
+            live_name = referenced_name[: -len(outgoing_suffix)]
+            definition = retarget_reference(definition, referenced, live_name)
+            cursor.execute(
+                sql.SQL("ALTER TABLE {} DROP CONSTRAINT {}").format(
+                    sql.SQL(table), sql.Identifier(name)
+                )
+            )
+            cursor.execute(
+                sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} ").format(
+                    sql.SQL(table), sql.Identifier(name)
+                )
+                + definition
+                + sql.SQL(" NOT VALID")
+            )
+            to_validate.append((table, name))
+        return to_validate
+
+    def _validate_foreign_keys(self, foreign_keys: list):
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for table, name in foreign_keys:
+                    cursor.execute(
+                        sql.SQL("ALTER TABLE {} VALIDATE CONSTRAINT {}").format(
+                            sql.SQL(table), sql.Identifier(name)
+                        )
+                    )
+                    connection.commit()
+
+    def _swap_tables(
+        self, table_names: list, incoming_suffix: str, outgoing_suffix: str
+    ):
+        if not table_names:
+            return
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                try:
+                    # One statement, so outgoing tables referencing each other go together
+                    cursor.execute(
+                        sql.SQL("DROP TABLE IF EXISTS {}").format(
+                            sql.SQL(", ").join(
+                                sql.Identifier(name + outgoing_suffix)
+                                for name in table_names
+                            )
+                        )
+                    )
+                    for table_name in table_names:
+                        self._swap(cursor, table_name, incoming_suffix, outgoing_suffix)
+                    foreign_keys = self._repoint_foreign_keys(
+                        cursor, table_names, outgoing_suffix
+                    )
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    raise
+        self._validate_foreign_keys(foreign_keys)
+
+    def publish(self, table_names: list):
+        """
+        Swaps the staging tables in for the live tables in one transaction. Readers
+        see either every old table or every new one; the replaced tables are kept
+        as `{table}__previous` until the next publish.
+        """
+        self._swap_tables(table_names, staging_table_suffix, previous_table_suffix)
+        print(f"Published {len(table_names)} tables: {', '.join(table_names)}.")
+
+    def rollback(self, table_names: list):
+        """
+        Swaps the `{table}__previous` tables back in, in one transaction. The rolled
+        back tables become the staging tables, which the next reload recreates.
+        """
+        table_names = [
+            name for name in table_names if self.table_exists(self.previous_name(name))
+        ]
+        if not table_names:
+            print("Nothing to roll back: no previous tables exist.")
+            return
+        self._swap_tables(table_names, previous_table_suffix, staging_table_suffix)
+        print(f"Rolled back {len(table_names)} tables: {', '.join(table_names)}.")
@@ -1,48 +1,390 @@
 # main.py
 
-import pandas as pd
+import argparse
+from contextlib import nullcontext
+
+from connections.resource_manager import ResourceManager
 from extraction.mongo_extractor import MongoExtractor
+from extraction.change_events import MongoChangeStreamSource
 from loading.postgres_loader import PostgresLoader
+from loading.staging_loader import StagingTableLoader
+from loading.index_manager import IndexManager
 from transformation.transformer import Transformer
+from transformation.flattener import NestedDocumentFlattener
+from pipeline.scheduler import DependencyScheduler
+from pipeline.incremental import IncrementalLoader
+from pipeline.cdc import ChangeStreamReplicator
+from pipeline.adaptive import AdaptiveBatchSize, AdaptiveConcurrencyLimiter
+from pipeline.partitioned import PartitionedCollectionLoader
+from pipeline.pipelined import ChunkPipeline, chunk_preparer
+from pipeline.transform_pool import ProcessTransformPool
 
 from config import (
     unique_id_mapping,
     fixed_date_ist,
     collections_with_date_keys,
     collections,
+    collection_dependencies,
+    max_parallel_collections,
+    full_load_strategies,
+    default_full_load_strategy,
+    defer_indexes_on_full_load,
+    adaptive_batching,
+    scan_partitions,
+    partition_keys,
+    partition_min_documents,
+    pipelined_execution,
+    transform_processes,
+    flatten_nested_documents,
+    metrics_report_path,
+    metrics_prometheus_path,
 )
 
 
-def main():
-    # 1. Create objects of Extractor, Transformer, and PostgresLoader
-    mongo_extractor = MongoExtractor()
-    postgres_loader = PostgresLoader()
-    transformer = Transformer()
+def parse_args():
+    parser = argparse.ArgumentParser(description="MongoDB to PostgreSQL migration")
+    parser.add_argument(
+        "--mode",
+        choices=["full", "incremental", "demo", "cdc", "rollback"],
+        default="demo",
+        help=(
+            "full: load every collection; incremental: apply changes since the last "
+            "watermarks; demo: full load, simulated source changes, incremental load; "
+            "cdc: replicate MongoDB change events continuously; rollback: swap the "
+            "tables replaced by the last swap full load back in."
+        ),
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=full_load_strategies,
+        default=default_full_load_strategy,
+        help=(
+            "direct: insert into the live tables; swap: load staging tables and "
+            "publish them with one atomic rename once every collection is loaded."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=max_parallel_collections,
+        help="Number of collections migrated concurrently during the full load.",
+    )
+    parser.add_argument(
+        "--stamp-in-stream",
+        action="store_true",
+        help=(
+            "Fill missing added_at/modified_at while transforming each chunk instead of "
+            "writing the stamps to MongoDB first."
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=(
+            "Continue an interrupted full load from the last committed chunk of each "
+            "collection instead of starting over."
+        ),
+    )
+    parser.add_argument(
+        "--partitions",
+        type=int,
+        help=(
+            "Split every collection with at least `partition_min_documents` documents "
+            "into this many key ranges loaded in parallel, instead of `scan_partitions`."
+        ),
+    )
+    parser.add_argument(
+        "--pipelined",
+        action=argparse.BooleanOptionalAction,
+        default=pipelined_execution,
+        help=(
+            "Extract, transform and load the chunks of each collection in concurrent "
+            "stages connected by bounded queues, instead of one after the other "
+            "(default: `pipelined_execution`)."
+        ),
+    )
+    parser.add_argument(
+        "--transform-processes",
+        type=int,
+        default=transform_processes,
+        help=(
+            "Render the COPY payloads of `process_transform_collections` in this many "
+            "worker processes; implies --pipelined."
+        ),
+    )
+    parser.add_argument(
+        "--defer-indexes",
+        action=argparse.BooleanOptionalAction,
+        default=defer_indexes_on_full_load,
+        help=(
+            "With the direct strategy, drop the indexes and constraints of empty "
+            "target tables during the full load and rebuild them afterwards "
+            "(default: `defer_indexes_on_full_load`)."
+        ),
+    )
+    parser.add_argument(
+        "--metrics-report",
+        default=metrics_report_path,
+        help="Path of the JSON report with per-collection, per-stage metrics of the run.",
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        default=metrics_prometheus_path,
+        help="Path of the same metrics in the Prometheus text format.",
+    )
+    return parser.parse_args()
 
-    # 2. Extract all the collections as DataFrames
 
-    dataframes = {
-        collection: mongo_extractor.load_collection_as_dataframe(collection)
-        for collection in collections
-    }
+def run_full_load(
+    mongo_extractor,
+    postgres_loader,
+    transformer,
+    workers,
+    stamp_in_stream=False,
+    resume=False,
+    strategy=default_full_load_strategy,
+    partitions=None,
+    pipelined=False,
+    transform_processes=0,
+    defer_indexes=defer_indexes_on_full_load,
+):
+    # Run MongoDB aggregation to add timestamps to the documents that lack them,
+    # unless the stamps are added to each chunk in the transform stage instead
+    if not stamp_in_stream:
+        transformer.add_ist_timestamp_fields_mongodb_aggregation(collections, workers)
 
-    # 3. Replace pd.NaT with None in the specified columns of each collection
-    transformer.replace_nat_with_none(dataframes, collections_with_date_keys)
+    # Stream every collection as DataFrame chunks, normalize the date columns of each
+    # chunk in one vectorized pass and load it into its PostgreSQL table, so only one
+    # chunk per collection is held in memory at a time. Collections run concurrently
+    # once every collection they reference has been loaded.
+    def transform_chunk(chunk, collection):
+        if stamp_in_stream:
+            chunk = transformer.add_ist_timestamp_fields_to_dataframe(chunk)
+        chunk = transformer.normalize_date_columns(chunk, collection)
+        if flattener is not None and flattener.handles(collection):
+            chunk = flattener.flatten(chunk, collection)
+        return chunk
 
-    # 4. Run MongoDB aggregation to add timestamps
-    transformer.add_ist_timestamp_fields_mongodb_aggregation(collections)
+    # Every chunk commits together with a checkpoint of the last source `_id` it holds,
+    # so with `resume` a collection continues after its last committed chunk and
+    # collections whose load already finished are skipped.
+    postgres_loader.ensure_checkpoint_table()
 
-    # FULL LOAD
-    # 5. Load that data into the PostgreSQL database tables
-    for collection, df in dataframes.items():
-        postgres_loader.load_dataframe_to_postgres(
-            df, unique_id_mapping[collection]["table_name"]
+    # Fresh loads save the latest (timestamp, `_id`) of their collection, read before
+    # their first chunk, as its incremental watermark once the load has committed, so
+    # the incremental loads neither re-read the collection nor miss a document
+    # written during the load. Resumed loads keep the fallback to their target table.
+    postgres_loader.ensure_watermark_table()
+    watermarks = {}
+
+    # With the swap strategy, each collection is loaded into an UNLOGGED staging table
+    # and the live tables are only replaced once every collection loaded and validated.
+    staging = StagingTableLoader(postgres_loader) if strategy == "swap" else None
+    source_rows = {}
+
+    # Loading the live tables directly, nested documents are flattened into their
+    # child and dimension tables while the chunks stream and committed with them, so
+    # no normalization runs afterwards. Swap loads keep the post-load normalization.
+    flattener = (
+        NestedDocumentFlattener(postgres_loader.resources)
+        if flatten_nested_documents and staging is None
+        else None
+    )
+    if flattener is not None:
+        flattener.ensure_child_tables()
+
+    # With adaptive batching, the chunk size of every collection follows the latency
+    # and throughput of its extraction and loads, and slow loads lower the number of
+    # chunk loads running at once across collections and partitions. Every load holds
+    # a pooled connection, so the pool size is the ceiling.
+    limiter = (
+        AdaptiveConcurrencyLimiter(postgres_loader.resources.max_pg_connections)
+        if adaptive_batching
+        else None
+    )
+
+    # Pipelined loads of the CPU-heavy collections can render their COPY payloads in
+    # worker processes, several chunks at a time
+    transform_pool = (
+        ProcessTransformPool(transform_processes) if transform_processes else None
+    )
+    pipelined = pipelined or transform_pool is not None
+
+    # Large collections are split into key ranges, each extracted and loaded by a
+    # worker of its own; `partitions` overrides `scan_partitions` for every collection
+    partitioned = PartitionedCollectionLoader(
+        mongo_extractor,
+        postgres_loader,
+        transform_chunk,
+        limiter,
+        pipelined,
+        transform_pool,
+        flattener,
+    )
+
+    def migrate_collection(collection):
+        table_name = unique_id_mapping[collection]["table_name"]
+        checkpoint = postgres_loader.get_checkpoint(collection) if resume else None
+        if checkpoint and checkpoint["is_final"]:
+            print(f"Skipping {collection}: full load already completed.")
+            return 0
+        plan = partitioned.get_plan(collection) if resume else None
+        if checkpoint is None and plan is None:
+            postgres_loader.clear_checkpoints(collection)
+            if staging is not None:
+                staging.prepare_staging_table(table_name)
+        elif checkpoint is not None:
+            print(
+                f"Resuming {collection} after chunk {checkpoint['chunk_index']} "
+                f"({checkpoint['rows_committed']} rows already loaded)."
+            )
+        else:
+            print(f"Resuming the unfinished partitions of {collection}.")
+
+        if checkpoint is None and plan is None:
+            watermarks[collection] = mongo_extractor.get_latest_watermark(collection)
+        source_rows[collection] = mongo_extractor.db[collection].count_documents({})
+        if flattener is not None and flattener.handles(collection):
+            # Before the load holds a connection: flattening its chunks takes none
+            flattener.prepare(collection)
+        target_table = staging.staging_name(table_name) if staging else table_name
+        partition_count = (
+            partitions if partitions else scan_partitions.get(collection, 1)
+        )
+        if plan is not None or (
+            checkpoint is None
+            and partition_count > 1
+            and source_rows[collection] >= partition_min_documents
+        ):
+            rows_loaded = partitioned.run(
+                collection,
+                target_table,
+                partition_count,
+                key=partition_keys.get(collection, "_id"),
+                resume=resume,
+            )
+            save_watermark(collection)
+            return rows_loaded
+
+        controller = (
+            AdaptiveBatchSize(collection, limiter) if adaptive_batching else None
+        )
+        source = mongo_extractor.iter_collection_chunks_with_positions(
+            collection,
+            start_after=checkpoint["source_position"] if checkpoint else None,
+            controller=controller,
+            extra_fields=flattener.source_fields(collection) if flattener else (),
+        )
+        method = postgres_loader.get_load_method(table_name)
+
+        # Pipelined, the next chunks are extracted and transformed while this one loads
+        if pipelined:
+            pool = (
+                transform_pool
+                if transform_pool and transform_pool.handles(collection)
+                else None
+            )
+            pipeline = ChunkPipeline(collection, postgres_loader.resources.metrics)
+            chunks = pipeline.stream(
+                source,
+                chunk_preparer(
+                    postgres_loader, transform_chunk, collection, method, pool
+                ),
+                in_flight=pool.processes if pool else 1,
+            )
+        else:
+            pipeline = nullcontext()
+            chunks = (
+                (position, transform_chunk(chunk, collection))
+                for position, chunk in source
+            )
+        with pipeline:
+            rows_loaded = postgres_loader.load_chunks_to_postgres(
+                chunks,
+                target_table,
+                json_columns=unique_id_mapping[collection]["nested_documents"],
+                method=method,
+                raise_on_error=True,
+                checkpoint_name=collection,
+                resume_from=checkpoint,
+                controller=controller,
+            )
+        if controller is not None:
+            controller.log_settings()
+            postgres_loader.resources.metrics.record_settings(
+                collection, controller.settings()
+            )
+        save_watermark(collection)
+        return rows_loaded
+
+    def save_watermark(collection):
+        # Staged collections only reach the live tables once they are published
+        if staging is None and collection in watermarks:
+            postgres_loader.save_watermark(collection, *watermarks[collection])
+
+    scheduler = DependencyScheduler(collection_dependencies, workers)
+    try:
+        index_manager = IndexManager(postgres_loader.resources)
+        tables = [unique_id_mapping[name]["table_name"] for name in collections]
+        if staging is None and defer_indexes and not resume:
+            # Without their keys, tables that already hold rows would silently take
+            # duplicates of them
+            loaded = index_manager.non_empty_tables(tables)
+            if loaded:
+                print(
+                    f"Not deferring indexes: {', '.join(loaded)} already hold rows."
+                )
+                defer_indexes = False
+        if staging is None and defer_indexes:
+            # Load the live tables without indexes, keys or foreign keys and rebuild
+            # them concurrently once every collection is in
+            with index_manager.deferred_indexes(tables):
+                outcome = scheduler.run(migrate_collection, collections)
+        else:
+            outcome = scheduler.run(migrate_collection, collections)
+    finally:
+        if transform_pool is not None:
+            transform_pool.close()
+
+    if staging is not None:
+        if outcome["failed"] or outcome["skipped"]:
+            print("Full load incomplete: staging tables were not published.")
+            return
+        publish_staging_tables(staging, postgres_loader, source_rows)
+        for collection, (added, modified) in watermarks.items():
+            postgres_loader.save_watermark(collection, added, modified)
+
+    # Execute the normalization function for loan restructuring, unless its nested
+    # documents were flattened during the load
+    if flattener is None:
+        transformer.normalize_loan_restructuring()
+    else:
+        flattener.report()
+
+
+def publish_staging_tables(staging, postgres_loader, source_rows):
+    # Validate the row counts first, then build indexes and keys on the loaded staging
+    # tables (foreign keys last, once every referenced key exists) and swap them all in
+    staged = {
+        collection: mapping["table_name"]
+        for collection, mapping in unique_id_mapping.items()
+        if staging.table_exists(staging.staging_name(mapping["table_name"]))
+    }
+    if not staged:
+        print("No staging tables to publish.")
+        return
+
+    for collection, table_name in staged.items():
+        checkpoint = postgres_loader.get_checkpoint(collection)
+        staging.validate_row_count(
+            table_name, checkpoint["rows_committed"], source_rows.get(collection)
         )
+    staging.build_staging_keys(list(staged.values()))
+    staging.publish(list(staged.values()))
 
-    # 6. Execute the normalization function for loan restructuring
-    transformer.normalize_loan_restructuring()
 
-    # 7. Insert a new document into the customers collection
+def simulate_source_changes(mongo_extractor):
+    # Insert two new documents into the customers collection with one bulk insert
     new_customer = {
         "customer_id": 311001854123,
         "first_name": "Iris",
@@ -54,22 +396,6 @@ def main():
         "location": "San Francisco",
         "joined_date": "2018-10-04T05:30:00+00:00",
     }
-
-    # 8. Insert the new document into the customers collection
-    mongo_extractor.insert_document(
-        "customers", collections_with_date_keys["customers"], new_customer
-    )
-
-    # Incremental Load: #1
-    # 9. Load this new document to the corresponding PostgreSQL database table
-    postgres_loader.load_dataframe_to_postgres(
-        pd.DataFrame([new_customer]), "tbl_customers"
-    )
-
-    # 01. Execute the normalization function for loan restructuring
-    transformer.normalize_loan_restructuring()
-
-    # 11. Insert another new document into the customers collection
     another_customer = {
         "customer_id": 233361086626,
         "first_name": "Francyne",
@@ -81,19 +407,13 @@ def main():
         "location": "Denver",
         "joined_date": "2021-07-08T05:30:00+00:00",
     }
-
-    # 12. Insert the new document into the customers collection
-    mongo_extractor.insert_document(
-        "customers", collections_with_date_keys["customers"], another_customer
-    )
-
-    # Incremental Load: #2
-    # 13. Load this new document to the corresponding PostgreSQL database table
-    postgres_loader.load_dataframe_to_postgres(
-        pd.DataFrame([another_customer]), "tbl_customers"
+    mongo_extractor.insert_documents(
+        "customers",
+        [new_customer, another_customer],
+        collections_with_date_keys["customers"],
     )
 
-    # 14. Assigning tnewer values to a document that already exists in the collection
+    # Assigning newer values to a document that already exists in the collection
     updated_customer = {
         "customer_id": 311001854123,
         "first_name": "Ada",
@@ -105,8 +425,6 @@ def main():
         "location": "Birmingham",
         "joined_date": "2018-10-04T05:30:00+00:00",
     }
-
-    # 15. Update the document in the customers collection
     mongo_extractor.update_document(
         "customers",
         collections_with_date_keys["customers"],
@@ -114,15 +432,95 @@ def main():
         updated_customer,
     )
 
-    # Incremental Load: #3
-    # 16. Load this updated document to the corresponding PostgreSQL database table
-    postgres_loader.update_record_in_postgres(
-        pd.Series(updated_customer),
-        "tbl_customers",
-        unique_id_mapping["customers"]["unique_id_key_col"],
+
+def run_change_stream_replication(mongo_extractor, postgres_loader, transformer):
+    # Continue from the persisted resume token, if any
+    stream_name = "mongodb_to_postgres"
+    postgres_loader.ensure_cdc_state_table()
+    event_source = MongoChangeStreamSource(
+        mongo_extractor.db,
+        list(unique_id_mapping.keys()),
+        resume_token=postgres_loader.get_resume_token(stream_name),
     )
+    # The child fields of changed documents (e.g. `loans_applied`) replace the rows
+    # of their child tables
+    flattener = None
+    if flatten_nested_documents:
+        flattener = NestedDocumentFlattener(postgres_loader.resources)
+        flattener.ensure_child_tables()
+    replicator = ChangeStreamReplicator(
+        event_source,
+        postgres_loader,
+        transformer,
+        stream_name=stream_name,
+        flattener=flattener,
+    )
+    try:
+        replicator.run()
+    except KeyboardInterrupt:
+        print(f"Change-stream replication stopped: {replicator.metrics}")
+
+
+def main():
+    args = parse_args()
+
+    # 1. Create objects of Extractor, Transformer, and PostgresLoader sharing one
+    #    MongoClient and one PostgreSQL connection pool
+    resources = ResourceManager()
+    mongo_extractor = MongoExtractor(resources)
+    postgres_loader = PostgresLoader(resources)
+    transformer = Transformer(resources)
+
+    # FULL LOAD
+    # 2. Stamp, extract, transform and load every collection, flattening nested
+    #    documents in stream or normalizing them afterwards
+    if args.mode in ("full", "demo"):
+        run_full_load(
+            mongo_extractor,
+            postgres_loader,
+            transformer,
+            args.workers,
+            stamp_in_stream=args.stamp_in_stream,
+            resume=args.resume,
+            strategy=args.strategy,
+            partitions=args.partitions,
+            pipelined=args.pipelined,
+            transform_processes=args.transform_processes,
+            defer_indexes=args.defer_indexes,
+        )
+
+    # 3. Insert and update documents in MongoDB to simulate source changes
+    if args.mode == "demo":
+        simulate_source_changes(mongo_extractor)
+
+    # INCREMENTAL LOAD
+    # 4. Upsert only the documents added or modified since the last watermarks
+    if args.mode in ("incremental", "demo"):
+        IncrementalLoader(mongo_extractor, postgres_loader, transformer).run()
 
-    transformer.normalize_loan_restructuring()
+    # CHANGE-STREAM REPLICATION
+    # 5. Micro-batch MongoDB change events into PostgreSQL until interrupted
+    if args.mode == "cdc":
+        run_change_stream_replication(mongo_extractor, postgres_loader, transformer)
+
+    # ROLLBACK
+    # 6. Swap the tables replaced by the last swap full load back in
+    if args.mode == "rollback":
+        StagingTableLoader(postgres_loader).rollback(
+            [mapping["table_name"] for mapping in unique_id_mapping.values()]
+        )
+
+    # METRICS
+    # 7. Summarize the per-stage metrics and write the run report and Prometheus file
+    pool_stats = resources.stats()
+    print(f"Connection pool: {pool_stats}")
+    resources.metrics.print_summary()
+    resources.metrics.write_report(
+        args.metrics_report, {"mode": args.mode, "connection_pool": pool_stats}
+    )
+    resources.metrics.write_prometheus(args.metrics_prometheus, pool_stats)
+    print(f"Metrics written to {args.metrics_report} and {args.metrics_prometheus}.")
+    resources.close()
 
 
 if __name__ == "__main__":
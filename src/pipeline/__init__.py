@@ -0,0 +1,4 @@
+# # src/pipeline/__init__.py
+# from .scheduler import DependencyScheduler
+# from .incremental import IncrementalLoader
+# from .cdc import ChangeStreamReplicator
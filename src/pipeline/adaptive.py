@@ -0,0 +1,252 @@
+# adaptive.py
+"""
+AIMD (additive increase, multiplicative decrease) tuning of the batch size of each
+collection and of the number of concurrent chunk loads, driven by the latency and
+throughput of the batches of the running load.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    extraction_batch_size,
+    adaptive_min_batch_size,
+    adaptive_max_batch_size,
+    adaptive_batch_increase,
+    adaptive_decrease_factor,
+    adaptive_target_batch_seconds,
+    adaptive_max_batch_bytes,
+    adaptive_slowdown_ratio,
+    pinned_batch_sizes,
+)
+
+# Weight of the newest batch in the moving average of each stage's throughput
+THROUGHPUT_SMOOTHING = 0.3
+
+
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, maximum: int, minimum: int = 1, name: str = "load"):
+        """
+        Initializes the AdaptiveConcurrencyLimiter class.
+
+        A gate of `limit` slots around the chunk loads of every collection. The limit
+        starts at `maximum`, halves when a collection reports a slow target and grows
+        by one after `limit` healthy batches in a row.
+
+        Parameters:
+            maximum (int): Upper bound of concurrent loads, e.g. the scheduler's workers.
+            minimum (int): Lower bound of concurrent loads.
+            name (str): Used in log lines.
+        """
+        if maximum < minimum or minimum < 1:
+            raise ValueError("Expected 1 <= minimum <= maximum.")
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = maximum
+        self._in_use = 0
+        self._healthy_batches = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Holds one slot for the duration of the block, waiting while all are taken."""
+        with self._condition:
+            while self._in_use >= self.limit:
+                self._condition.wait()
+            self._in_use += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+
+    def increase(self):
+        """Reports a healthy batch; the limit grows by one after `limit` in a row."""
+        with self._condition:
+            self._healthy_batches += 1
+            if self.limit < self.maximum and self._healthy_batches >= self.limit:
+                self.limit += 1
+                self._healthy_batches = 0
+                print(f"Adaptive {self.name} concurrency raised to {self.limit}.")
+                self._condition.notify()
+
+    def decrease(self, reason: str):
+        """
+        Reports a slow batch and halves the limit. Batches already in flight under the
+        old limit report too, so further decreases wait for one target latency.
+        """
+        with self._condition:
+            self._healthy_batches = 0
+            now = time.monotonic()
+            if (
+                self.limit <= self.minimum
+                or now - self._last_decrease < adaptive_target_batch_seconds
+            ):
+                return
+            self.limit = max(self.minimum, int(self.limit * adaptive_decrease_factor))
+            self._last_decrease = now
+            print(
+                f"Adaptive {self.name} concurrency lowered to {self.limit} ({reason})."
+            )
+
+
+class AdaptiveBatchSize:
+    def __init__(
+        self,
+        collection_name: str,
+        limiter: AdaptiveConcurrencyLimiter = None,
+        initial: int = extraction_batch_size,
+        minimum: int = adaptive_min_batch_size,
+        maximum: int = adaptive_max_batch_size,
+        target_seconds: float = adaptive_target_batch_seconds,
+        max_batch_bytes: int = adaptive_max_batch_bytes,
+    ):
+        """
+        Initializes the AdaptiveBatchSize class.
+
+        Chooses the number of documents per chunk of one collection. Every batch the
+        extractor or loader processes is reported with `observe`; the batch size grows
+        by `adaptive_batch_increase` while batches stay healthy and is multiplied by
+        `adaptive_decrease_factor` when one of them:
+            - takes longer than `target_seconds`,
+            - would exceed `max_batch_bytes` at the measured bytes per row, or
+            - runs at less than `adaptive_slowdown_ratio` of its stage's recent
+              throughput (the source or target slowed down).
+        Slow "load" batches also lower the concurrency of `limiter`. A collection with
+        an entry in `pinned_batch_sizes` keeps that size.
+
+        Parameters:
+            collection_name (str): The collection the batches belong to.
+            limiter (AdaptiveConcurrencyLimiter): Optional gate of concurrent loads.
+            initial (int): Starting batch size.
+            minimum (int): Smallest batch size.
+            maximum (int): Largest batch size.
+            target_seconds (float): Latency above which a batch counts as slow.
+            max_batch_bytes (int): Memory bound of one batch.
+        """
+        self.collection_name = collection_name
+        self.limiter = limiter
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.max_batch_bytes = max_batch_bytes
+        self.pinned = collection_name in pinned_batch_sizes
+        self._batch_size = pinned_batch_sizes.get(
+            collection_name, min(max(initial, minimum), maximum)
+        )
+        self._bytes_per_row = None
+        self._throughput = {}
+        self._decreases = 0
+        self._lock = threading.Lock()
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    @contextmanager
+    def load_slot(self):
+        """Holds a slot of the concurrency limiter, if there is one."""
+        if self.limiter is None:
+            yield
+        else:
+            with self.limiter.slot():
+                yield
+
+    def _memory_bound(self) -> int:
+        if not self._bytes_per_row:
+            return self.maximum
+        return max(self.minimum, int(self.max_batch_bytes / self._bytes_per_row))
+
+    def observe(self, stage: str, rows: int, seconds: float, batch_bytes: int = 0):
+        """
+        Reports one batch of `stage` ("extract", "load", ...) and adapts the batch size.
+
+        Parameters:
+            stage (str): The stage that processed the batch.
+            rows (int): Rows in the batch.
+            seconds (float): Time the stage spent on the batch.
+            batch_bytes (int): In-memory size of the batch, if known.
+        """
+        if not rows or self.pinned:
+            return
+        rate = rows / seconds if seconds > 0 else None
+
+        with self._lock:
+            if batch_bytes:
+                self._bytes_per_row = batch_bytes / rows
+            recent = self._throughput.get(stage)
+            if rate is not None:
+                self._throughput[stage] = (
+                    rate
+                    if recent is None
+                    else recent + THROUGHPUT_SMOOTHING * (rate - recent)
+                )
+
+            reason = None
+            if seconds > self.target_seconds:
+                reason = f"{stage} batch of {rows} rows took {seconds:.2f}s"
+            elif self._batch_size > self._memory_bound():
+                reason = f"batches above {self.max_batch_bytes / 2**20:.0f} MiB"
+            elif (
+                rate is not None
+                and recent is not None
+                and rate < recent * adaptive_slowdown_ratio
+            ):
+                reason = (
+                    f"{stage} throughput fell to {rate:.0f} rows/s from {recent:.0f}"
+                )
+
+            previous = self._batch_size
+            if reason:
+                self._batch_size = max(
+                    self.minimum, int(previous * adaptive_decrease_factor)
+                )
+                self._decreases += 1
+                if self._batch_size != previous:
+                    print(
+                        f"Adaptive batch size of {self.collection_name} lowered to "
+                        f"{self._batch_size} ({reason})."
+                    )
+            else:
+                self._batch_size = min(
+                    self.maximum,
+                    self._memory_bound(),
+                    previous + adaptive_batch_increase,
+                )
+
+        if self.limiter is not None and stage == "load":
+            if reason:
+                self.limiter.decrease(f"{self.collection_name}: {reason}")
+            else:
+                self.limiter.increase()
+
+    def settings(self) -> dict:
+        """Returns the current batch size and what it was based on."""
+        with self._lock:
+            settings = {
+                "batch_size": self._batch_size,
+                "pinned": self.pinned,
+                "decreases": self._decreases,
+                "bytes_per_row": round(self._bytes_per_row or 0, 1),
+            }
+            settings.update(
+                {
+                    f"{stage}_rows_per_second": round(rate, 1)
+                    for stage, rate in self._throughput.items()
+                }
+            )
+        if self.limiter is not None:
+            settings["load_concurrency"] = self.limiter.limit
+        return settings
+
+    def log_settings(self):
+        """Prints the settings the collection ended with, in the form they are pinned."""
+        settings = self.settings()
+        print(
+            f"Adaptive settings for {self.collection_name}: {settings}. Pin with "
+            f'pinned_batch_sizes["{self.collection_name}"] = {settings["batch_size"]}.'
+        )
@@ -0,0 +1,337 @@
+# cdc.py
+
+import time
+from collections import OrderedDict
+
+from extraction.schema import build_typed_dataframe
+from loading.postgres_loader import FlattenedChunk
+from config import (
+    cdc_key_cache_size,
+    cdc_window_seconds,
+    cdc_window_size,
+    collection_dependencies,
+    nested_document_tables,
+    unique_id_mapping,
+)
+from pipeline.scheduler import DependencyScheduler
+
+
+def _document_id(event: dict):
+    return (event.get("documentKey") or {}).get("_id")
+
+
+class ChangeStreamReplicator:
+    def __init__(
+        self,
+        event_source,
+        postgres_loader,
+        transformer,
+        stream_name: str = "mongodb_to_postgres",
+        window_seconds: float = cdc_window_seconds,
+        window_size: int = cdc_window_size,
+        flattener=None,
+        key_cache_size: int = cdc_key_cache_size,
+    ):
+        """
+        Initializes the ChangeStreamReplicator class.
+
+        Consumes change events from `event_source` (see `extraction.change_events`),
+        coalesces them per collection and unique id over a window of `window_size`
+        events or `window_seconds` seconds, and applies each window to the matching
+        `tbl_*` table as one bulk upsert plus one bulk delete. The resume token is
+        persisted after every applied window, so a restart continues where it left off;
+        re-applying a window is harmless because upserts and deletes are idempotent.
+
+        Changed documents are projected onto the schema of their collection (see
+        `build_typed_dataframe`). With a `NestedDocumentFlattener`, their child fields
+        (e.g. the `loans_applied` of customers) replace the rows of their child
+        tables instead of being written to the collection's own table.
+        """
+        self.event_source = event_source
+        self.postgres_loader = postgres_loader
+        self.transformer = transformer
+        self.stream_name = stream_name
+        self.window_seconds = window_seconds
+        self.window_size = window_size
+        self.flattener = flattener
+        self.key_cache_size = key_cache_size
+
+        # Parents are upserted before children and deleted after them
+        self.apply_order = [
+            collection
+            for level in DependencyScheduler(collection_dependencies).execution_levels()
+            for collection in level
+        ]
+
+        # Unique ids of the documents seen last, by (collection, `_id`), for delete
+        # events that arrive without a pre-image; least recently used first
+        self._unique_ids = OrderedDict()
+
+        self.metrics = {
+            "events_total": 0,
+            "windows_total": 0,
+            "rows_upserted": 0,
+            "rows_deleted": 0,
+            "events_skipped": 0,
+            "events_dead_lettered": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "replication_lag_seconds": None,
+            "events_per_second": 0.0,
+        }
+        self._started_at = None
+
+    def _unique_id(self, collection_name: str, event: dict):
+        """
+        Returns the `unique_id_key_col` value a change event refers to, from its
+        documents or the cache of documents seen last, or None.
+        """
+        unique_id_col = unique_id_mapping[collection_name]["unique_id_key_col"]
+        key = (collection_name, _document_id(event))
+        for document in (event.get("fullDocument"), event.get("fullDocumentBeforeChange")):
+            if document and unique_id_col in document:
+                self._unique_ids[key] = document[unique_id_col]
+                self._unique_ids.move_to_end(key)
+                if len(self._unique_ids) > self.key_cache_size:
+                    self._unique_ids.popitem(last=False)
+                return document[unique_id_col]
+        if key in self._unique_ids:
+            self._unique_ids.move_to_end(key)
+            return self._unique_ids[key]
+        return None
+
+    def collect_window(self) -> list:
+        """Reads events until the window is full or its time has elapsed."""
+        events = []
+        deadline = time.monotonic() + self.window_seconds
+        while len(events) < self.window_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event = self.event_source.next_event(remaining)
+            if event is None:
+                break
+            events.append(event)
+        return events
+
+    def coalesce(self, events: list) -> dict:
+        """
+        Reduces a window to the last change per document:
+        {collection: {unique_id: (_id, full_document or None (delete))}}.
+
+        A delete whose unique id is in neither its pre-image nor the cache is looked
+        up in the `_id` → unique id mapping persisted with the upserts. Deletes
+        resolved by none (e.g. of documents last written before replication
+        started) are recorded with `PostgresLoader.record_dead_letters` and counted
+        in `events_dead_lettered`, so the window is still applied and its resume
+        token saved. Other events without a unique id are counted in
+        `events_skipped`.
+        """
+        resolved = []
+        unresolved = {}
+        for event in events:
+            collection_name = event["ns"]["coll"]
+            if collection_name not in unique_id_mapping:
+                continue
+            unique_id = self._unique_id(collection_name, event)
+            if unique_id is None and event["operationType"] == "delete":
+                unresolved.setdefault(collection_name, set()).add(_document_id(event))
+            resolved.append((collection_name, event, unique_id))
+        persisted = {
+            collection_name: self.postgres_loader.get_document_keys(
+                collection_name, list(document_ids)
+            )
+            for collection_name, document_ids in unresolved.items()
+        }
+
+        changes = {}
+        dead_letters = []
+        for collection_name, event, unique_id in resolved:
+            document_id = _document_id(event)
+            if unique_id is None and event["operationType"] == "delete":
+                unique_id = persisted[collection_name].get(document_id)
+            if unique_id is None:
+                if event["operationType"] == "delete":
+                    dead_letters.append(event)
+                    continue
+                self.metrics["events_skipped"] += 1
+                print(
+                    f"Skipping {event['operationType']} on '{collection_name}' "
+                    f"without a resolvable unique id."
+                )
+                continue
+
+            if event["operationType"] == "delete":
+                changes.setdefault(collection_name, {})[unique_id] = (document_id, None)
+            elif event.get("fullDocument") is not None:
+                changes.setdefault(collection_name, {})[unique_id] = (
+                    document_id,
+                    event["fullDocument"],
+                )
+            # An update whose document was deleted before the lookup carries no
+            # fullDocument; the delete event that follows removes the row.
+
+        if dead_letters:
+            self.postgres_loader.record_dead_letters(self.stream_name, dead_letters)
+            self.metrics["events_dead_lettered"] += len(dead_letters)
+            print(
+                f"Warning: {len(dead_letters)} delete(s) could not be resolved to a "
+                f"unique id and were recorded as dead letters; their rows remain. "
+                f"Enable changeStreamPreAndPostImages on the collections."
+            )
+        return changes
+
+    def build_chunk(self, documents: list, collection_name: str) -> FlattenedChunk:
+        """
+        Builds the rows of changed documents: their schema fields with the dtypes of
+        `collection_schemas` and naive UTC dates, and the rows of their child
+        tables, if the flattener handles the collection.
+        """
+        child_fields = (
+            self.flattener.child_fields(collection_name) if self.flattener else []
+        )
+        df = build_typed_dataframe(documents, collection_name, child_fields)
+        df = self.transformer.normalize_date_columns(df, collection_name)
+        if not child_fields:
+            return FlattenedChunk(df, [])
+        return self.flattener.flatten_children(df, collection_name)
+
+    def _child_tables(self, collection_name: str) -> list:
+        if self.flattener is None:
+            return []
+        fields = nested_document_tables[collection_name]["fields"]
+        return [
+            fields[field]["table_name"]
+            for field in self.flattener.child_fields(collection_name)
+        ]
+
+    def apply(self, changes: dict):
+        """
+        Applies coalesced changes: upserts in FK order, then deletes in reverse. The
+        `_id` → unique id mapping of upserted documents is persisted first, and the
+        rows of their child tables are replaced.
+        """
+        ordered = [c for c in self.apply_order if c in changes]
+        for collection_name in ordered:
+            mapping = unique_id_mapping[collection_name]
+            key_col = mapping["unique_id_key_col"]
+            collection_changes = changes[collection_name].items()
+            upserted = [
+                (unique_id, document_id, document)
+                for unique_id, (document_id, document) in collection_changes
+                if document is not None
+            ]
+            if not upserted:
+                continue
+            self.postgres_loader.save_document_keys(
+                collection_name,
+                [(document_id, unique_id) for unique_id, document_id, _ in upserted],
+            )
+            chunk = self.build_chunk(
+                [document for _, _, document in upserted], collection_name
+            )
+            counts = self.postgres_loader.upsert_dataframe_to_postgres(
+                chunk.frame,
+                mapping["table_name"],
+                key_col,
+                json_columns=[
+                    column
+                    for column in mapping["nested_documents"]
+                    if column in chunk.frame.columns
+                ],
+            )
+            self.metrics["rows_upserted"] += counts["inserted"] + counts["updated"]
+            for table_name, rows, json_columns in chunk.related:
+                self.postgres_loader.delete_records_from_postgres(
+                    table_name, key_col, chunk.frame[key_col].dropna().tolist()
+                )
+                if not rows.empty:
+                    self.postgres_loader.load_chunks_to_postgres(
+                        [rows], table_name, json_columns, raise_on_error=True
+                    )
+
+        for collection_name in reversed(ordered):
+            mapping = unique_id_mapping[collection_name]
+            deleted_ids = [
+                unique_id
+                for unique_id, (_, document) in changes[collection_name].items()
+                if document is None
+            ]
+            for table_name in self._child_tables(collection_name):
+                self.postgres_loader.delete_records_from_postgres(
+                    table_name, mapping["unique_id_key_col"], deleted_ids
+                )
+            self.metrics["rows_deleted"] += self.postgres_loader.delete_records_from_postgres(
+                mapping["table_name"], mapping["unique_id_key_col"], deleted_ids
+            )
+
+        if "loan_restructuring" in changes:
+            self.transformer.normalize_loan_restructuring()
+
+    def forget_deleted(self, changes: dict):
+        """
+        Drops the deleted documents of an applied window from the cache and from the
+        persisted `_id` → unique id mapping.
+        """
+        for collection_name, collection_changes in changes.items():
+            document_ids = [
+                document_id
+                for document_id, document in collection_changes.values()
+                if document is None
+            ]
+            for document_id in document_ids:
+                self._unique_ids.pop((collection_name, document_id), None)
+            self.postgres_loader.delete_document_keys(collection_name, document_ids)
+
+    def _record_window(self, events: list):
+        self.metrics["events_total"] += len(events)
+        self.metrics["windows_total"] += 1
+        self.metrics["last_batch_size"] = len(events)
+        self.metrics["max_batch_size"] = max(self.metrics["max_batch_size"], len(events))
+        cluster_time = events[-1].get("clusterTime")
+        if cluster_time is not None:
+            self.metrics["replication_lag_seconds"] = max(
+                0.0, time.time() - cluster_time.time
+            )
+        elapsed = time.monotonic() - self._started_at
+        if elapsed > 0:
+            self.metrics["events_per_second"] = self.metrics["events_total"] / elapsed
+
+    def run_once(self) -> int:
+        """Collects, applies and checkpoints one window. Returns the number of events."""
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        events = self.collect_window()
+        if not events:
+            return 0
+
+        changes = self.coalesce(events)
+        self.apply(changes)
+        self.postgres_loader.save_resume_token(
+            self.stream_name, self.event_source.resume_token
+        )
+        # Only once the token is saved: a window applied again still resolves them
+        self.forget_deleted(changes)
+        self._record_window(events)
+        print(
+            f"Applied window of {len(events)} events; "
+            f"lag {self.metrics['replication_lag_seconds']}s, "
+            f"{self.metrics['events_per_second']:.1f} events/s."
+        )
+        return len(events)
+
+    def run(self, stop_event=None, max_windows: int = None):
+        """
+        Replicates until `stop_event` is set or `max_windows` non-empty windows have
+        been applied.
+        """
+        windows = 0
+        try:
+            while stop_event is None or not stop_event.is_set():
+                if self.run_once():
+                    windows += 1
+                    if max_windows is not None and windows >= max_windows:
+                        break
+        finally:
+            self.event_source.close()
+        return self.metrics
@@ -0,0 +1,412 @@
+# metrics.py
+"""
+Per-collection, per-stage metrics of the pipeline: wall time, rows, bytes in and out,
+per-batch latencies and memory high-water marks. Collected by `MongoExtractor`,
+`Transformer` and `PostgresLoader` through the `PipelineMetrics` instance of their
+shared `ResourceManager`, and written as a JSON run report and a Prometheus text file.
+"""
+
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+
+from config import metrics_trace_memory
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Latency quantiles reported per stage
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def current_rss_bytes() -> int:
+    """Returns the resident set size of the process, falling back to its peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Returns the peak resident set size of the process (`ru_maxrss` is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def frame_bytes(df) -> int:
+    """
+    Returns the in-memory size of a DataFrame's columns. Object columns count their
+    pointers only, which keeps this O(columns) rather than O(rows).
+    """
+    return int(df.memory_usage(index=False, deep=False).sum())
+
+
+class PipelineMetrics:
+    def __init__(self, trace_memory: bool = metrics_trace_memory):
+        """
+        Initializes the PipelineMetrics class.
+
+        Every measured call adds one latency sample to its (collection, stage) entry
+        together with its rows and bytes, and the RSS of the process when it ended.
+        With `trace_memory`, `tracemalloc` is started as well and the traced Python
+        heap is recorded per call; this costs noticeably more and is off by default.
+        Thread-safe, so collections loading concurrently report to one instance.
+
+        Parameters:
+            trace_memory (bool): Record `tracemalloc` high-water marks too.
+        """
+        self.trace_memory = trace_memory
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forgets every recorded stage and starts a new run."""
+        with self._lock:
+            self._stages = {}
+            self._settings = {}
+            self._utilization = {}
+            self._coerced = {}
+            self.started_at = datetime.now(timezone.utc)
+            self._started = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def record(
+        self,
+        collection: str,
+        stage: str,
+        rows: int = 0,
+        seconds: float = 0.0,
+        bytes_in: int = 0,
+        bytes_out: int = 0,
+    ):
+        """Adds one call of `stage` for `collection`."""
+        rss = current_rss_bytes()
+        traced = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        with self._lock:
+            entry = self._stages.setdefault(
+                (collection, stage),
+                {
+                    "rows": 0,
+                    "bytes_in": 0,
+                    "bytes_out": 0,
+                    "samples": [],
+                    "peak_rss_bytes": 0,
+                    "peak_traced_bytes": 0,
+                },
+            )
+            entry["rows"] += rows
+            entry["bytes_in"] += bytes_in
+            entry["bytes_out"] += bytes_out
+            entry["samples"].append(seconds)
+            entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"], rss)
+            entry["peak_traced_bytes"] = max(entry["peak_traced_bytes"], traced)
+
+    def record_settings(self, collection: str, settings: dict):
+        """Keeps the settings a collection ran with (e.g. its adaptive batch size)."""
+        with self._lock:
+            self._settings[collection] = dict(settings)
+
+    def record_utilization(
+        self,
+        collection: str,
+        stage: str,
+        busy_seconds: float,
+        starved_seconds: float,
+        blocked_seconds: float,
+    ):
+        """
+        Adds the time a stage of a pipelined load (see `pipeline.pipelined`) spent
+        working, waiting for the previous stage (starved) and waiting for the next
+        one to take its output (blocked).
+        """
+        with self._lock:
+            entry = self._utilization.setdefault(
+                (collection, stage),
+                {"busy_seconds": 0.0, "starved_seconds": 0.0, "blocked_seconds": 0.0},
+            )
+            entry["busy_seconds"] += busy_seconds
+            entry["starved_seconds"] += starved_seconds
+            entry["blocked_seconds"] += blocked_seconds
+
+    def record_coerced(self, collection: str, column: str, count: int):
+        """Adds values of a column that could not be converted and were loaded as NULL."""
+        with self._lock:
+            self._coerced[(collection, column)] = (
+                self._coerced.get((collection, column), 0) + count
+            )
+
+    def coerced(self) -> dict:
+        """Returns the number of coerced values per collection and column."""
+        with self._lock:
+            entries = sorted(self._coerced.items())
+        coerced = {}
+        for (collection, column), count in entries:
+            coerced.setdefault(collection, {})[column] = count
+        return coerced
+
+    def utilization(self) -> dict:
+        """Returns the busy, starved and blocked seconds of every pipelined stage."""
+        with self._lock:
+            entries = sorted(self._utilization.items())
+        utilization = {}
+        for (collection, stage), entry in entries:
+            utilization.setdefault(collection, {})[stage] = {
+                key: round(value, 6) for key, value in entry.items()
+            }
+        return utilization
+
+    @contextmanager
+    def measure(self, collection: str, stage: str, rows: int = 0, bytes_in: int = 0):
+        """
+        Times the block as one call of `stage`. The block receives a dict holding
+        `rows`, `bytes_in` and `bytes_out` and may update it once it knows them. A
+        block that raises is not recorded.
+        """
+        sample = {"rows": rows, "bytes_in": bytes_in, "bytes_out": 0}
+        started = time.perf_counter()
+        yield sample
+        self.record(
+            collection,
+            stage,
+            sample["rows"],
+            time.perf_counter() - started,
+            sample["bytes_in"],
+            sample["bytes_out"],
+        )
+
+    def summary(self) -> dict:
+        """
+        Returns the stages per collection, each with calls, rows, seconds,
+        rows_per_second, bytes_in, bytes_out, p50/p95/p99 batch latency in
+        milliseconds and the RSS (and traced heap) high-water marks.
+        """
+        with self._lock:
+            stages = {
+                key: dict(entry, samples=list(entry["samples"]))
+                for key, entry in self._stages.items()
+            }
+
+        summary = {}
+        for (collection, stage), entry in sorted(stages.items()):
+            seconds = float(sum(entry["samples"]))
+            latencies = np.array(entry["samples"]) * 1000
+            result = {
+                "calls": len(entry["samples"]),
+                "rows": entry["rows"],
+                "seconds": round(seconds, 6),
+                "rows_per_second": round(entry["rows"] / seconds, 1)
+                if seconds > 0
+                else 0.0,
+                "bytes_in": entry["bytes_in"],
+                "bytes_out": entry["bytes_out"],
+            }
+            for quantile in QUANTILES:
+                result[f"p{int(quantile * 100)}_ms"] = round(
+                    float(np.quantile(latencies, quantile)), 3
+                )
+            result["peak_rss_bytes"] = entry["peak_rss_bytes"]
+            if self.trace_memory:
+                result["peak_traced_bytes"] = entry["peak_traced_bytes"]
+            summary.setdefault(collection, {})[stage] = result
+        return summary
+
+    def report(self, extra: dict = None) -> dict:
+        """Returns the run report: run timings, process memory, stages and `extra`."""
+        report = {
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+        if self.trace_memory and tracemalloc.is_tracing():
+            report["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        report["collections"] = self.summary()
+        with self._lock:
+            report["settings"] = {
+                collection: dict(settings)
+                for collection, settings in sorted(self._settings.items())
+            }
+        report["utilization"] = self.utilization()
+        report["coerced_values"] = self.coerced()
+        report.update(extra or {})
+        return report
+
+    def to_prometheus(self, extra: dict = None) -> str:
+        """
+        Renders the stages in the Prometheus text exposition format: counters for
+        rows, bytes, seconds and calls, a summary of batch latencies and gauges for
+        the memory high-water marks, the busy/starved/blocked time of pipelined stages,
+        counters of the values coerced to NULL per column, and the numeric settings of
+        each collection as `etl_setting` gauges. Numeric values of `extra` become
+        gauges named `etl_<key>`.
+        """
+        summary = self.summary()
+        lines = []
+
+        def family(name, metric_type, help_text, values):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.extend(values)
+
+        def labelled(collection, stage, extra_labels=""):
+            return f'{{collection="{collection}",stage="{stage}"{extra_labels}}}'
+
+        entries = [
+            (collection, stage, result)
+            for collection, stages in summary.items()
+            for stage, result in stages.items()
+        ]
+        for name, key, help_text in (
+            ("etl_stage_rows_total", "rows", "Rows processed by a stage."),
+            ("etl_stage_bytes_in_total", "bytes_in", "Bytes a stage received."),
+            ("etl_stage_bytes_out_total", "bytes_out", "Bytes a stage produced."),
+            ("etl_stage_seconds_total", "seconds", "Wall time spent in a stage."),
+            ("etl_stage_calls_total", "calls", "Batches processed by a stage."),
+        ):
+            family(
+                name,
+                "counter",
+                help_text,
+                [
+                    f"{name}{labelled(collection, stage)} {result[key]}"
+                    for collection, stage, result in entries
+                ],
+            )
+
+        latency_lines = []
+        for collection, stage, result in entries:
+            for quantile in QUANTILES:
+                labels = labelled(collection, stage, f',quantile="{quantile}"')
+                seconds = result[f"p{int(quantile * 100)}_ms"] / 1000
+                latency_lines.append(
+                    f"etl_stage_batch_latency_seconds{labels} {seconds}"
+                )
+            latency_lines.append(
+                f"etl_stage_batch_latency_seconds_sum{labelled(collection, stage)} "
+                f"{result['seconds']}"
+            )
+            latency_lines.append(
+                f"etl_stage_batch_latency_seconds_count{labelled(collection, stage)} "
+                f"{result['calls']}"
+            )
+        family(
+            "etl_stage_batch_latency_seconds",
+            "summary",
+            "Latency of one batch in a stage.",
+            latency_lines,
+        )
+
+        memory_gauges = [("peak_rss_bytes", "Highest RSS seen at the end of a batch.")]
+        if self.trace_memory:
+            memory_gauges.append(
+                ("peak_traced_bytes", "Highest traced heap seen at the end of a batch.")
+            )
+        for key, help_text in memory_gauges:
+            name = f"etl_stage_{key}"
+            family(
+                name,
+                "gauge",
+                help_text,
+                [
+                    f"{name}{labelled(collection, stage)} {result[key]}"
+                    for collection, stage, result in entries
+                ],
+            )
+
+        utilization_lines = []
+        for collection, stages in self.utilization().items():
+            for stage, states in stages.items():
+                for state in ("busy", "starved", "blocked"):
+                    labels = labelled(collection, stage, f',state="{state}"')
+                    utilization_lines.append(
+                        f"etl_stage_utilization_seconds_total{labels} "
+                        f"{states[state + '_seconds']}"
+                    )
+        family(
+            "etl_stage_utilization_seconds_total",
+            "counter",
+            "Time a pipelined stage spent busy, starved or blocked.",
+            utilization_lines,
+        )
+
+        family(
+            "etl_coerced_values_total",
+            "counter",
+            "Values that could not be converted and were loaded as NULL.",
+            [
+                f"etl_coerced_values_total"
+                f'{{collection="{collection}",column="{column}"}} {count}'
+                for collection, columns in self.coerced().items()
+                for column, count in columns.items()
+            ],
+        )
+
+        with self._lock:
+            settings = sorted(self._settings.items())
+        family(
+            "etl_setting",
+            "gauge",
+            "Numeric setting a collection ran with.",
+            [
+                f'etl_setting{{collection="{collection}",setting="{key}"}} {value}'
+                for collection, values in settings
+                for key, value in values.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)
+            ],
+        )
+        family(
+            "etl_process_peak_rss_bytes",
+            "gauge",
+            "Peak resident set size of the process.",
+            [f"etl_process_peak_rss_bytes {peak_rss_bytes()}"],
+        )
+        for key, value in (extra or {}).items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                family(f"etl_{key}", "gauge", f"{key}.", [f"etl_{key} {value}"])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write_atomically(path: str, text: str):
+        # Scrapers (e.g. node_exporter's textfile collector) never see a partial file
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as f:
+            f.write(text)
+        os.replace(temporary_path, path)
+
+    def write_report(self, path: str, extra: dict = None):
+        """Writes the JSON run report to `path`."""
+        self._write_atomically(
+            path, json.dumps(self.report(extra), indent=4, default=str)
+        )
+
+    def write_prometheus(self, path: str, extra: dict = None):
+        """Writes the Prometheus text file to `path`."""
+        self._write_atomically(path, self.to_prometheus(extra))
+
+    def print_summary(self):
+        """Prints one line per collection and stage."""
+        summary = self.summary()
+        if not summary:
+            return
+        print(
+            f"{'collection':<22}{'stage':<11}{'rows':>10}{'seconds':>10}{'rows/sec':>12}"
+            f"{'MiB in':>9}{'MiB out':>9}{'p95 ms':>10}{'peak RSS MiB':>14}"
+        )
+        for collection, stages in summary.items():
+            for stage, result in stages.items():
+                print(
+                    f"{collection:<22}{stage:<11}{result['rows']:>10}"
+                    f"{result['seconds']:>10.3f}{result['rows_per_second']:>12.0f}"
+                    f"{result['bytes_in'] / 2**20:>9.1f}{result['bytes_out'] / 2**20:>9.1f}"
+                    f"{result['p95_ms']:>10.3f}{result['peak_rss_bytes'] / 2**20:>14.1f}"
+                )
@@ -0,0 +1,239 @@
+# partitioned.py
+
+import time
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from config import adaptive_batching, unique_id_mapping
+from pipeline.adaptive import AdaptiveBatchSize
+from pipeline.pipelined import ChunkPipeline, chunk_preparer
+
+
+class PartitionedCollectionLoader:
+    def __init__(
+        self,
+        mongo_extractor,
+        postgres_loader,
+        transform_chunk=None,
+        limiter=None,
+        pipelined=False,
+        transform_pool=None,
+        flattener=None,
+    ):
+        """
+        Initializes the PartitionedCollectionLoader class.
+
+        Splits one collection into key ranges at sampled split points and extracts
+        and loads every range on its own worker, with its own MongoDB cursor and
+        pooled PostgreSQL connection, so one large collection is no longer bound to
+        a single cursor and connection.
+
+        Every range is checkpointed as `{collection}/partition-{n}`. The key and split
+        points are stored as the checkpoint `{collection}/partitions`, so a resumed
+        load reuses the same ranges. Once every range is loaded, the collection's own
+        checkpoint is marked final with the total row count.
+
+        Parameters:
+            mongo_extractor (MongoExtractor): Source of the chunks.
+            postgres_loader (PostgresLoader): Loads the chunks and keeps the checkpoints.
+            transform_chunk (callable): Called with (chunk, collection) before loading.
+            limiter (AdaptiveConcurrencyLimiter): Shared gate of concurrent chunk loads.
+            pipelined (bool): Extract, transform and load the chunks of every range in
+                              concurrent stages (see `ChunkPipeline`).
+            transform_pool (ProcessTransformPool): Renders the chunks of the pipelined
+                                                   loads of the collections it handles.
+            flattener (NestedDocumentFlattener): Its nested fields are extracted with
+                                                 the chunks, for `transform_chunk` to
+                                                 flatten.
+        """
+        self.mongo_extractor = mongo_extractor
+        self.postgres_loader = postgres_loader
+        self.transform_chunk = transform_chunk or (lambda chunk, collection: chunk)
+        self.limiter = limiter
+        self.pipelined = pipelined
+        self.transform_pool = transform_pool
+        self.flattener = flattener
+
+    @staticmethod
+    def plan_name(collection_name: str) -> str:
+        return f"{collection_name}/partitions"
+
+    @staticmethod
+    def partition_name(collection_name: str, index: int) -> str:
+        return f"{collection_name}/partition-{index + 1}"
+
+    def get_plan(self, collection_name: str):
+        """
+        Returns the stored {"key": ..., "split_points": [...]} of an interrupted
+        partitioned load, or None.
+        """
+        checkpoint = self.postgres_loader.get_checkpoint(
+            self.plan_name(collection_name)
+        )
+        return checkpoint["source_position"] if checkpoint else None
+
+    def plan(self, collection_name: str, partitions: int, key: str) -> dict:
+        """Samples split points for `partitions` ranges of `key` and stores them."""
+        plan = {
+            "key": key,
+            "split_points": self.mongo_extractor.compute_split_points(
+                collection_name, partitions, key
+            ),
+        }
+        self.postgres_loader.save_checkpoint(
+            self.plan_name(collection_name), 0, plan, 0
+        )
+        return plan
+
+    def load_partition(
+        self, collection_name: str, table_name: str, index: int, bounds, key, resume
+    ) -> dict:
+        """
+        Extracts and loads one key range, continuing after its last checkpoint when
+        resuming.
+
+        Returns:
+            dict: The partition's index, bounds, rows loaded now and in total, and seconds.
+        """
+        lower, upper, query = bounds
+        name = self.partition_name(collection_name, index)
+        checkpoint = self.postgres_loader.get_checkpoint(name) if resume else None
+        started = time.perf_counter()
+
+        rows_loaded = 0
+        if not (checkpoint and checkpoint["is_final"]):
+            controller = (
+                AdaptiveBatchSize(collection_name, self.limiter)
+                if adaptive_batching
+                else None
+            )
+            source = self.mongo_extractor.iter_collection_chunks_with_positions(
+                collection_name,
+                query=query,
+                start_after=checkpoint["source_position"] if checkpoint else None,
+                controller=controller,
+                key=key,
+                extra_fields=(
+                    self.flattener.source_fields(collection_name)
+                    if self.flattener
+                    else ()
+                ),
+            )
+            method = self.postgres_loader.get_load_method(table_name)
+            if self.pipelined:
+                pool = self.transform_pool
+                if pool is not None and not pool.handles(collection_name):
+                    pool = None
+                pipeline = ChunkPipeline(name, self.postgres_loader.resources.metrics)
+                chunks = pipeline.stream(
+                    source,
+                    chunk_preparer(
+                        self.postgres_loader,
+                        self.transform_chunk,
+                        collection_name,
+                        method,
+                        pool,
+                    ),
+                    in_flight=pool.processes if pool else 1,
+                )
+            else:
+                pipeline = nullcontext()
+                chunks = (
+                    (position, self.transform_chunk(chunk, collection_name))
+                    for position, chunk in source
+                )
+            with pipeline:
+                rows_loaded = self.postgres_loader.load_chunks_to_postgres(
+                    chunks,
+                    table_name,
+                    json_columns=unique_id_mapping[collection_name]["nested_documents"],
+                    method=method,
+                    raise_on_error=True,
+                    checkpoint_name=name,
+                    resume_from=checkpoint,
+                    controller=controller,
+                )
+            if controller is not None:
+                self.postgres_loader.resources.metrics.record_settings(
+                    name, controller.settings()
+                )
+
+        final = self.postgres_loader.get_checkpoint(name)
+        progress = {
+            "partition": index + 1,
+            "lower": lower,
+            "upper": upper,
+            "rows_loaded": rows_loaded,
+            "rows_total": final["rows_committed"] if final else 0,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+        print(
+            f"{collection_name} partition {index + 1} [{lower}, {upper}): "
+            f"{progress['rows_loaded']} rows loaded ({progress['rows_total']} in total) "
+            f"in {progress['seconds']}s."
+        )
+        return progress
+
+    def run(
+        self,
+        collection_name: str,
+        table_name: str,
+        partitions: int,
+        key: str = "_id",
+        resume: bool = False,
+    ) -> int:
+        """
+        Loads a collection into `table_name` as `partitions` key ranges in parallel.
+        With `resume`, the stored key and split points are reused and finished ranges
+        are skipped. A failed range fails the collection after the others have finished;
+        its checkpoints are kept for `--resume`.
+
+        Parameters:
+            collection_name (str): The collection to load.
+            table_name (str): The table (or staging table) to load into.
+            partitions (int): Number of ranges, and of workers.
+            key (str): Unique, indexed field to split on, e.g. `_id`.
+            resume (bool): Continue an interrupted partitioned load.
+
+        Returns:
+            int: The number of rows loaded by this call.
+        """
+        plan = self.get_plan(collection_name) if resume else None
+        if plan is None:
+            plan = self.plan(collection_name, partitions, key)
+        key = plan["key"]
+        ranges = self.mongo_extractor.partition_ranges(plan["split_points"], key)
+        print(
+            f"Loading {collection_name} as {len(ranges)} partitions of '{key}' "
+            f"split at {plan['split_points']}."
+        )
+
+        with ThreadPoolExecutor(
+            max_workers=len(ranges), thread_name_prefix=f"{collection_name}-partition"
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self.load_partition,
+                    collection_name,
+                    table_name,
+                    index,
+                    bounds,
+                    key,
+                    resume,
+                )
+                for index, bounds in enumerate(ranges)
+            ]
+            errors = [future.exception() for future in futures]
+        failed = [error for error in errors if error is not None]
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)} of {len(ranges)} partitions of {collection_name} "
+                f"failed: {failed[0]}"
+            ) from failed[0]
+
+        progress = [future.result() for future in futures]
+        rows_total = sum(partition["rows_total"] for partition in progress)
+        self.postgres_loader.save_checkpoint(
+            collection_name, len(ranges), None, rows_total, is_final=True
+        )
+        return sum(partition["rows_loaded"] for partition in progress)
@@ -0,0 +1,329 @@
+# pipelined.py
+"""
+Overlapped extraction, transformation and loading of the chunks of one collection:
+each stage runs in its own thread and hands its chunks to the next stage through a
+bounded queue.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from loading.postgres_loader import FlattenedChunk
+from config import pipeline_queue_size, unique_id_mapping
+
+STAGES = ("extract", "transform", "load")
+
+# How often a stage waiting on a queue checks whether the pipeline was closed
+POLL_SECONDS = 0.1
+
+# Sent down the queues after the last chunk
+_DONE = object()
+
+
+class _Failure:
+    """Carries the exception of a stage down the queues to the consumer."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _is_last(item) -> bool:
+    return item is _DONE or isinstance(item, _Failure)
+
+
+def _completed(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+def chunk_preparer(
+    postgres_loader,
+    transform_chunk,
+    collection_name: str,
+    method: str,
+    transform_pool=None,
+):
+    """
+    Returns the transform stage of a pipelined load of a collection. Every
+    (position, chunk) pair is transformed with `transform_chunk` and, when the table
+    loads with COPY, rendered to its CSV payload by `PostgresLoader.render_copy_chunk`,
+    so NaT/NULL handling and JSON serialization run in the transform stage too and
+    the load stage only streams bytes to PostgreSQL. The rendering is recorded as the
+    "render" stage of the collection. Of a `FlattenedChunk`, only the collection's
+    own rows are rendered; its related rows are copied by the load stage.
+
+    With a `ProcessTransformPool`, the rendering runs in its workers and the stage
+    returns a Future of the pair; `ChunkPipeline.stream` keeps `in_flight` of them
+    pending and hands them on in order.
+    """
+    json_columns = unique_id_mapping[collection_name]["nested_documents"]
+    metrics = postgres_loader.resources.metrics
+
+    def record_render(chunk, seconds):
+        metrics.record(
+            collection_name,
+            "render",
+            len(chunk),
+            seconds,
+            chunk.frame_bytes,
+            chunk.bytes_written,
+        )
+
+    def prepare(item):
+        position, chunk = item
+        chunk = transform_chunk(chunk, collection_name)
+        if method != "copy":
+            return position, chunk
+        flattened = chunk if isinstance(chunk, FlattenedChunk) else None
+        frame = flattened.frame if flattened else chunk
+
+        def rendered(frame):
+            return flattened.with_frame(frame) if flattened else frame
+
+        if transform_pool is None:
+            started = time.perf_counter()
+            frame = postgres_loader.render_copy_chunk(frame, json_columns)
+            record_render(frame, time.perf_counter() - started)
+            return position, rendered(frame)
+
+        rendering = transform_pool.submit_render(frame, json_columns)
+        prepared = Future()
+
+        def hand_on(rendering):
+            try:
+                frame, seconds = rendering.result()
+            except BaseException as error:
+                prepared.set_exception(error)
+                return
+            record_render(frame, seconds)
+            prepared.set_result((position, rendered(frame)))
+
+        rendering.add_done_callback(hand_on)
+        return prepared
+
+    return prepare
+
+
+class ChunkPipeline:
+    def __init__(self, name: str, metrics=None, queue_size: int = pipeline_queue_size):
+        """
+        Initializes the ChunkPipeline class.
+
+        `stream(source, transform)` pulls chunks from `source` in an extract thread and
+        applies `transform` to them in a transform thread, while the caller loads the
+        chunks it iterates. MongoDB reads, transformation and PostgreSQL writes of
+        consecutive chunks therefore overlap. Consecutive stages share a queue of
+        `queue_size` chunks, and a stage that gets that far ahead waits for the next
+        one (backpressure), so at most `2 * queue_size + 3` chunks are held at once.
+        Chunks keep their order, so checkpoints stay valid. When `transform` returns
+        Futures (e.g. of a process pool), up to `in_flight` chunks are transformed at
+        once and held on top of that.
+
+        An exception in the extract or transform stage is re-raised to the caller by
+        the iteration, in order after the chunks before it. Leaving the `with` block,
+        normally or on an error, stops the stages, closes `source` and joins the
+        threads.
+
+        Each stage's time is split into busy, starved (waiting for the previous stage)
+        and blocked (waiting for the next stage to take its output). On close it is
+        recorded under `name` in `metrics` and printed with the stage that was busy
+        longest, i.e. whether the source, the transformation or the sink limits
+        the load.
+
+        Parameters:
+            name (str): The collection (or partition) the chunks belong to.
+            metrics (PipelineMetrics): Receives the busy/starved/blocked time per stage.
+            queue_size (int): Chunks a stage may run ahead of the next one.
+        """
+        if queue_size < 1:
+            raise ValueError("Expected queue_size >= 1.")
+        self.name = name
+        self.metrics = metrics
+        self.queue_size = queue_size
+        self.times = {
+            stage: {"busy": 0.0, "starved": 0.0, "blocked": 0.0} for stage in STAGES
+        }
+        self._closed = threading.Event()
+        self._threads = []
+        self._started = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _put(self, stage: str, output: queue.Queue, item) -> bool:
+        """Puts `item` on `output`, waiting for room; False once the pipeline is closed."""
+        started = time.perf_counter()
+        try:
+            while not self._closed.is_set():
+                try:
+                    output.put(item, timeout=POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            self.times[stage]["blocked"] += time.perf_counter() - started
+
+    def _get(self, stage: str, input_queue: queue.Queue):
+        """Takes the next item of `input_queue`; `_DONE` once the pipeline is closed."""
+        started = time.perf_counter()
+        try:
+            while not self._closed.is_set():
+                try:
+                    return input_queue.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            self.times[stage]["starved"] += time.perf_counter() - started
+
+    def _extract(self, source, output: queue.Queue):
+        iterator = iter(source)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    item = _DONE
+                except Exception as error:
+                    item = _Failure(error)
+                self.times["extract"]["busy"] += time.perf_counter() - started
+                if not self._put("extract", output, item) or _is_last(item):
+                    return
+        finally:
+            # Closes the cursor of a generator source stopped early
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def _transform(
+        self, transform, input_queue: queue.Queue, output: queue.Queue, in_flight: int
+    ):
+        times = self.times["transform"]
+        pending = deque()
+        last = None
+        try:
+            while True:
+                # Hand on, in order, the chunks that are ready; wait for the oldest one
+                # while `in_flight` are pending or once the input has ended
+                while pending and (
+                    last is not None or len(pending) >= in_flight or pending[0].done()
+                ):
+                    started = time.perf_counter()
+                    try:
+                        result = pending.popleft().result()
+                    except Exception as error:
+                        result = _Failure(error)
+                    times["busy"] += time.perf_counter() - started
+                    if not self._put("transform", output, result) or _is_last(result):
+                        return
+                if last is not None:
+                    self._put("transform", output, last)
+                    return
+
+                item = self._get("transform", input_queue)
+                if _is_last(item):
+                    last = item
+                    continue
+                started = time.perf_counter()
+                try:
+                    result = transform(item)
+                    pending.append(
+                        result if isinstance(result, Future) else _completed(result)
+                    )
+                except Exception as error:
+                    last = _Failure(error)
+                times["busy"] += time.perf_counter() - started
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def stream(self, source, transform, in_flight: int = 1):
+        """
+        Starts the extract and transform stages and returns the iterator of
+        transformed chunks, which the caller consumes as the load stage.
+
+        Parameters:
+            source (iterable): The chunks to extract, e.g. a `MongoExtractor` generator.
+            transform (callable): Called with every item of `source`; may return a
+                                  Future of the transformed item.
+            in_flight (int): Futures of `transform` pending at once.
+        """
+        if in_flight < 1:
+            raise ValueError("Expected in_flight >= 1.")
+        if self._started is not None:
+            raise RuntimeError(f"Pipeline of {self.name} was already started.")
+        self._started = time.perf_counter()
+        extracted = queue.Queue(self.queue_size)
+        transformed = queue.Queue(self.queue_size)
+        self._threads = [
+            threading.Thread(
+                target=self._extract,
+                args=(source, extracted),
+                name=f"{self.name}-extract",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._transform,
+                args=(transform, extracted, transformed, in_flight),
+                name=f"{self.name}-transform",
+                daemon=True,
+            ),
+        ]
+        for thread in self._threads:
+            thread.start()
+        return self._load(transformed)
+
+    def _load(self, input_queue: queue.Queue):
+        while True:
+            item = self._get("load", input_queue)
+            if item is _DONE:
+                if self._closed.is_set():
+                    raise RuntimeError(f"Pipeline of {self.name} was closed.")
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            resumed = time.perf_counter()
+            yield item
+            self.times["load"]["busy"] += time.perf_counter() - resumed
+
+    def close(self):
+        """Stops the stages, waits for their threads and reports the stage times."""
+        if self._started is None or self._closed.is_set():
+            return
+        self._closed.set()
+        for thread in self._threads:
+            thread.join()
+        seconds = max(time.perf_counter() - self._started, 1e-9)
+
+        if self.metrics is not None:
+            for stage, times in self.times.items():
+                self.metrics.record_utilization(
+                    self.name,
+                    stage,
+                    times["busy"],
+                    times["starved"],
+                    times["blocked"],
+                )
+        shares = ", ".join(
+            f"{stage} busy {times['busy'] / seconds:.0%} "
+            f"starved {times['starved'] / seconds:.0%} "
+            f"blocked {times['blocked'] / seconds:.0%}"
+            for stage, times in self.times.items()
+        )
+        print(
+            f"{self.name} pipeline ({seconds:.2f}s): {shares}; "
+            f"bottleneck: {self.bottleneck()}."
+        )
+
+    def bottleneck(self) -> str:
+        """Returns the stage that was busy longest."""
+        return max(STAGES, key=lambda stage: self.times[stage]["busy"])
@@ -0,0 +1,139 @@
+# scheduler.py
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import collection_dependencies, max_parallel_collections
+
+
+class DependencyScheduler:
+    def __init__(
+        self,
+        dependencies: dict = collection_dependencies,
+        max_workers: int = max_parallel_collections,
+    ):
+        """
+        Initializes the DependencyScheduler class.
+
+        Parameters:
+        dependencies (dict): Maps each collection to the collections it depends on.
+        max_workers (int): Number of collections processed concurrently.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+
+        self.dependencies = {
+            node: list(parents) for node, parents in dependencies.items()
+        }
+        self.max_workers = max_workers
+
+        for node, parents in self.dependencies.items():
+            for parent in parents:
+                if parent not in self.dependencies:
+                    raise ValueError(
+                        f"'{node}' depends on unknown collection '{parent}'."
+                    )
+
+        # Raises on cycles
+        self.execution_levels()
+
+    def _subgraph(self, nodes):
+        """Restricts the dependency graph to `nodes`, dropping edges to other nodes."""
+        if nodes is None:
+            return self.dependencies
+        nodes = list(nodes)
+        unknown = [node for node in nodes if node not in self.dependencies]
+        if unknown:
+            raise ValueError(f"No dependency entry for {unknown}.")
+        return {
+            node: [parent for parent in self.dependencies[node] if parent in nodes]
+            for node in nodes
+        }
+
+    def execution_levels(self, nodes=None) -> list:
+        """
+        Returns the collections grouped into levels; every collection only depends on
+        collections in earlier levels, so each level can run concurrently.
+        """
+        graph = self._subgraph(nodes)
+        remaining = {node: set(parents) for node, parents in graph.items()}
+        levels = []
+        while remaining:
+            ready = [node for node, parents in remaining.items() if not parents]
+            if not ready:
+                raise ValueError(
+                    f"Dependency cycle between collections: {sorted(remaining)}."
+                )
+            levels.append(ready)
+            for node in ready:
+                del remaining[node]
+            for parents in remaining.values():
+                parents.difference_update(ready)
+        return levels
+
+    def run(self, task, nodes=None) -> dict:
+        """
+        Runs `task(collection)` for every collection on a worker pool, starting each
+        collection as soon as all of its dependencies have completed.
+
+        A collection whose task raises is reported as failed and every collection that
+        depends on it (directly or transitively) is skipped; independent collections
+        keep running.
+
+        Parameters:
+        task (callable): Called with the collection name.
+        nodes (iterable): Collections to run; defaults to every collection in the graph.
+
+        Returns:
+        dict: {"results": {collection: result}, "failed": {collection: error},
+               "skipped": [collections]}
+        """
+        graph = self._subgraph(nodes)
+        waiting_on = {node: set(parents) for node, parents in graph.items()}
+        dependents = {node: [] for node in graph}
+        for node, parents in graph.items():
+            for parent in parents:
+                dependents[parent].append(node)
+
+        results, failed, skipped = {}, {}, []
+
+        def skip_dependents(node):
+            for child in dependents[node]:
+                if child in waiting_on:
+                    del waiting_on[child]
+                    skipped.append(child)
+                    skip_dependents(child)
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="migrate"
+        ) as executor:
+            running = {}
+
+            def submit_ready():
+                for node in [n for n, parents in waiting_on.items() if not parents]:
+                    del waiting_on[node]
+                    running[executor.submit(task, node)] = node
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        print(f"Migration of '{node}' failed: {error}")
+                        failed[node] = error
+                        skip_dependents(node)
+                        continue
+                    results[node] = future.result()
+                    for child in dependents[node]:
+                        if child in waiting_on:
+                            waiting_on[child].discard(node)
+                submit_ready()
+
+        if skipped:
+            print(f"Skipped because a dependency failed: {skipped}")
+        print(
+            f"Scheduler finished: {len(results)} completed, {len(failed)} failed, "
+            f"{len(skipped)} skipped."
+        )
+        return {"results": results, "failed": failed, "skipped": skipped}
@@ -0,0 +1,129 @@
+# transform_pool.py
+"""
+Process pool for the CPU-bound part of the transform stage: rendering chunks as the
+CSV payload of their COPY (NULL and date handling, JSON and CSV encoding). Chunks
+travel to the workers as Arrow IPC buffers and come back as rendered payloads, so no
+DataFrame or row is pickled. Nested documents, which Arrow structs would change, are
+sent alongside as one BSON document per chunk and serialized to JSON in the worker.
+"""
+
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import bson
+import pandas as pd
+import pyarrow as pa
+from bson.errors import InvalidDocument
+
+from loading.postgres_loader import PostgresLoader
+from pipeline.metrics import frame_bytes
+from config import transform_processes, process_transform_collections
+
+
+def to_ipc_buffer(df) -> pa.Buffer:
+    """
+    Serializes a DataFrame as an Arrow IPC stream. The pandas metadata is kept, so
+    nullable, categorical and datetime dtypes come back as they were. Columns of
+    nested documents have to be left out: as Arrow structs they would gain null
+    keys, widen integers to floats and lose lists.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def _render_in_process(
+    buffer, nested: bytes, columns: list, json_columns: list, source_bytes: int
+):
+    """
+    Worker entry point: reads an IPC buffer, puts back the nested document columns
+    decoded from the `nested` BSON document and renders the chunk for COPY.
+    """
+    started = time.perf_counter()
+    df = pa.ipc.open_stream(buffer).read_all().to_pandas()
+    for column, values in bson.decode(nested).items():
+        df[column] = pd.Series(values, dtype=object)
+    chunk = PostgresLoader.render_copy_chunk(df[columns], json_columns)
+    chunk.frame_bytes = source_bytes
+    return chunk, time.perf_counter() - started
+
+
+class ProcessTransformPool:
+    def __init__(
+        self,
+        processes: int = transform_processes,
+        collections_list: list = process_transform_collections,
+    ):
+        """
+        Initializes the ProcessTransformPool class.
+
+        Renders the COPY payloads of the chunks of `collections_list` in `processes`
+        worker processes, so the rendering of several chunks runs on several cores.
+        Workers are spawned rather than forked, since the parent holds MongoDB and
+        PostgreSQL connections and their threads. The nested documents of a chunk are
+        encoded in one BSON document, a single C call in the calling thread, and
+        serialized to JSON by the worker. A chunk Arrow or BSON cannot represent (e.g.
+        a column of mixed types) is rendered in the calling thread.
+
+        Parameters:
+            processes (int): Worker processes, and chunks rendered at once.
+            collections_list (list): Collections whose chunks are sent to the pool.
+        """
+        if processes < 1:
+            raise ValueError("Expected processes >= 1.")
+        self.processes = processes
+        self.collections = set(collections_list)
+        self._executor = ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def handles(self, collection_name: str) -> bool:
+        return collection_name in self.collections
+
+    def submit_render(self, df, json_columns: list = []) -> Future:
+        """
+        Renders a chunk like `PostgresLoader.render_copy_chunk` in a worker.
+
+        Returns:
+            Future: Resolves to (RenderedCopyChunk, seconds the rendering took).
+        """
+        if "_id" in df.columns:
+            df = df.drop(columns=["_id"])
+        nested_columns = [column for column in json_columns if column in df.columns]
+        try:
+            nested = bson.encode(
+                {column: df[column].tolist() for column in nested_columns}
+            )
+            buffer = to_ipc_buffer(df.drop(columns=nested_columns))
+        except (pa.ArrowException, InvalidDocument, OverflowError):
+            started = time.perf_counter()
+            future = Future()
+            future.set_result(
+                (
+                    PostgresLoader.render_copy_chunk(df, json_columns),
+                    time.perf_counter() - started,
+                )
+            )
+            return future
+        return self._executor.submit(
+            _render_in_process,
+            buffer,
+            nested,
+            df.columns.tolist(),
+            json_columns,
+            frame_bytes(df),
+        )
+
+    def close(self):
+        """Shuts the workers down, dropping chunks not rendered yet."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,2 @@
+# # src/seeding/__init__.py
+# from .mongo_seeder import MongoSeeder
@@ -0,0 +1,336 @@
+# mongo_seeder.py
+"""
+Seeds the MongoDB collections in `config.collections` from the files in `data/`:
+`<collection>.json` (a JSON array, as exported by mongoexport or written by the
+generation scripts), `<collection>.ndjson`, and the NDJSON part files written by
+`generate_dataset.py` under `<collection>/`.
+
+Usage (from `src/`):
+    python -m seeding.mongo_seeder --data-dir ../data --drop
+    python -m seeding.mongo_seeder --data-dir ../data/generated --processes 8
+
+Without `--drop`, a re-run adds only the documents whose `unique_id_key_col` is not
+in the collection yet: collections that already hold documents get their unique
+indexes before the files are inserted, and the documents seeded before are counted
+as duplicates.
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId, json_util
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from connections.resource_manager import ResourceManager, get_resource_manager
+from config import (
+    unique_id_mapping,
+    collections_with_date_keys,
+    collections,
+    seed_batch_size,
+    seed_insert_workers,
+    seed_processes,
+)
+
+# Characters read from a JSON array file at a time
+READ_SIZE = 1 << 20
+DUPLICATE_KEY_ERROR = 11000
+
+
+def _object_hook(obj: dict):
+    """
+    Decodes extended JSON wrappers (`{"$date": ...}`, `{"$oid": ...}`, ...) and
+    passes every other object through without the cost of `json_util.object_hook`.
+    """
+    if len(obj) > 2 or not next(iter(obj), "").startswith("$"):
+        return obj
+    # Fast paths for the wrappers mongoexport writes most
+    if len(obj) == 1:
+        if "$numberLong" in obj:
+            return int(obj["$numberLong"])
+        if "$oid" in obj:
+            return ObjectId(obj["$oid"])
+        if "$date" in obj and isinstance(obj["$date"], str):
+            value = datetime.fromisoformat(obj["$date"].replace("Z", "+00:00"))
+            return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return json_util.object_hook(obj)
+
+
+class MongoSeeder:
+    def __init__(
+        self,
+        resource_manager: ResourceManager = None,
+        batch_size: int = seed_batch_size,
+        workers: int = seed_insert_workers,
+    ):
+        """
+        Initializes the MongoSeeder class.
+
+        Files are parsed incrementally, so memory does not grow with the file size,
+        and every batch of `batch_size` documents is inserted with an unordered
+        `insert_many` by one of `workers` threads while the next batch is parsed.
+        Unique indexes on `unique_id_key_col` are created once the data is in, or
+        before it for collections that already hold documents (see `seed`).
+
+        Parameters:
+            resource_manager (ResourceManager): Defaults to the process-wide instance.
+            batch_size (int): Documents per `insert_many`.
+            workers (int): Concurrent `insert_many` calls.
+        """
+        self.resources = resource_manager or get_resource_manager()
+        self.db = self.resources.mongo_db
+        self.batch_size = batch_size
+        self.workers = workers
+        self._decoder = json.JSONDecoder(object_hook=_object_hook)
+
+    def iter_documents(self, path: str):
+        """
+        Yields the documents of a JSON array or NDJSON file one at a time. Extended
+        JSON (`$oid`, `$date`, `$numberLong`, ...) is decoded to BSON types.
+        """
+        with open(path) as f:
+            start = f.read(1)
+            while start.isspace():
+                start = f.read(1)
+            if start != "[":
+                first_line = start + f.readline()
+                for line in [first_line] if first_line.strip() else []:
+                    yield self._decoder.decode(line)
+                for line in f:
+                    if line.strip():
+                        yield self._decoder.decode(line)
+                return
+
+            buffer, position = "", 0
+            while True:
+                # Skip separators between documents
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position < len(buffer) and buffer[position] == "]":
+                    return
+                try:
+                    document, position = self._decoder.raw_decode(buffer, position)
+                    yield document
+                    continue
+                except json.JSONDecodeError:
+                    pass
+                # The next document is incomplete: read more text behind it
+                more = f.read(READ_SIZE)
+                if not more:
+                    if buffer[position:].strip():
+                        raise ValueError(f"Truncated JSON array in {path}")
+                    return
+                buffer, position = buffer[position:] + more, 0
+
+    @staticmethod
+    def convert_dates(document: dict, date_keys: list) -> dict:
+        """
+        Converts date strings the way `format_dates.py` does: 'yyyy-mm-dd' becomes
+        midnight UTC adjusted to IST (05:30 UTC), and ISO 8601 strings are parsed
+        as they are. Values that are already datetimes are kept.
+        """
+        for key in date_keys:
+            value = document.get(key)
+            if not isinstance(value, str):
+                continue
+            if len(value) == 10:
+                date_obj = datetime.strptime(value, "%Y-%m-%d")
+                document[key] = date_obj.replace(tzinfo=timezone.utc) + timedelta(
+                    hours=5, minutes=30
+                )
+            else:
+                document[key] = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return document
+
+    def _insert_batch(self, collection_name: str, batch: list) -> dict:
+        try:
+            result = self.db[collection_name].insert_many(batch, ordered=False)
+            return {"inserted": len(result.inserted_ids), "duplicates": 0}
+        except BulkWriteError as error:
+            details = error.details
+            duplicates = sum(
+                1
+                for write_error in details.get("writeErrors", [])
+                if write_error.get("code") == DUPLICATE_KEY_ERROR
+            )
+            if duplicates != len(details.get("writeErrors", [])):
+                raise
+            return {"inserted": details.get("nInserted", 0), "duplicates": duplicates}
+
+    def seed_file(self, collection_name: str, path: str) -> dict:
+        """
+        Streams one file into a collection. At most `workers` batches are in flight,
+        so parsing never runs far ahead of the server.
+
+        Returns:
+            dict: Numbers of documents inserted and skipped as duplicates.
+        """
+        date_keys = collections_with_date_keys.get(collection_name, [])
+        counts = {"inserted": 0, "duplicates": 0}
+        in_flight = threading.BoundedSemaphore(self.workers)
+        futures = []
+
+        def insert(batch):
+            try:
+                return self._insert_batch(collection_name, batch)
+            finally:
+                in_flight.release()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            batch = []
+            for document in self.iter_documents(path):
+                batch.append(self.convert_dates(document, date_keys))
+                if len(batch) >= self.batch_size:
+                    in_flight.acquire()
+                    futures.append(executor.submit(insert, batch))
+                    batch = []
+            if batch:
+                in_flight.acquire()
+                futures.append(executor.submit(insert, batch))
+
+            for future in futures:
+                result = future.result()
+                counts["inserted"] += result["inserted"]
+                counts["duplicates"] += result["duplicates"]
+        return counts
+
+    def create_unique_indexes(self, collections_list=collections):
+        """
+        Creates a unique index on the `unique_id_key_col` of every collection. A
+        collection whose documents already share a key raises a RuntimeError.
+        """
+        for collection_name in collections_list:
+            key = unique_id_mapping[collection_name]["unique_id_key_col"]
+            try:
+                self.db[collection_name].create_index(
+                    [(key, ASCENDING)], unique=True, name=f"{key}_unique"
+                )
+            except OperationFailure as error:
+                if error.code != DUPLICATE_KEY_ERROR:
+                    raise
+                raise RuntimeError(
+                    f"Cannot create the unique index on {collection_name}.{key}: "
+                    f"documents share a {key}. Seed with --drop or remove the "
+                    f"duplicates."
+                ) from error
+            print(f"Created unique index on {collection_name}.{key}.")
+
+
+def find_seed_files(data_dir: str, collections_list=collections) -> list:
+    """Returns (collection, path) pairs of the files found for each collection."""
+    files = []
+    for collection_name in collections_list:
+        candidates = [
+            os.path.join(data_dir, f"{collection_name}.json"),
+            os.path.join(data_dir, f"{collection_name}.ndjson"),
+        ]
+        candidates += sorted(
+            glob.glob(os.path.join(data_dir, collection_name, "*.ndjson"))
+        )
+        files += [
+            (collection_name, path) for path in candidates if os.path.isfile(path)
+        ]
+    return files
+
+
+def _seed_file_in_process(collection_name, path, batch_size, workers) -> dict:
+    """Process pool entry point: seeds one file with a MongoClient of its own."""
+    resources = ResourceManager()
+    try:
+        seeder = MongoSeeder(resources, batch_size, workers)
+        return seeder.seed_file(collection_name, path)
+    finally:
+        resources.close()
+
+
+def seed(
+    data_dir: str,
+    collections_list=collections,
+    processes: int = seed_processes,
+    batch_size: int = seed_batch_size,
+    workers: int = seed_insert_workers,
+    drop: bool = False,
+) -> dict:
+    """
+    Seeds every file found in `data_dir`, `processes` files at a time, then creates
+    the unique indexes. Collections that already hold documents (e.g. on a re-run
+    without `drop`) get them first, so documents seeded before are skipped as
+    duplicates instead of inserted again.
+
+    Returns:
+        dict: Documents inserted and duplicates skipped per collection.
+    """
+    started = time.perf_counter()
+    resources = ResourceManager()
+    seeder = MongoSeeder(resources, batch_size, workers)
+    files = find_seed_files(data_dir, collections_list)
+    seeded_collections = sorted({collection_name for collection_name, _ in files})
+
+    if drop:
+        for collection_name in seeded_collections:
+            seeder.db.drop_collection(collection_name)
+    # Loading empty collections without their indexes is faster
+    seeder.create_unique_indexes(
+        [
+            collection_name
+            for collection_name in seeded_collections
+            if seeder.db[collection_name].estimated_document_count()
+        ]
+    )
+
+    totals = {name: {"inserted": 0, "duplicates": 0} for name in seeded_collections}
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {
+            executor.submit(
+                _seed_file_in_process, collection_name, path, batch_size, workers
+            ): (collection_name, path)
+            for collection_name, path in files
+        }
+        for future, (collection_name, path) in futures.items():
+            counts = future.result()
+            totals[collection_name]["inserted"] += counts["inserted"]
+            totals[collection_name]["duplicates"] += counts["duplicates"]
+            print(f"Seeded {path}: {counts}")
+
+    seeder.create_unique_indexes(seeded_collections)
+    resources.close()
+
+    inserted = sum(counts["inserted"] for counts in totals.values())
+    elapsed = time.perf_counter() - started
+    print(
+        f"Seeded {inserted} documents into {len(totals)} collections in "
+        f"{elapsed:.1f}s ({inserted / elapsed if elapsed else 0:.0f} docs/sec)."
+    )
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed MongoDB from data files.")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--collections", nargs="+", default=collections)
+    parser.add_argument("--processes", type=int, default=seed_processes)
+    parser.add_argument("--workers", type=int, default=seed_insert_workers)
+    parser.add_argument("--batch-size", type=int, default=seed_batch_size)
+    parser.add_argument(
+        "--drop", action="store_true", help="Drop the collections before seeding."
+    )
+    args = parser.parse_args()
+
+    seed(
+        args.data_dir,
+        args.collections,
+        args.processes,
+        args.batch_size,
+        args.workers,
+        args.drop,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+# flattener.py
+"""
+In-stream flattening of the `nested_documents` of a collection into the child and
+dimension tables declared in `nested_document_tables`, so a direct full load writes
+normalized rows in the same pass as the collection instead of fixing them up with
+SQL afterwards.
+"""
+
+import json
+import math
+import threading
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from connections.resource_manager import ResourceManager, get_resource_manager
+from extraction.schema import build_column
+from loading.postgres_loader import FlattenedChunk
+from config import unique_id_mapping, collection_schemas, nested_document_tables
+
+# PostgreSQL type of each schema type, for the child tables created on demand
+PG_TYPES = {
+    "int32": "integer",
+    "int64": "bigint",
+    "float64": "double precision",
+    "bool": "boolean",
+    "category": "text",
+    "string": "text",
+    "datetime": "timestamp",
+    "object": "jsonb",
+}
+
+
+def _parse_nested(value, expected_type):
+    """Returns a nested document or array, parsing JSON text; anything else is None."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return None
+    return value if isinstance(value, expected_type) else None
+
+
+def _coerce(value, field_type: str):
+    """
+    Normalizes a dimension value so equal members compare equal whether they come
+    from MongoDB or PostgreSQL (e.g. 12 and 12.0, or a float and a Decimal).
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    try:
+        if field_type in ("int32", "int64"):
+            return int(value) if float(value).is_integer() else float(value)
+        if field_type == "float64":
+            return float(value)
+        if field_type in ("string", "category"):
+            return str(value)
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+class DimensionDictionary:
+    def __init__(self, resources, table_name: str, key_col: str, fields: dict):
+        """
+        Initializes the DimensionDictionary class.
+
+        Dictionary-encodes the sub-documents of one dimension: every distinct member
+        (the tuple of its `fields`) maps to one surrogate key of `table_name`. The
+        dictionary is seeded from the table by `seed`, before the loads that use it
+        check out their connections, so members loaded from their own collection
+        keep their keys. Encoding needs no connection: new members get keys above
+        the largest one in memory, and every chunk that refers to a member not yet
+        committed carries its row, which `insert` writes in the chunk's own
+        transaction. A rolled back chunk therefore leaves no dangling key, and a
+        member is only known to exist once a chunk holding it committed (`confirm`).
+
+        Parameters:
+            resources (ResourceManager): Provides the pooled PostgreSQL connections.
+            table_name (str): The dimension table.
+            key_col (str): Its surrogate key column.
+            fields (dict): Member fields and their `collection_schemas` types.
+        """
+        self.resources = resources
+        self.table_name = table_name
+        self.key_col = key_col
+        self.fields = fields
+        self.members = None
+        self.next_key = 1
+        self.created = 0
+        # New members whose row is not committed yet, by member
+        self.uncommitted = {}
+        self._lock = threading.Lock()
+
+    def member(self, document):
+        """Returns the member tuple of a sub-document, or None for a missing one."""
+        document = _parse_nested(document, dict)
+        if document is None:
+            return None
+        return tuple(
+            _coerce(document.get(field), field_type)
+            for field, field_type in self.fields.items()
+        )
+
+    def seed(self):
+        """Reads the members of the table once; later calls do nothing."""
+        with self._lock:
+            if self.members is not None:
+                return
+            with self.resources.pg_connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        sql.SQL("SELECT {}, {} FROM {} ORDER BY 1").format(
+                            sql.Identifier(self.key_col),
+                            sql.SQL(", ").join(map(sql.Identifier, self.fields)),
+                            sql.Identifier(self.table_name),
+                        )
+                    )
+                    rows = cursor.fetchall()
+            self.load_members(rows)
+
+    def load_members(self, rows: list):
+        """Sets the dictionary from (key, *fields) rows of the table."""
+        self.members = {}
+        for key, *values in rows:
+            member = tuple(
+                _coerce(value, field_type)
+                for value, field_type in zip(values, self.fields.values())
+            )
+            # Duplicated members resolve to their smallest key
+            self.members.setdefault(member, key)
+            self.next_key = max(self.next_key, key + 1)
+
+    def keys_for(self, members: list) -> tuple:
+        """
+        Returns the surrogate key of every member, assigning keys to new ones.
+
+        Returns:
+            tuple: (keys, (key, *fields) rows of the members not committed yet)
+        """
+        with self._lock:
+            if self.members is None:
+                raise RuntimeError(f"{self.table_name} was not seeded.")
+            for member in members:
+                if member not in self.members:
+                    self.members[member] = self.next_key
+                    self.uncommitted[member] = self.next_key
+                    self.next_key += 1
+                    self.created += 1
+            keys = [self.members[member] for member in members]
+            rows = [
+                (self.uncommitted[member],) + member
+                for member in members
+                if member in self.uncommitted
+            ]
+        return keys, rows
+
+    def insert(self, cursor, rows: list):
+        """
+        Inserts the rows of new members that are not in the table yet, on the
+        cursor of the chunk that refers to them. A transaction-level advisory lock
+        makes concurrent chunks holding the same new member take turns, so the
+        second one sees the first one's row once it committed.
+        """
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (self.table_name,))
+        cursor.execute(
+            sql.SQL("SELECT {} FROM {} WHERE {} = ANY(%s)").format(
+                sql.Identifier(self.key_col),
+                sql.Identifier(self.table_name),
+                sql.Identifier(self.key_col),
+            ),
+            ([row[0] for row in rows],),
+        )
+        existing = {key for (key,) in cursor.fetchall()}
+        missing = [row for row in rows if row[0] not in existing]
+        if not missing:
+            return
+        execute_values(
+            cursor,
+            sql.SQL("INSERT INTO {} ({}, {}) VALUES %s")
+            .format(
+                sql.Identifier(self.table_name),
+                sql.Identifier(self.key_col),
+                sql.SQL(", ").join(map(sql.Identifier, self.fields)),
+            )
+            .as_string(cursor),
+            missing,
+        )
+        # Keeps inserts that take their key from the table's sequence, if any, clear
+        # of the keys assigned here
+        cursor.execute(
+            sql.SQL(
+                "SELECT setval(sequence, (SELECT max({}) FROM {})) "
+                "FROM pg_get_serial_sequence(%s, %s) AS sequence "
+                "WHERE sequence IS NOT NULL"
+            ).format(sql.Identifier(self.key_col), sql.Identifier(self.table_name)),
+            (self.table_name, self.key_col),
+        )
+
+    def confirm(self, rows: list):
+        """Marks the members of `rows` as committed."""
+        with self._lock:
+            for key, *values in rows:
+                if self.uncommitted.get(tuple(values)) == key:
+                    del self.uncommitted[tuple(values)]
+
+    def encode(self, values: pd.Series) -> tuple:
+        """
+        Returns the surrogate keys of a column of sub-documents (nullable Int64,
+        NULL where the sub-document is missing). Each distinct member is looked up
+        once per chunk.
+
+        Returns:
+            tuple: (keys, rows of the members the chunk has to insert)
+        """
+        members = pd.Series([self.member(value) for value in values], dtype=object)
+        codes, uniques = pd.factorize(members)
+        keys, rows = np.zeros(len(codes), dtype="int64"), []
+        if len(uniques):
+            unique_keys, rows = self.keys_for(list(uniques))
+            keys = np.asarray(unique_keys, dtype="int64")[codes]
+        encoded = pd.array(keys, dtype=pd.Int64Dtype())
+        encoded[codes < 0] = pd.NA
+        return pd.Series(encoded, index=values.index), rows
+
+
+class NestedDocumentFlattener:
+    def __init__(self, resource_manager: ResourceManager = None):
+        """
+        Initializes the NestedDocumentFlattener class.
+
+        Splits the nested fields of `nested_document_tables` out of each chunk of a
+        collection (see `flatten`): dimension fields are dictionary-encoded into
+        surrogate keys by a `DimensionDictionary` per dimension table, shared by
+        every collection and partition, and child fields (arrays) are exploded into
+        one row per element. The rows come back with the chunk as a
+        `FlattenedChunk`, which `PostgresLoader.load_chunks_to_postgres` writes in
+        the transaction of the chunk. Flattening takes no connection: `prepare`
+        seeds the dimensions of a collection before its load starts. As the
+        collection tables of a direct full load, the child and parent tables are
+        expected to be empty at its start.
+
+        Parameters:
+            resource_manager (ResourceManager): Defaults to the process-wide instance.
+        """
+        self.resources = resource_manager or get_resource_manager()
+        self.dimensions = {}
+        for tables in nested_document_tables.values():
+            for spec in tables["fields"].values():
+                if spec["kind"] == "dimension":
+                    self.dimensions.setdefault(
+                        spec["table_name"],
+                        DimensionDictionary(
+                            self.resources,
+                            spec["table_name"],
+                            spec["key_col"],
+                            spec["fields"],
+                        ),
+                    )
+
+    def handles(self, collection_name: str) -> bool:
+        return bool(self.source_fields(collection_name))
+
+    def source_fields(self, collection_name: str) -> list:
+        """Returns the `nested_documents` of a collection that are flattened."""
+        tables = nested_document_tables.get(collection_name, {"fields": {}})
+        return [
+            field
+            for field in unique_id_mapping[collection_name]["nested_documents"]
+            if field in tables["fields"]
+        ]
+
+    def child_fields(self, collection_name: str) -> list:
+        """Returns the flattened fields of a collection that have a child table."""
+        tables = nested_document_tables.get(collection_name, {"fields": {}})
+        return [
+            field
+            for field in self.source_fields(collection_name)
+            if tables["fields"][field]["kind"] == "child"
+        ]
+
+    def prepare(self, collection_name: str):
+        """
+        Seeds the dimensions of a collection. Call it before the collection's load
+        checks out a connection, since flattening its chunks cannot take one.
+        """
+        tables = nested_document_tables[collection_name]
+        for field in self.source_fields(collection_name):
+            spec = tables["fields"][field]
+            if spec["kind"] == "dimension":
+                self.dimensions[spec["table_name"]].seed()
+
+    def ensure_child_tables(self):
+        """
+        Creates the child tables of `nested_document_tables` that do not exist: the
+        parent's key, the element's `position` in the array and its fields.
+        """
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                for collection_name, tables in nested_document_tables.items():
+                    key_col = unique_id_mapping[collection_name]["unique_id_key_col"]
+                    key_type = collection_schemas[collection_name][key_col]
+                    for spec in tables["fields"].values():
+                        if spec["kind"] != "child":
+                            continue
+                        columns = [
+                            sql.SQL("{} {}").format(
+                                sql.Identifier(field), sql.SQL(PG_TYPES[field_type])
+                            )
+                            for field, field_type in spec["fields"].items()
+                        ]
+                        cursor.execute(
+                            sql.SQL(
+                                """
+                                CREATE TABLE IF NOT EXISTS {} (
+                                    {} {} NOT NULL,
+                                    position integer NOT NULL,
+                                    {},
+                                    PRIMARY KEY ({}, position)
+                                )
+                                """
+                            ).format(
+                                sql.Identifier(spec["table_name"]),
+                                sql.Identifier(key_col),
+                                sql.SQL(PG_TYPES[key_type]),
+                                sql.SQL(", ").join(columns),
+                                sql.Identifier(key_col),
+                            )
+                        )
+                connection.commit()
+
+    def flatten(self, df: pd.DataFrame, collection_name: str) -> FlattenedChunk:
+        """
+        Flattens the nested fields of a chunk:
+
+        - a dimension field becomes the surrogate key column `key_col`;
+        - a child field becomes the rows of its child table;
+        - with a `parent_table`, the `parent_columns` and the surrogate keys of the
+          rows whose dimensions all exist become its rows; otherwise the keys are
+          added to the chunk.
+
+        Nested fields outside the collection's schema are dropped from the chunk.
+        New dimension members the chunk refers to are inserted with it.
+
+        Returns:
+            FlattenedChunk: The chunk, its (table, rows, json_columns) triples and
+                            the inserts of its new dimension members.
+        """
+        tables = nested_document_tables[collection_name]
+        key_col = unique_id_mapping[collection_name]["unique_id_key_col"]
+        related = []
+        keys = {}
+        writers = []
+        on_commit = []
+        for field in self.source_fields(collection_name):
+            if field not in df.columns:
+                continue
+            spec = tables["fields"][field]
+            if spec["kind"] == "dimension":
+                dimension = self.dimensions[spec["table_name"]]
+                keys[spec["key_col"]], rows = dimension.encode(df[field])
+                if rows:
+                    writers.append(partial(dimension.insert, rows=rows))
+                    on_commit.append(partial(dimension.confirm, rows))
+            else:
+                related.append(self._child_rows(df, key_col, field, spec))
+
+        if tables.get("parent_table"):
+            parent = df[tables["parent_columns"]].assign(**keys)
+            related.append(
+                (tables["parent_table"], parent.dropna(subset=list(keys)), [])
+            )
+        else:
+            df = df.assign(**keys)
+
+        schema = collection_schemas.get(collection_name, {})
+        dropped = [
+            field
+            for field in self.source_fields(collection_name)
+            if field in df.columns and field not in schema
+        ]
+        return FlattenedChunk(df.drop(columns=dropped), related, writers, on_commit)
+
+    def flatten_children(
+        self, df: pd.DataFrame, collection_name: str
+    ) -> FlattenedChunk:
+        """
+        Flattens only the child fields of a chunk (see `child_fields`), leaving its
+        dimension fields as they are. Needs neither `prepare` nor a connection, e.g.
+        for the changed documents of change-stream replication.
+
+        Returns:
+            FlattenedChunk: The chunk without its child fields and the rows of their
+                            child tables.
+        """
+        tables = nested_document_tables[collection_name]
+        key_col = unique_id_mapping[collection_name]["unique_id_key_col"]
+        fields = [
+            field for field in self.child_fields(collection_name) if field in df.columns
+        ]
+        related = [
+            self._child_rows(df, key_col, field, tables["fields"][field])
+            for field in fields
+        ]
+        schema = collection_schemas.get(collection_name, {})
+        dropped = [field for field in fields if field not in schema]
+        return FlattenedChunk(df.drop(columns=dropped), related)
+
+    def _child_rows(self, df: pd.DataFrame, key_col: str, field: str, spec: dict):
+        """Returns the (table_name, rows, json_columns) triple of a child field."""
+        return (
+            spec["table_name"],
+            self.explode(df[key_col], df[field], key_col, spec["fields"]),
+            [
+                name
+                for name, field_type in spec["fields"].items()
+                if field_type == "object"
+            ],
+        )
+
+    @staticmethod
+    def explode(
+        parent_keys: pd.Series, arrays: pd.Series, key_col: str, fields: dict
+    ) -> pd.DataFrame:
+        """
+        Returns one row per array element: the parent's key, the element's position
+        and its fields. Elements that are not documents fill the only field.
+        """
+        arrays = [_parse_nested(value, list) or [] for value in arrays]
+        lengths = np.fromiter(map(len, arrays), dtype="int64", count=len(arrays))
+        elements = [element for array in arrays for element in array]
+        starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        scalar_field = next(iter(fields)) if len(fields) == 1 else None
+
+        def value(element, field):
+            if isinstance(element, dict):
+                return element.get(field)
+            return element if field == scalar_field else None
+
+        rows = {
+            key_col: parent_keys.repeat(lengths).reset_index(drop=True),
+            "position": pd.Series(
+                pd.array(np.arange(len(elements)) - starts, dtype=pd.Int32Dtype())
+            ),
+        }
+        for field, field_type in fields.items():
+            rows[field] = build_column(
+                [value(element, field) for element in elements], field_type
+            )
+        return pd.DataFrame(rows)
+
+    def report(self):
+        """Prints the members each dimension holds and how many this run created."""
+        for dimension in self.dimensions.values():
+            if dimension.members is not None:
+                print(
+                    f"{dimension.table_name}: {len(dimension.members)} members, "
+                    f"{dimension.created} created while flattening."
+                )
@@ -1,55 +1,44 @@
 # normalizer.py
 
-import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
-import psycopg2
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import pandas as pd
 
+from connections.resource_manager import ResourceManager, get_resource_manager
+from extraction.schema import record_coerced_values
+from pipeline.metrics import frame_bytes
 from config import (
     unique_id_mapping,
     fixed_date_ist,
     collections_with_date_keys,
     collections,
+    max_parallel_collections,
 )
 
 
 class Transformer:
-    def __init__(self):
+    def __init__(self, resource_manager: ResourceManager = None):
         """
         Initializes the Normalizer class.
-        Loads environment variables and sets up MongoDB and PostgreSQL connection parameters.
-        """
+        Uses the MongoClient and PostgreSQL connection pool owned by the shared
+        ResourceManager.
 
-        # Load environment variables from .env file
-        load_dotenv()
+        Parameters:
+        resource_manager (ResourceManager): Defaults to the process-wide instance.
+        """
+        self.resources = resource_manager or get_resource_manager()
 
         # MongoDB setup
-        self.mongo_url = os.getenv("MONGO_DB_URL")
-        self.mongo_db_database_name = os.getenv("MONGODB_DB_NAME")
-        self.mongo_client = MongoClient(self.mongo_url)
-        self.db = self.mongo_client[self.mongo_db_database_name]
-
-        # PostgreSQL setup
-        self.pg_host = os.getenv("PG_HOST")
-        self.pg_database = os.getenv("PG_DATABASE")
-        self.pg_user = os.getenv("PG_USER")
-        self.pg_password = os.getenv("PG_PASSWORD")
-        self.pg_port = os.getenv("PG_PORT")
-        self.pg_connection = self.create_pg_connection()
+        self.mongo_client = self.resources.mongo_client
+        self.db = self.resources.mongo_db
 
     def create_pg_connection(self):
         """
-        Establishes a connection to the PostgreSQL database.
+        Establishes a dedicated connection to the PostgreSQL database, outside the
+        shared pool. The caller closes it.
         """
-        return psycopg2.connect(
-            host=self.pg_host,
-            database=self.pg_database,
-            user=self.pg_user,
-            password=self.pg_password,
-            port=self.pg_port,
-        )
+        return self.resources.connect_pg()
 
     # Supports `add_ist_timestamp_fields_mongodb_aggregation` method
     def specific_ist_time(self):
@@ -64,23 +53,71 @@ class Transformer:
         return fixed_date_ist
 
     # Changes are refled in MONGODB COLLECTIONS
-    def add_ist_timestamp_fields_mongodb_aggregation(self, collections_list):
+    def add_ist_timestamp_fields_mongodb_aggregation(
+        self, collections_list, max_workers: int = max_parallel_collections
+    ) -> dict:
         """
         Adds 'added_at' and 'modified_at' fields with specific IST-adjusted timestamp
-        to all collections in the database using $addFields.
-        """
-        for collection_name in collections_list:
-            collection = self.db[collection_name]
-            pipeline = [
-                {
-                    "$set": {
-                        "added_at": self.specific_ist_time(),
-                        "modified_at": self.specific_ist_time(),
+        to the documents of the given collections that do not have them yet.
+
+        Only documents missing (or holding null in) either field are written, with an
+        aggregation-pipeline update that fills the missing field and keeps the other,
+        so a re-run on a stamped database does next to no writes. Collections are
+        stamped concurrently.
+
+        Returns:
+        dict: Number of documents stamped per collection.
+        """
+        stamp = self.specific_ist_time()
+
+        def stamp_collection(collection_name):
+            started = time.perf_counter()
+            result = self.db[collection_name].update_many(
+                {"$or": [{"added_at": None}, {"modified_at": None}]},
+                [
+                    {
+                        "$set": {
+                            "added_at": {"$ifNull": ["$added_at", stamp]},
+                            "modified_at": {"$ifNull": ["$modified_at", stamp]},
+                        }
                     }
-                }
-            ]
-            collection.update_many({}, pipeline[0])
-            print(f"Updated collection '{collection_name}' with IST timestamps.")
+                ],
+            )
+            self.resources.metrics.record(
+                collection_name,
+                "stamp",
+                result.modified_count,
+                time.perf_counter() - started,
+            )
+            return result.modified_count
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            stamped = dict(
+                zip(collections_list, executor.map(stamp_collection, collections_list))
+            )
+
+        for collection_name, count in stamped.items():
+            print(
+                f"Updated collection '{collection_name}' with IST timestamps: "
+                f"{count} document(s) stamped."
+            )
+        return stamped
+
+    # Changes are reflected in PANDAS DF;
+    # Alternative to `add_ist_timestamp_fields_mongodb_aggregation` without Mongo writes
+    def add_ist_timestamp_fields_to_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Fills missing 'added_at' and 'modified_at' values of an extracted chunk with
+        the same fixed timestamp `add_ist_timestamp_fields_mongodb_aggregation` writes,
+        as naive UTC. The stamps only exist in the loaded rows, not in MongoDB.
+        """
+        stamp = pd.Timestamp(self.specific_ist_time()).tz_convert("UTC").tz_localize(None)
+        for column in ("added_at", "modified_at"):
+            if column in df.columns:
+                df[column] = df[column].fillna(stamp)
+            else:
+                df[column] = stamp
+        return df
 
     # Replace pd.NaT with None in the specified columns of each collection
     # Changes are reflected in PANDAS DF;
@@ -95,95 +132,174 @@ class Transformer:
                                 in which to replace pd.NaT with None.
         """
         for collection_name, columns in columns_to_replace.items():
-            for column in columns:
-                if column in collections_dict[collection_name].columns:
-                    collections_dict[collection_name][column] = collections_dict[
-                        collection_name
-                    ][column].replace({pd.NaT: None})
+            self.replace_nat_with_none_in_dataframe(
+                collections_dict[collection_name], columns
+            )
+
+    def replace_nat_with_none_in_dataframe(self, df: pd.DataFrame, columns: list):
+        """
+        Replaces pd.NaT with None in the specified columns of a single DataFrame
+        (e.g. one extracted chunk) and returns it.
+        """
+        for column in columns:
+            if column in df.columns:
+                df[column] = df[column].replace({pd.NaT: None})
+        return df
+
+    # Changes are reflected in PANDAS DF;
+    # Post EXTRACTION, Pre Loading, applied per chunk
+    def normalize_date_columns(
+        self, df: pd.DataFrame, collection_name: str
+    ) -> pd.DataFrame:
+        """
+        Converts every date column of a DataFrame chunk in one vectorized pass.
+
+        The columns are the collection's entry in `collections_with_date_keys` plus
+        `added_at` and `modified_at`. Values may be datetimes (naive values are taken
+        as UTC, as pymongo returns them) or ISO 8601 strings with or without an offset.
+        They are normalized to UTC and stored as naive `datetime64[ns]`, matching the
+        `timestamp without time zone` target columns. Missing or unparsable values
+        become NaT, which the COPY load path writes as NULL directly; no column is
+        turned back into Python objects. Unparsable values are counted per column in
+        `resources.metrics` and reported with a warning (see `record_coerced_values`).
+
+        Parameters:
+        df (pd.DataFrame): One chunk of the collection.
+        collection_name (str): Name of the collection the chunk belongs to.
+
+        Returns:
+        pd.DataFrame: The same DataFrame, converted in place.
+        """
+        date_columns = collections_with_date_keys.get(collection_name, []) + [
+            "added_at",
+            "modified_at",
+        ]
+        with self.resources.metrics.measure(
+            collection_name, "transform", len(df), frame_bytes(df)
+        ) as sample:
+            for column in date_columns:
+                if column not in df.columns:
+                    continue
+                values = df[column]
+                if pd.api.types.is_datetime64_dtype(values):
+                    continue  # already naive datetime64, nothing to do
+                converted = pd.to_datetime(
+                    values, utc=True, errors="coerce", format="ISO8601"
+                ).dt.tz_localize(None)
+                record_coerced_values(
+                    self.resources.metrics, collection_name, column, values, converted
+                )
+                df[column] = converted
+            sample["bytes_out"] = frame_bytes(df)
+        return df
 
     # Changes are refled in POSTGRESQL TABLE
-    def normalize_loan_restructuring(self):
+    def normalize_loan_restructuring(self, commit: bool = True):
         """
         Populates `tbl_loan_restructuring_normalized` from `tbl_loan_restructuring` by
         linking foreign keys to `tbl_new_loan_terms` and `tbl_restructure_terms`.
+
+        The work is set-based: missing dimension rows are created with one
+        INSERT ... SELECT per dimension, and the normalized table is upserted with a
+        single INSERT ... SELECT ... ON CONFLICT that resolves both foreign keys from
+        the jsonb columns. The number of round trips does not grow with the table.
+
+        Parameters:
+        commit (bool): Commit the changes; False rolls them back, e.g. to time the
+                       statements without changing the tables.
         """
-        with self.pg_connection.cursor() as cursor:
-            cursor.execute(
-                "SELECT restructuring_id, loan_id, new_loan_terms, restructure_terms, added_at, modified_at FROM tbl_loan_restructuring"
-            )
-            restructuring_records = cursor.fetchall()
-
-            for record in restructuring_records:
-                (
-                    restructuring_id,
-                    loan_id,
-                    new_loan_terms,
-                    restructure_terms,
-                    added_at,
-                    modified_at,
-                ) = record
-
-                # Insert or fetch new_loan_terms_id
+        started = time.perf_counter()
+        with self.resources.pg_connection() as connection:
+            with connection.cursor() as cursor:
+                # Create any new_loan_terms combinations that do not exist yet
                 cursor.execute(
-                    "SELECT new_loan_term_id FROM tbl_new_loan_terms WHERE interest_rate = %s AND repayment_period_in_months = %s",
-                    (
-                        new_loan_terms["interest_rate"],
-                        new_loan_terms["repayment_period_in_months"],
-                    ),
+                    """
+                    INSERT INTO tbl_new_loan_terms (interest_rate, repayment_period_in_months)
+                    SELECT DISTINCT
+                        (r.new_loan_terms ->> 'interest_rate')::numeric,
+                        (r.new_loan_terms ->> 'repayment_period_in_months')::numeric
+                    FROM tbl_loan_restructuring r
+                    WHERE r.new_loan_terms IS NOT NULL
+                      AND NOT EXISTS (
+                        SELECT 1 FROM tbl_new_loan_terms t
+                        WHERE t.interest_rate = (r.new_loan_terms ->> 'interest_rate')::numeric
+                          AND t.repayment_period_in_months = (r.new_loan_terms ->> 'repayment_period_in_months')::numeric
+                      )
+                    """
                 )
-                new_loan_terms_id = cursor.fetchone()
-                if not new_loan_terms_id:
-                    cursor.execute(
-                        "INSERT INTO tbl_new_loan_terms (interest_rate, repayment_period_in_months) VALUES (%s, %s) RETURNING new_loan_term_id",
-                        (
-                            new_loan_terms["interest_rate"],
-                            new_loan_terms["repayment_period_in_months"],
-                        ),
-                    )
-                    new_loan_terms_id = cursor.fetchone()[0]
+                new_loan_terms_created = cursor.rowcount
 
-                # Insert or fetch restructure_terms_id
+                # Create any restructure_terms combinations that do not exist yet
                 cursor.execute(
-                    "SELECT restructure_term_id FROM tbl_restructure_terms WHERE reason = %s AND new_schedule = %s AND concessions = %s",
-                    (
-                        restructure_terms["reason"],
-                        restructure_terms["new_schedule"],
-                        restructure_terms["concessions"],
-                    ),
+                    """
+                    INSERT INTO tbl_restructure_terms (reason, new_schedule, concessions)
+                    SELECT DISTINCT
+                        r.restructure_terms ->> 'reason',
+                        r.restructure_terms ->> 'new_schedule',
+                        r.restructure_terms ->> 'concessions'
+                    FROM tbl_loan_restructuring r
+                    WHERE r.restructure_terms IS NOT NULL
+                      AND NOT EXISTS (
+                        SELECT 1 FROM tbl_restructure_terms t
+                        WHERE t.reason = r.restructure_terms ->> 'reason'
+                          AND t.new_schedule = r.restructure_terms ->> 'new_schedule'
+                          AND t.concessions = r.restructure_terms ->> 'concessions'
+                      )
+                    """
                 )
-                restructure_terms_id = cursor.fetchone()
-                if not restructure_terms_id:
-                    cursor.execute(
-                        "INSERT INTO tbl_restructure_terms (reason, new_schedule, concessions) VALUES (%s, %s, %s) RETURNING restructure_term_id",
-                        (
-                            restructure_terms["reason"],
-                            restructure_terms["new_schedule"],
-                            restructure_terms["concessions"],
-                        ),
-                    )
-                    restructure_terms_id = cursor.fetchone()[0]
+                restructure_terms_created = cursor.rowcount
 
-                # Insert or update tbl_loan_restructuring_normalized
+                # Insert or update tbl_loan_restructuring_normalized in one statement.
+                # Dimensions are collapsed to one id per combination so duplicated
+                # dimension rows cannot make a restructuring row conflict with itself.
                 cursor.execute(
                     """
+                    WITH new_loan_terms AS (
+                        SELECT interest_rate, repayment_period_in_months,
+                               MIN(new_loan_term_id) AS new_loan_term_id
+                        FROM tbl_new_loan_terms
+                        GROUP BY interest_rate, repayment_period_in_months
+                    ),
+                    restructure_terms AS (
+                        SELECT reason, new_schedule, concessions,
+                               MIN(restructure_term_id) AS restructure_term_id
+                        FROM tbl_restructure_terms
+                        GROUP BY reason, new_schedule, concessions
+                    )
                     INSERT INTO tbl_loan_restructuring_normalized (
                         restructuring_id, loan_id, new_loan_term_id, restructure_term_id, added_at, modified_at
-                    ) VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (restructuring_id) DO UPDATE 
+                    )
+                    SELECT r.restructuring_id, r.loan_id, n.new_loan_term_id,
+                           t.restructure_term_id, r.added_at, r.modified_at
+                    FROM tbl_loan_restructuring r
+                    JOIN new_loan_terms n
+                      ON n.interest_rate = (r.new_loan_terms ->> 'interest_rate')::numeric
+                     AND n.repayment_period_in_months = (r.new_loan_terms ->> 'repayment_period_in_months')::numeric
+                    JOIN restructure_terms t
+                      ON t.reason = r.restructure_terms ->> 'reason'
+                     AND t.new_schedule = r.restructure_terms ->> 'new_schedule'
+                     AND t.concessions = r.restructure_terms ->> 'concessions'
+                    ON CONFLICT (restructuring_id) DO UPDATE
                     SET new_loan_term_id = EXCLUDED.new_loan_term_id,
                         restructure_term_id = EXCLUDED.restructure_term_id,
                         added_at = EXCLUDED.added_at,
                         modified_at = EXCLUDED.modified_at
-                """,
-                    (
-                        restructuring_id,
-                        loan_id,
-                        new_loan_terms_id,
-                        restructure_terms_id,
-                        added_at,
-                        modified_at,
-                    ),
+                    """
                 )
+                normalized_rows = cursor.rowcount
 
-            self.pg_connection.commit()
-            print("Normalization of loan restructuring data completed.")
+                if commit:
+                    connection.commit()
+                else:
+                    connection.rollback()
+                self.resources.metrics.record(
+                    "loan_restructuring",
+                    "normalize",
+                    normalized_rows,
+                    time.perf_counter() - started,
+                )
+                print(
+                    f"Normalization of loan restructuring data completed: "
+                    f"{normalized_rows} rows upserted, {new_loan_terms_created} new_loan_terms "
+                    f"and {restructure_terms_created} restructure_terms created."
+                )
@@ -0,0 +1,7 @@
+# conftest.py
+"""Makes the modules under `src/` importable, as they are when run from `src/`."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
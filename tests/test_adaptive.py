@@ -0,0 +1,115 @@
+# test_adaptive.py
+
+import threading
+import time
+
+import pytest
+
+from pipeline.adaptive import AdaptiveBatchSize, AdaptiveConcurrencyLimiter
+
+
+def controller(**kwargs):
+    settings = dict(
+        initial=10000,
+        minimum=1000,
+        maximum=20000,
+        target_seconds=1.0,
+        max_batch_bytes=2**30,
+    )
+    settings.update(kwargs)
+    return AdaptiveBatchSize("customers", **settings)
+
+
+def test_healthy_batches_grow_the_size_up_to_the_maximum():
+    batches = controller()
+    batches.observe("extract", 10000, 0.1)
+    assert batches.batch_size == 12000
+    for _ in range(10):
+        batches.observe("extract", 10000, 0.1)
+    assert batches.batch_size == 20000
+
+
+def test_slow_batch_halves_the_size_down_to_the_minimum():
+    batches = controller()
+    batches.observe("load", 10000, 1.5)
+    assert batches.batch_size == 5000
+    for _ in range(5):
+        batches.observe("load", 10000, 1.5)
+    assert batches.batch_size == 1000
+    assert batches.settings()["decreases"] == 6
+
+
+def test_batches_stay_below_the_memory_bound():
+    batches = controller(max_batch_bytes=1000 * 100)
+    # 100 bytes per row: at most 1000 rows fit
+    batches.observe("extract", 10000, 0.1, batch_bytes=10000 * 100)
+    assert batches.batch_size == 5000
+    batches.observe("extract", 5000, 0.1, batch_bytes=5000 * 100)
+    assert batches.batch_size == 2500
+
+
+def test_throughput_drop_lowers_the_size():
+    batches = controller()
+    batches.observe("load", 10000, 0.1)
+    size = batches.batch_size
+    # A quarter of the recent throughput
+    batches.observe("load", 10000, 0.4)
+    assert batches.batch_size == size // 2
+
+
+def test_pinned_collection_keeps_its_size(monkeypatch):
+    monkeypatch.setattr("pipeline.adaptive.pinned_batch_sizes", {"customers": 7000})
+    batches = controller()
+    batches.observe("load", 10000, 5.0)
+    assert batches.batch_size == 7000
+    assert batches.settings()["pinned"]
+
+
+def test_slow_loads_lower_the_concurrency_and_healthy_ones_raise_it():
+    limiter = AdaptiveConcurrencyLimiter(maximum=4)
+    batches = controller(limiter=limiter)
+    batches.observe("load", 10000, 1.5)
+    assert limiter.limit == 2
+    # Batches in flight under the old limit do not lower it again at once
+    batches.observe("load", 10000, 1.5)
+    assert limiter.limit == 2
+    # Extract batches do not change the concurrency of loads
+    batches.observe("extract", 10000, 0.1)
+    batches.observe("extract", 10000, 0.1)
+    assert limiter.limit == 2
+
+    batches.observe("load", 10000, 0.1)
+    assert limiter.limit == 2
+    batches.observe("load", 10000, 0.1)
+    assert limiter.limit == 3
+    assert batches.settings()["load_concurrency"] == 3
+
+
+def test_limiter_holds_at_most_limit_slots():
+    limiter = AdaptiveConcurrencyLimiter(maximum=2)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def load():
+        with limiter.slot():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+
+    threads = [threading.Thread(target=load) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+
+def test_limiter_bounds():
+    with pytest.raises(ValueError):
+        AdaptiveConcurrencyLimiter(maximum=1, minimum=2)
+    limiter = AdaptiveConcurrencyLimiter(maximum=1)
+    limiter.decrease("slow")
+    assert limiter.limit == 1
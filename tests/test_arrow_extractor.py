@@ -0,0 +1,66 @@
+# test_arrow_extractor.py
+
+from datetime import datetime
+
+import bson
+import pyarrow as pa
+import pytest
+
+from extraction.arrow_extractor import ArrowExtractor
+
+
+class NoDatabase:
+    mongo_db = None
+
+
+@pytest.fixture
+def extractor():
+    return ArrowExtractor(NoDatabase())
+
+
+def raw_batch(documents):
+    return b"".join(bson.encode(document) for document in documents)
+
+
+def test_decode_fills_typed_columns(extractor):
+    batch = extractor.decode_raw_batch(
+        raw_batch(
+            [
+                {
+                    "loan_id": 7,
+                    "history_id": 1,
+                    "previous_loan_status": True,
+                    "loan_repaid_date": datetime(2024, 1, 2, 3, 4),
+                    "unknown": "ignored",
+                },
+                {"history_id": 2.0, "customer_id": 123456789012345678},
+            ]
+        ),
+        "loan_history",
+    )
+    assert batch.schema == extractor.arrow_schema("loan_history")
+    assert batch.column("history_id").to_pylist() == [1, 2]
+    assert batch.column("customer_id").to_pylist() == [None, 123456789012345678]
+    assert batch.column("previous_loan_status").to_pylist() == [True, None]
+    assert batch.column("loan_repaid_date").to_pylist() == [
+        datetime(2024, 1, 2, 3, 4),
+        None,
+    ]
+
+
+def test_decode_stores_nested_documents_as_json_text(extractor):
+    batch = extractor.decode_raw_batch(
+        raw_batch(
+            [
+                {"restructuring_id": 1, "new_loan_terms": {"interest_rate": 5.5}},
+                {"restructuring_id": 2},
+            ]
+        ),
+        "loan_restructuring",
+    )
+    assert batch.column("restructuring_id").type == pa.int64()
+    assert batch.column("new_loan_terms").to_pylist() == [
+        '{"interest_rate": 5.5}',
+        None,
+    ]
+    assert batch.column("restructure_terms").null_count == 2
@@ -0,0 +1,220 @@
+# test_cdc.py
+
+import pytest
+
+from extraction.change_events import InMemoryChangeEventSource
+from pipeline.cdc import ChangeStreamReplicator
+from transformation.flattener import NestedDocumentFlattener
+
+
+class NoConnections:
+    def pg_connection(self):
+        raise AssertionError("No connection expected.")
+
+
+class FakeLoader:
+    def __init__(self):
+        self.calls = []
+        self.frames = {}
+        self.resume_tokens = []
+        self.document_keys = {}
+        self.dead_letters = []
+
+    def upsert_dataframe_to_postgres(self, df, table_name, key_col, json_columns):
+        self.calls.append(("upsert", table_name, sorted(df[key_col].tolist())))
+        self.frames[table_name] = df
+        return {"inserted": len(df), "updated": 0}
+
+    def load_chunks_to_postgres(
+        self, chunks, table_name, json_columns, raise_on_error=False
+    ):
+        for df in chunks:
+            self.calls.append(("load", table_name, len(df)))
+            self.frames[table_name] = df
+
+    def delete_records_from_postgres(self, table_name, key_col, ids):
+        self.calls.append(("delete", table_name, sorted(ids)))
+        return len(ids)
+
+    def save_document_keys(self, collection_name, keys):
+        for document_id, unique_id in keys:
+            self.document_keys[(collection_name, document_id)] = unique_id
+
+    def get_document_keys(self, collection_name, document_ids):
+        return {
+            document_id: self.document_keys[(collection_name, document_id)]
+            for document_id in document_ids
+            if (collection_name, document_id) in self.document_keys
+        }
+
+    def delete_document_keys(self, collection_name, document_ids):
+        for document_id in document_ids:
+            self.document_keys.pop((collection_name, document_id), None)
+
+    def record_dead_letters(self, stream_name, events):
+        self.dead_letters.extend(events)
+
+    def save_resume_token(self, stream_name, token):
+        self.resume_tokens.append(token)
+
+
+class FakeTransformer:
+    def normalize_date_columns(self, df, collection_name):
+        return df
+
+    def normalize_loan_restructuring(self):
+        pass
+
+
+@pytest.fixture
+def source():
+    return InMemoryChangeEventSource()
+
+
+@pytest.fixture
+def loader():
+    return FakeLoader()
+
+
+@pytest.fixture
+def replicator(source, loader):
+    return ChangeStreamReplicator(
+        source, loader, FakeTransformer(), window_seconds=0.2, window_size=100
+    )
+
+
+def test_window_keeps_the_last_change_per_document(source, loader, replicator):
+    source.insert("customers", {"_id": 1, "customer_id": 10, "age": 30})
+    source.update("customers", {"_id": 1, "customer_id": 10, "age": 31})
+    source.insert("customers", {"_id": 2, "customer_id": 20})
+    source.delete("customers", {"_id": 2, "customer_id": 20})
+
+    assert replicator.run_once() == 4
+    assert loader.calls == [
+        ("upsert", "tbl_customers", [10]),
+        ("delete", "tbl_customers", [20]),
+    ]
+    assert replicator.metrics["rows_upserted"] == 1
+    assert replicator.metrics["rows_deleted"] == 1
+    assert loader.resume_tokens == [source.resume_token]
+
+
+def test_parents_are_upserted_first_and_deleted_last(source, loader, replicator):
+    source.insert("loan_applications", {"_id": 1, "loan_id": 5, "customer_id": 10})
+    source.insert("customers", {"_id": 2, "customer_id": 10})
+    source.delete("loan_applications", {"_id": 3, "loan_id": 6})
+    source.delete("customers", {"_id": 4, "customer_id": 11})
+
+    replicator.run_once()
+    assert [call[:2] for call in loader.calls] == [
+        ("upsert", "tbl_customers"),
+        ("upsert", "tbl_loan_applications"),
+        ("delete", "tbl_loan_applications"),
+        ("delete", "tbl_customers"),
+    ]
+
+
+def test_delete_without_pre_image_uses_documents_seen_before(
+    source, loader, replicator
+):
+    source.insert("customers", {"_id": 1, "customer_id": 10})
+    replicator.run_once()
+    source.emit("delete", "customers", document_key={"_id": 1})
+    replicator.run_once()
+    assert loader.calls[-1] == ("delete", "tbl_customers", [10])
+
+
+def test_delete_after_a_restart_uses_the_persisted_keys(source, loader, replicator):
+    source.insert("customers", {"_id": 1, "customer_id": 10})
+    replicator.run_once()
+    assert loader.document_keys == {("customers", 1): 10}
+
+    restarted = ChangeStreamReplicator(
+        source, loader, FakeTransformer(), window_seconds=0.2, window_size=100
+    )
+    source.emit("delete", "customers", document_key={"_id": 1})
+    restarted.run_once()
+    assert loader.calls[-1] == ("delete", "tbl_customers", [10])
+    # Forgotten once the delete is applied
+    assert loader.document_keys == {}
+    assert restarted._unique_ids == {}
+
+
+def test_unresolvable_delete_is_dead_lettered_and_the_window_applied(
+    source, loader, replicator
+):
+    source.insert("customers", {"_id": 1, "customer_id": 10})
+    source.emit("delete", "customers", document_key={"_id": 2})
+
+    assert replicator.run_once() == 2
+    assert loader.calls == [
+        ("upsert", "tbl_customers", [10]),
+        ("delete", "tbl_customers", []),
+    ]
+    assert [event["documentKey"] for event in loader.dead_letters] == [{"_id": 2}]
+    assert replicator.metrics["events_dead_lettered"] == 1
+    assert loader.resume_tokens == [source.resume_token]
+
+
+def test_key_cache_keeps_the_documents_seen_last(source, loader):
+    replicator = ChangeStreamReplicator(
+        source, loader, FakeTransformer(), window_seconds=0.2, key_cache_size=2
+    )
+    for document_id in (1, 2, 3):
+        source.insert("customers", {"_id": document_id, "customer_id": document_id})
+    replicator.run_once()
+    assert list(replicator._unique_ids) == [("customers", 2), ("customers", 3)]
+
+
+def test_documents_are_projected_onto_the_schema(source, loader):
+    replicator = ChangeStreamReplicator(
+        source,
+        loader,
+        FakeTransformer(),
+        window_seconds=0.2,
+        flattener=NestedDocumentFlattener(NoConnections()),
+    )
+    source.insert(
+        "customers",
+        {
+            "_id": 1,
+            "customer_id": 10,
+            "age": 30,
+            "loans_applied": [101, 102],
+            "not_a_column": "x",
+        },
+    )
+    source.delete("customers", {"_id": 2, "customer_id": 20})
+    replicator.run_once()
+
+    customers = loader.frames["tbl_customers"]
+    assert "loans_applied" not in customers.columns
+    assert "not_a_column" not in customers.columns
+    assert str(customers["age"].dtype) == "Int32"
+    assert loader.frames["tbl_customer_loans_applied"]["loan_id"].tolist() == [101, 102]
+    assert loader.calls == [
+        ("upsert", "tbl_customers", [10]),
+        ("delete", "tbl_customer_loans_applied", [10]),
+        ("load", "tbl_customer_loans_applied", 2),
+        ("delete", "tbl_customer_loans_applied", [20]),
+        ("delete", "tbl_customers", [20]),
+    ]
+
+
+def test_update_of_a_document_deleted_before_the_lookup_is_skipped(
+    source, loader, replicator
+):
+    source.emit("update", "customers", document_key={"_id": 1})
+    replicator.run_once()
+    assert replicator.metrics["events_skipped"] == 1
+    assert loader.calls == []
+
+
+def test_run_stops_after_max_windows_and_closes_the_source(source, replicator):
+    closed = []
+    source.close = lambda: closed.append(True)
+    source.insert("customers", {"_id": 1, "customer_id": 10})
+
+    metrics = replicator.run(max_windows=1)
+    assert metrics["windows_total"] == 1
+    assert closed == [True]
@@ -0,0 +1,96 @@
+# test_flattener.py
+
+import pandas as pd
+import pytest
+
+from loading.postgres_loader import FlattenedChunk
+from transformation.flattener import DimensionDictionary, NestedDocumentFlattener
+
+
+class NoConnections:
+    def pg_connection(self):
+        raise AssertionError("No connection expected.")
+
+
+FIELDS = {"interest_rate": "float64", "repayment_period_in_months": "int32"}
+
+
+@pytest.fixture
+def dimension():
+    dimension = DimensionDictionary(
+        NoConnections(), "tbl_new_loan_terms", "new_loan_term_id", FIELDS
+    )
+    dimension.load_members([(1, 5.5, 12), (2, 7.0, 24)])
+    return dimension
+
+
+def test_encode_reuses_seeded_keys_without_a_connection(dimension):
+    values = pd.Series(
+        [
+            {"interest_rate": 7, "repayment_period_in_months": 24.0},
+            None,
+            '{"interest_rate": 5.5, "repayment_period_in_months": 12}',
+        ]
+    )
+    keys, rows = dimension.encode(values)
+    assert keys.tolist() == [2, pd.NA, 1]
+    assert str(keys.dtype) == "Int64"
+    assert rows == []
+
+
+def test_new_members_are_carried_until_confirmed(dimension):
+    member = {"interest_rate": 9.0, "repayment_period_in_months": 36}
+    keys, rows = dimension.encode(pd.Series([member, member]))
+    assert keys.tolist() == [3, 3]
+    assert rows == [(3, 9.0, 36)]
+
+    # A chunk whose transaction did not commit leaves the member to the next one
+    keys, rows = dimension.encode(pd.Series([member]))
+    assert keys.tolist() == [3]
+    assert rows == [(3, 9.0, 36)]
+
+    dimension.confirm(rows)
+    keys, rows = dimension.encode(pd.Series([member]))
+    assert keys.tolist() == [3]
+    assert rows == []
+    assert dimension.created == 1
+
+
+def test_encode_before_seed_fails():
+    dimension = DimensionDictionary(
+        NoConnections(), "tbl_new_loan_terms", "new_loan_term_id", FIELDS
+    )
+    with pytest.raises(RuntimeError):
+        dimension.encode(pd.Series([{"interest_rate": 1.0}]))
+
+
+def test_explode_numbers_elements_per_parent():
+    rows = NestedDocumentFlattener.explode(
+        pd.Series([10, 11, 12, 13]),
+        pd.Series([[101, 102], None, "[103]", [{"loan_id": 104}, {}]]),
+        "customer_id",
+        {"loan_id": "int64"},
+    )
+    assert rows["customer_id"].tolist() == [10, 10, 12, 13, 13]
+    assert rows["position"].tolist() == [0, 1, 0, 0, 1]
+    assert rows["loan_id"].tolist()[:4] == [101, 102, 103, 104]
+    assert pd.isna(rows["loan_id"].iloc[4])
+
+
+def test_explode_of_no_elements_is_empty():
+    rows = NestedDocumentFlattener.explode(
+        pd.Series([1, 2]), pd.Series([None, []]), "customer_id", {"loan_id": "int64"}
+    )
+    assert len(rows) == 0
+    assert list(rows.columns) == ["customer_id", "position", "loan_id"]
+
+
+def test_flattened_chunk_keeps_writers_and_runs_callbacks_on_commit():
+    committed = []
+    chunk = FlattenedChunk(
+        pd.DataFrame({"a": [1]}), [], [print], [lambda: committed.append(1)]
+    )
+    rendered = chunk.with_frame("rendered")
+    assert rendered.writers == [print]
+    rendered.committed()
+    assert committed == [1]
@@ -0,0 +1,133 @@
+# test_incremental.py
+
+from datetime import datetime
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+from extraction.mongo_extractor import MongoExtractor
+from pipeline.incremental import IncrementalLoader
+from pipeline.metrics import PipelineMetrics
+
+STAMP = datetime(2024, 10, 27, 5, 30)
+
+
+class MongoOnly:
+    def __init__(self):
+        self.mongo_url = "mongodb://localhost"
+        self.mongo_db_database_name = "test"
+        self.mongo_client = mongomock.MongoClient()
+        self.mongo_db = self.mongo_client["test"]
+        self.metrics = PipelineMetrics(trace_memory=False)
+
+
+class FakeLoader:
+    def __init__(self):
+        self.watermarks = {}
+        self.upserted = []
+
+    def get_watermark(self, collection_name):
+        return self.watermarks.get(collection_name, ((None, None), (None, None)))
+
+    def save_watermark(self, collection_name, added, modified):
+        self.watermarks[collection_name] = (added, modified)
+
+    def upsert_dataframe_to_postgres(self, df, table_name, key_col, json_columns):
+        self.upserted.extend(df[key_col].tolist())
+        return {"inserted": len(df), "updated": 0}
+
+
+class FakeTransformer:
+    def normalize_date_columns(self, df, collection_name):
+        return df
+
+
+@pytest.fixture
+def extractor():
+    return MongoExtractor(MongoOnly())
+
+
+@pytest.fixture
+def loader():
+    return FakeLoader()
+
+
+@pytest.fixture
+def incremental(extractor, loader):
+    incremental = IncrementalLoader(extractor, loader, FakeTransformer())
+    incremental._prepared = True
+    return incremental
+
+
+def add_customer(extractor, customer_id, stamp=STAMP):
+    extractor.db["customers"].insert_one(
+        {
+            "_id": ObjectId(),
+            "customer_id": customer_id,
+            "added_at": stamp,
+            "modified_at": stamp,
+        }
+    )
+
+
+def test_documents_sharing_the_watermark_timestamp_are_not_skipped(
+    extractor, loader, incremental
+):
+    add_customer(extractor, 1)
+    add_customer(extractor, 2)
+    assert incremental.load_collection("customers") == 2
+
+    # Stamped with the same timestamp after the first run
+    add_customer(extractor, 3)
+    assert incremental.load_collection("customers") == 1
+    assert loader.upserted == [1, 2, 3]
+
+    assert incremental.load_collection("customers") == 0
+
+
+def test_watermark_without_an_id_reads_its_timestamp_again(extractor, loader):
+    query = extractor.build_changed_documents_query(STAMP, STAMP)
+    assert query["$or"][0] == {"added_at": {"$gte": STAMP}}
+
+    last_id = ObjectId()
+    query = extractor.build_changed_documents_query(STAMP, None, last_id)
+    assert query["$or"] == [
+        {
+            "$or": [
+                {"added_at": {"$gt": STAMP}},
+                {"added_at": STAMP, "_id": {"$gt": last_id}},
+            ]
+        },
+        {"modified_at": {"$exists": True}},
+    ]
+
+
+def test_latest_keeps_the_largest_id_at_the_latest_timestamp(extractor):
+    add_customer(extractor, 1, datetime(2024, 1, 1))
+    add_customer(extractor, 2)
+    add_customer(extractor, 3)
+    df = next(extractor.iter_changed_chunks("customers", None, None))
+    ids = sorted(df["_id"])
+
+    assert IncrementalLoader._latest(df, "added_at", (None, None)) == (STAMP, ids[2])
+    assert IncrementalLoader._latest(df, "added_at", (STAMP, None)) == (STAMP, ids[2])
+    later = (datetime(2025, 1, 1), None)
+    assert IncrementalLoader._latest(df, "added_at", later) == later
+
+
+def test_latest_watermark_of_the_collection(extractor):
+    assert extractor.get_latest_watermark("customers") == ((None, None), (None, None))
+
+    add_customer(extractor, 1, datetime(2024, 1, 1))
+    add_customer(extractor, 2)
+    add_customer(extractor, 3)
+    extractor.db["customers"].insert_one({"customer_id": 4, "added_at": None})
+    latest = max(
+        document["_id"]
+        for document in extractor.db["customers"].find({"added_at": STAMP})
+    )
+    assert extractor.get_latest_watermark("customers") == (
+        (STAMP, latest),
+        (STAMP, latest),
+    )
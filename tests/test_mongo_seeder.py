@@ -0,0 +1,52 @@
+# test_mongo_seeder.py
+
+import json
+
+import mongomock
+import pytest
+
+from seeding.mongo_seeder import MongoSeeder
+
+
+class MongoOnly:
+    def __init__(self):
+        self.mongo_client = mongomock.MongoClient()
+        self.mongo_db = self.mongo_client["test"]
+
+
+@pytest.fixture
+def seeder():
+    return MongoSeeder(MongoOnly(), batch_size=2, workers=1)
+
+
+@pytest.fixture
+def customers_file(tmp_path):
+    path = tmp_path / "customers.ndjson"
+    path.write_text(
+        "\n".join(json.dumps({"customer_id": key}) for key in (1, 2, 3)) + "\n"
+    )
+    return str(path)
+
+
+def test_rerun_with_the_indexes_skips_the_documents_seeded_before(
+    seeder, customers_file
+):
+    assert seeder.seed_file("customers", customers_file) == {
+        "inserted": 3,
+        "duplicates": 0,
+    }
+    seeder.create_unique_indexes(["customers"])
+
+    assert seeder.seed_file("customers", customers_file) == {
+        "inserted": 0,
+        "duplicates": 3,
+    }
+    assert seeder.db["customers"].count_documents({}) == 3
+
+
+def test_unique_index_over_duplicates_names_the_collection(seeder, customers_file):
+    seeder.seed_file("customers", customers_file)
+    seeder.seed_file("customers", customers_file)
+
+    with pytest.raises(RuntimeError, match="customers.customer_id"):
+        seeder.create_unique_indexes(["customers"])
@@ -0,0 +1,162 @@
+# test_pipelined.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from pipeline.metrics import PipelineMetrics
+from pipeline.pipelined import ChunkPipeline
+
+
+class Source:
+    """A generator source that records how far it got and whether it was closed."""
+
+    def __init__(self, count: int, fail_at: int = None):
+        self.count = count
+        self.fail_at = fail_at
+        self.produced = 0
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        try:
+            for index in range(self.count):
+                if index == self.fail_at:
+                    raise ValueError(f"extract failed at {index}")
+                self.produced += 1
+                yield index
+        finally:
+            self.closed.set()
+
+
+def pipeline_threads():
+    return [
+        thread
+        for thread in threading.enumerate()
+        if thread.name.endswith(("-extract", "-transform"))
+    ]
+
+
+@pytest.fixture(autouse=True)
+def no_leaked_threads():
+    yield
+    assert pipeline_threads() == []
+
+
+def test_chunks_keep_their_order():
+    with ChunkPipeline("test", queue_size=2) as pipeline:
+        chunks = list(pipeline.stream(Source(50), lambda item: item * 10))
+    assert chunks == [item * 10 for item in range(50)]
+
+
+def test_futures_are_handed_on_in_order():
+    def transform(item):
+        # Later chunks finish first
+        return executor.submit(lambda: time.sleep(0.02 * (4 - item % 4)) or item)
+
+    with ThreadPoolExecutor(4) as executor:
+        with ChunkPipeline("test") as pipeline:
+            chunks = list(pipeline.stream(Source(12), transform, in_flight=4))
+    assert chunks == list(range(12))
+
+
+def test_stages_wait_for_a_slow_consumer():
+    source = Source(100)
+    with ChunkPipeline("test", queue_size=1) as pipeline:
+        chunks = pipeline.stream(source, lambda item: item)
+        assert next(chunks) == 0
+        time.sleep(0.5)
+        # One chunk per queue, one held by each stage and the one consumed
+        assert source.produced <= 2 * 1 + 3
+    assert source.closed.is_set()
+
+
+@pytest.mark.parametrize("in_flight", [1, 3])
+def test_extract_error_follows_the_chunks_before_it(in_flight):
+    received = []
+    with pytest.raises(ValueError, match="extract failed at 3"):
+        with ChunkPipeline("test") as pipeline:
+            for chunk in pipeline.stream(
+                Source(10, fail_at=3), lambda item: item, in_flight=in_flight
+            ):
+                received.append(chunk)
+    assert received == [0, 1, 2]
+
+
+def test_transform_error_follows_the_chunks_before_it():
+    def transform(item):
+        if item == 2:
+            raise KeyError("transform failed")
+        return item
+
+    received = []
+    source = Source(10)
+    with pytest.raises(KeyError, match="transform failed"):
+        with ChunkPipeline("test") as pipeline:
+            for chunk in pipeline.stream(source, transform):
+                received.append(chunk)
+    assert received == [0, 1]
+    assert source.closed.is_set()
+
+
+def test_failed_future_is_raised_in_order():
+    def fail():
+        raise RuntimeError("render failed")
+
+    def transform(item):
+        return executor.submit(fail if item == 1 else lambda: item)
+
+    with ThreadPoolExecutor(2) as executor:
+        received = []
+        with pytest.raises(RuntimeError, match="render failed"):
+            with ChunkPipeline("test") as pipeline:
+                for chunk in pipeline.stream(Source(5), transform, in_flight=2):
+                    received.append(chunk)
+    assert received == [0]
+
+
+def test_consumer_error_stops_the_stages_and_closes_the_source():
+    source = Source(1000)
+    with pytest.raises(ZeroDivisionError):
+        with ChunkPipeline("test") as pipeline:
+            for chunk in pipeline.stream(source, lambda item: item):
+                if chunk == 5:
+                    1 / 0
+    assert source.closed.is_set()
+    assert source.produced < 1000
+
+
+def test_iterating_after_close_raises():
+    pipeline = ChunkPipeline("test", queue_size=1)
+    chunks = pipeline.stream(Source(100), lambda item: item)
+    next(chunks)
+    pipeline.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        list(chunks)
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        ChunkPipeline("test", queue_size=0)
+    with ChunkPipeline("test") as pipeline:
+        with pytest.raises(ValueError):
+            pipeline.stream([], lambda item: item, in_flight=0)
+        list(pipeline.stream([], lambda item: item))
+        with pytest.raises(RuntimeError, match="already started"):
+            pipeline.stream([], lambda item: item)
+
+
+def test_stage_times_are_recorded_on_close():
+    metrics = PipelineMetrics(trace_memory=False)
+
+    def slow_transform(item):
+        time.sleep(0.02)
+        return item
+
+    with ChunkPipeline("customers", metrics) as pipeline:
+        list(pipeline.stream(Source(10), slow_transform))
+    utilization = metrics.utilization()["customers"]
+    assert set(utilization) == {"extract", "transform", "load"}
+    assert utilization["transform"]["busy_seconds"] >= 0.2
+    assert pipeline.bottleneck() == "transform"
@@ -0,0 +1,40 @@
+# test_postgres_loader.py
+
+import numpy as np
+import pandas as pd
+
+from loading.postgres_loader import JsonText, PostgresLoader
+
+
+def render(values) -> list:
+    df = pd.DataFrame({"id": range(len(values)), "terms": values})
+    payload = PostgresLoader.render_copy_chunk(df, ["terms"]).payload
+    return payload.decode("utf-8").splitlines()
+
+
+def test_json_columns_encode_every_value():
+    assert render(
+        [
+            {"rate": 5},
+            [1, "a"],
+            "plain",
+            7,
+            np.int64(8),
+            2.5,
+            True,
+            None,
+            float("nan"),
+            JsonText('{"kept": 1}'),
+        ]
+    ) == [
+        '0,"{""rate"": 5}"',
+        '1,"[1, ""a""]"',
+        '2,"""plain"""',
+        "3,7",
+        "4,8",
+        "5,2.5",
+        "6,true",
+        "7,\\N",
+        "8,\\N",
+        '9,"{""kept"": 1}"',
+    ]
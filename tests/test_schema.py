@@ -0,0 +1,137 @@
+# test_schema.py
+
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from extraction.schema import build_typed_dataframe
+from pipeline.metrics import PipelineMetrics
+from transformation.transformer import Transformer
+
+
+class MetricsOnly:
+    mongo_client = None
+    mongo_db = None
+
+    def __init__(self):
+        self.metrics = PipelineMetrics(trace_memory=False)
+
+
+@pytest.fixture
+def resources():
+    return MetricsOnly()
+
+
+def test_unparsable_dates_are_counted_per_column(resources, capsys):
+    documents = [
+        {"customer_id": 1, "joined_date": "2024-01-02T03:04:05Z"},
+        {"customer_id": 2, "joined_date": "not a date", "added_at": "31/02/2024"},
+        {"customer_id": 3, "joined_date": None},
+    ]
+    df = build_typed_dataframe(documents, "customers", metrics=resources.metrics)
+
+    assert df["joined_date"].tolist()[0] == pd.Timestamp("2024-01-02 03:04:05")
+    assert df["joined_date"].isna().tolist() == [False, True, True]
+    assert resources.metrics.coerced() == {
+        "customers": {"added_at": 1, "joined_date": 1}
+    }
+    assert "customers.joined_date" in capsys.readouterr().out
+
+
+def test_normalize_date_columns_counts_unparsable_dates(resources):
+    df = pd.DataFrame(
+        {
+            "repayment_date": ["2024-05-01", "2024-13-45", None],
+            "added_at": [datetime(2024, 1, 1), datetime(2024, 1, 2), None],
+        }
+    )
+    df = Transformer(resources).normalize_date_columns(df, "loan_repayments")
+
+    assert df["repayment_date"].isna().tolist() == [False, True, True]
+    assert resources.metrics.coerced() == {"loan_repayments": {"repayment_date": 1}}
+    report = resources.metrics.report()
+    assert report["coerced_values"] == {"loan_repayments": {"repayment_date": 1}}
+    assert (
+        'etl_coerced_values_total{collection="loan_repayments",'
+        'column="repayment_date"} 1' in resources.metrics.to_prometheus()
+    )
+
+
+def test_typed_dataframe_uses_the_schema_dtypes():
+    documents = [
+        {
+            "_id": "ignored",
+            "loan_id": 123456789012345678,
+            "customer_id": 5,
+            "loan_type_id": 2,
+            "loan_amount": 1000,
+            "loan_status": "approved",
+            "application_date": datetime(2024, 1, 1),
+            "not_in_schema": 1,
+        },
+        {"loan_id": None, "loan_status": "rejected", "loan_amount": None},
+    ]
+    df = build_typed_dataframe(documents, "loan_applications")
+
+    assert list(df.columns) == [
+        "loan_id",
+        "customer_id",
+        "loan_type_id",
+        "loan_amount",
+        "loan_status",
+        "application_date",
+        "approval_date",
+        "added_at",
+        "modified_at",
+    ]
+    assert str(df["loan_id"].dtype) == "Int64"
+    assert df["loan_id"].tolist() == [123456789012345678, pd.NA]
+    assert str(df["loan_type_id"].dtype) == "Int32"
+    assert str(df["loan_amount"].dtype) == "float64"
+    assert isinstance(df["loan_status"].dtype, pd.CategoricalDtype)
+    assert str(df["application_date"].dtype) == "datetime64[ns]"
+    assert df["approval_date"].isna().all()
+
+
+def test_typed_dataframe_converts_dates_to_naive_utc():
+    documents = [
+        {"repayment_date": "2024-05-01T10:00:00+05:30"},
+        {"repayment_date": pd.Timestamp("2024-05-01 04:30", tz="UTC")},
+        {"repayment_date": datetime(2024, 5, 1, 4, 30)},
+    ]
+    df = build_typed_dataframe(documents, "loan_repayments")
+    assert df["repayment_date"].tolist() == [pd.Timestamp("2024-05-01 04:30")] * 3
+
+
+def test_typed_dataframe_keeps_extra_fields_as_objects():
+    terms = {"interest_rate": 5.5}
+    df = build_typed_dataframe(
+        [{"restructuring_id": 1, "new_loan_terms": terms, "loans_applied": [1, 2]}],
+        "loan_restructuring",
+        extra_fields=["loans_applied"],
+    )
+    assert df["new_loan_terms"].tolist() == [terms]
+    assert df["loans_applied"].tolist() == [[1, 2]]
+    assert df["loans_applied"].dtype == object
+
+
+def test_values_that_do_not_fit_a_numeric_type_are_coerced_and_counted(resources):
+    documents = [
+        {"customer_id": "not a number", "loan_id": 123456789012345678},
+        {"customer_id": 2, "loan_id": "42"},
+        {"customer_id": None, "loan_id": 1.5, "loan_amount": "n/a"},
+        {"customer_id": 2**40, "loan_id": {}, "loan_amount": "250.5"},
+    ]
+    df = build_typed_dataframe(
+        documents, "loan_applications", metrics=resources.metrics
+    )
+
+    assert str(df["customer_id"].dtype) == "Int64"
+    assert df["customer_id"].tolist() == [pd.NA, 2, pd.NA, 2**40]
+    assert df["loan_id"].tolist() == [123456789012345678, 42, pd.NA, pd.NA]
+    assert str(df["loan_amount"].dtype) == "float64"
+    assert df["loan_amount"].tolist()[3] == 250.5
+    assert resources.metrics.coerced() == {
+        "loan_applications": {"customer_id": 1, "loan_amount": 1, "loan_id": 2}
+    }
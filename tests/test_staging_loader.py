@@ -0,0 +1,30 @@
+# test_staging_loader.py
+
+import pytest
+
+from loading.staging_loader import StagingTableLoader
+
+
+class NoConnections:
+    def pg_connection(self):
+        raise AssertionError("No connection expected.")
+
+
+class FakeLoader:
+    resources = NoConnections()
+
+
+@pytest.fixture
+def staging():
+    loader = StagingTableLoader(FakeLoader())
+    loader.table_exists = lambda table_name: False
+    return loader
+
+
+def test_rollback_without_previous_tables_does_nothing(staging, capsys):
+    staging.rollback(["tbl_customers", "tbl_loan_types"])
+    assert "Nothing to roll back" in capsys.readouterr().out
+
+
+def test_swap_of_no_tables_does_nothing(staging):
+    staging._swap_tables([], "__previous", "__staging")
@@ -0,0 +1,71 @@
+# test_transform_pool.py
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from loading.postgres_loader import PostgresLoader
+from pipeline.transform_pool import ProcessTransformPool
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessTransformPool(1, ["loan_restructuring"]) as pool:
+        yield pool
+
+
+def heterogeneous_chunk() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "restructuring_id": pd.array([1, 2, 3, 4], dtype="Int64"),
+            "new_loan_terms": [
+                {"interest_rate": 5, "repayment_period_in_months": 60},
+                {"interest_rate": 6.5},
+                None,
+                {"interest_rate": 7, "schedule": [1, 2], "note": "late"},
+            ],
+            "restructure_terms": [
+                {"reason": "hardship"},
+                {"reason": "job loss", "concessions": None, "case": 123456789012345678},
+                {"concessions": "waiver", "signed_at": datetime(2024, 10, 28, 5, 30)},
+                None,
+            ],
+            "added_at": pd.to_datetime(
+                ["2024-10-27 00:00", None, "2024-10-28 05:30", "2024-10-29 00:00"]
+            ),
+        }
+    )
+
+
+def test_pool_renders_the_same_payload_as_the_calling_thread(pool):
+    json_columns = ["new_loan_terms", "restructure_terms"]
+    expected = PostgresLoader.render_copy_chunk(heterogeneous_chunk(), json_columns)
+
+    chunk, seconds = pool.submit_render(heterogeneous_chunk(), json_columns).result()
+
+    assert chunk.payload == expected.payload
+    assert chunk.columns == expected.columns
+    assert len(chunk) == 4
+    assert b'"{""interest_rate"": 5, ""repayment_period_in_months"": 60}"' in (
+        chunk.payload
+    )
+
+
+def test_pool_does_not_modify_the_chunk(pool):
+    df = heterogeneous_chunk()
+    pool.submit_render(df, ["new_loan_terms"]).result()
+    assert df["new_loan_terms"][0] == {
+        "interest_rate": 5,
+        "repayment_period_in_months": 60,
+    }
+
+
+def test_nested_values_bson_cannot_encode_are_rendered_in_the_calling_thread(pool):
+    df = heterogeneous_chunk()
+    df.at[0, "new_loan_terms"] = {"interest_rate": np.int64(5)}
+    expected = PostgresLoader.render_copy_chunk(df, ["new_loan_terms"])
+
+    chunk, seconds = pool.submit_render(df, ["new_loan_terms"]).result()
+    assert chunk.payload == expected.payload